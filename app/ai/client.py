@@ -0,0 +1,153 @@
+"""
+v2: Wspólny klient OpenAI dla generatorów (zadania, layout) i pomiar wywołań API.
+Każde wywołanie chat completion przechodzi przez chat_completion(), które czeka na swoją
+kolej w harmonogramie limitów (app/ai/scheduler.py), mierzy czas i zużycie tokenów;
+track_api_usage() zbiera te dane dla bieżącego etapu (wątku).
+"""
+from __future__ import annotations
+
+import os
+import threading
+import time
+from contextlib import contextmanager, nullcontext
+from contextvars import ContextVar
+from dataclasses import dataclass
+from typing import Iterator, Optional
+
+from app.ai.scheduler import estimate_tokens, get_scheduler
+from app.deadline import Deadline
+from app.env import load_env
+from app.metrics import API_ERRORS, API_SECONDS, API_TOKENS
+from app.tracing import span
+
+# Ładowanie zmiennych z .env (v2: raz na proces, app/env.py)
+load_env()
+
+# Inicjalizacja klienta OpenAI (jeden na proces)
+_client = None
+
+# Limit jednocześnie trwających wywołań API w procesie (None = bez limitu)
+_in_flight: Optional[threading.BoundedSemaphore] = None
+
+
+@dataclass
+class ApiUsage:
+    """Zużycie API w obrębie jednego etapu: liczba wywołań, łączny czas i tokeny."""
+    calls: int = 0
+    latency_s: float = 0.0
+    prompt_tokens: int = 0
+    completion_tokens: int = 0
+
+
+_usage: ContextVar[Optional[ApiUsage]] = ContextVar("friendly_math_api_usage", default=None)
+
+
+def get_client():
+    """
+    Lazy initialization OpenAI client.
+    v2: pakiet openai (import ~0,5 s) ładowany dopiero przy pierwszym wywołaniu API, nie przy starcie aplikacji.
+    """
+    global _client
+    if _client is None:
+        from openai import OpenAI
+
+        api_key = os.getenv("OPENAI_API_KEY")
+        if not api_key:
+            raise ValueError(
+                "OPENAI_API_KEY nie znaleziony w .env. "
+                "Sprawdź czy masz plik .env z kluczem API."
+            )
+        _client = OpenAI(api_key=api_key)
+    return _client
+
+
+def set_client(client) -> None:
+    """Podmienia klienta (np. atrapa LLM w benchmarkach); None = ponowna leniwa inicjalizacja."""
+    global _client
+    _client = client
+
+
+def set_max_in_flight(limit: Optional[int]) -> None:
+    """Ogranicza liczbę równoczesnych wywołań API (np. w trybie wsadowym); None lub 0 = bez limitu."""
+    global _in_flight
+    _in_flight = threading.BoundedSemaphore(limit) if limit else None
+
+
+@contextmanager
+def track_api_usage() -> Iterator[ApiUsage]:
+    """Zbiera czas i tokeny wszystkich wywołań chat_completion() w bloku with (w tym wątku)."""
+    usage = ApiUsage()
+    token = _usage.set(usage)
+    try:
+        yield usage
+    finally:
+        _usage.reset(token)
+
+
+def chat_completion(deadline: Optional[Deadline] = None, **kwargs):
+    """
+    Wywołuje client.chat.completions.create(**kwargs) i rejestruje czas oraz tokeny.
+    Przed wywołaniem rezerwuje limit w harmonogramie (czekanie w kolejce ograniczone przez timeout).
+    deadline: timeout zapytania = min(kwargs["timeout"], pozostały budżet), bez ponowień klienta;
+    TimeoutError, gdy budżet się wyczerpał.
+    v2: span "api.chat_completion" (model, czas w kolejce harmonogramu, tokeny) przy włączonym śledzeniu.
+    """
+    with span("api.chat_completion", model=kwargs.get("model")) as s:
+        response = _chat_completion(s, deadline, **kwargs)
+    return response
+
+
+def _chat_completion(s, deadline: Optional[Deadline] = None, **kwargs):
+    client = get_client()
+    usage = _usage.get()
+    scheduler = get_scheduler()
+    estimated = estimate_tokens(kwargs.get("messages", []), kwargs.get("max_tokens", 0))
+    if deadline is not None:
+        kwargs["timeout"] = deadline.timeout(kwargs.get("timeout") or deadline.budget_s)
+        if kwargs["timeout"] <= 0:
+            raise TimeoutError("Budżet czasu karty wyczerpany przed zapytaniem API.")
+        if hasattr(client, "with_options"):
+            client = client.with_options(max_retries=0)  # ponowienia przekroczyłyby budżet
+    queued = time.perf_counter()
+    scheduler.acquire(estimated, timeout=kwargs.get("timeout"))
+    s.set(queue_ms=round((time.perf_counter() - queued) * 1000, 3))
+    if deadline is not None:
+        kwargs["timeout"] = deadline.timeout(kwargs["timeout"])  # czas w kolejce też zużywa budżet
+        if kwargs["timeout"] <= 0:
+            raise TimeoutError("Budżet czasu karty wyczerpany w kolejce zapytań API.")
+    model = str(kwargs.get("model"))
+    with _in_flight or nullcontext():
+        start = time.perf_counter()
+        try:
+            response = client.chat.completions.create(**kwargs)
+        except Exception as e:
+            API_ERRORS.inc(model=model, status=getattr(e, "status_code", None) or type(e).__name__)
+            if getattr(e, "status_code", None) == 429:
+                scheduler.backoff(_retry_after(e))
+            raise
+        finally:
+            latency = time.perf_counter() - start
+            API_SECONDS.observe(latency, model=model)
+            if usage is not None:
+                usage.calls += 1
+                usage.latency_s += latency
+    tokens = getattr(response, "usage", None)
+    scheduler.settle(estimated, getattr(tokens, "total_tokens", 0) or 0)
+    prompt_tokens = getattr(tokens, "prompt_tokens", 0) or 0
+    completion_tokens = getattr(tokens, "completion_tokens", 0) or 0
+    s.set(prompt_tokens=prompt_tokens, completion_tokens=completion_tokens)
+    API_TOKENS.inc(prompt_tokens, model=model, type="prompt")
+    API_TOKENS.inc(completion_tokens, model=model, type="completion")
+    if usage is not None:
+        usage.prompt_tokens += prompt_tokens
+        usage.completion_tokens += completion_tokens
+    return response
+
+
+def _retry_after(error: Exception, default: float = 2.0) -> float:
+    """Czas z nagłówka Retry-After odpowiedzi 429 (sekundy) albo wartość domyślna."""
+    headers = getattr(getattr(error, "response", None), "headers", None) or {}
+    try:
+        return max(0.0, float(headers.get("retry-after", default)))
+    except (TypeError, ValueError):
+        return default
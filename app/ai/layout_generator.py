@@ -1,29 +1,21 @@
+import copy
 import json
-import os
-from dotenv import load_dotenv
-from openai import OpenAI
-
-# Ładowanie zmiennych z .env
-load_dotenv()
-
-# Inicjalizacja klienta OpenAI (używamy tego samego co w text_generator)
-_client = None
-
-def _get_client():
-    """Lazy initialization OpenAI client."""
-    global _client
-    if _client is None:
-        api_key = os.getenv("OPENAI_API_KEY")
-        if not api_key:
-            raise ValueError(
-                "OPENAI_API_KEY nie znaleziony w .env. "
-                "Sprawdź czy masz plik .env z kluczem API."
-            )
-        _client = OpenAI(api_key=api_key)
-    return _client
-
-
-def generate_layout(profile: str, grade: str, number_of_tasks: int) -> dict:
+
+from app.ai.client import chat_completion
+from app.ai.singleflight import SingleFlight
+from app.metrics import FALLBACKS
+from app.tracing import traced
+
+# v2: równoczesne prośby o ten sam layout dzielą jedno wywołanie API
+_layout_flight = SingleFlight("layout")
+
+
+# v2: poniżej tylu sekund budżetu nie ma sensu pytać API — od razu domyślny layout
+_MIN_API_TIME_S = 1.0
+
+
+@traced("layout_generator.generate_layout")
+def generate_layout(profile: str, grade: str, number_of_tasks: int, deadline=None) -> dict:
     """
     Generuje layout JSON dla PDF używając OpenAI API.
     Day 7: layout sterowany AI (font size, spacing, kolory).
@@ -41,9 +33,29 @@ def generate_layout(profile: str, grade: str, number_of_tasks: int) -> dict:
     - line_spacing: int (odstęp między liniami w zadaniu)
     - text_color: str (hex, np. "#000000")
     - background_color: str (hex, np. "#FFFFFF")
+
+    v2: identyczne równoczesne wywołania (profil, klasa, liczba zadań) są łączone w jedno zapytanie.
+    v2: deadline (app/deadline.py) — timeout z pozostałego budżetu; gdy budżetu brak, od razu domyślny layout.
+    v2: domyślny layout zamiast odpowiedzi API ma przyczynę w "_error" (jak zadania zastępcze) — nie trafia do cache
+    ani do dziennika wsadu, następne wywołanie spróbuje ponownie.
     """
+    if deadline is not None and deadline.nearly_spent(_MIN_API_TIME_S):
+        return _fallback_layout(profile, grade, "Brak czasu na zapytanie API (budżet karty wyczerpany).")
+    key = (profile, str(grade).strip(), int(number_of_tasks))
+    try:
+        layout, _ = _layout_flight.do(
+            key,
+            lambda: _generate_layout(profile, grade, number_of_tasks, deadline),
+            timeout=deadline.remaining() if deadline is not None else None,
+        )
+    except TimeoutError as e:
+        return _fallback_layout(profile, grade, str(e))
+    return copy.deepcopy(layout)
+
+
+def _generate_layout(profile: str, grade: str, number_of_tasks: int, deadline=None) -> dict:
+    """Jedno zapytanie do API (z fallbackiem na domyślny layout)."""
     try:
-        client = _get_client()
         
         # Prompt dla generowania layoutu
         prompt = f"""Jesteś ekspertem od layoutu edukacyjnych kart pracy dla uczniów z trudnościami w nauce.
@@ -78,14 +90,16 @@ Zwróć TYLKO JSON w formacie:
 
 Tylko JSON, bez dodatkowych komentarzy."""
 
-        response = client.chat.completions.create(
+        response = chat_completion(
             model="gpt-3.5-turbo",
             messages=[
                 {"role": "system", "content": "Jesteś ekspertem od layoutu edukacyjnych materiałów. Zwracasz tylko poprawny JSON."},
                 {"role": "user", "content": prompt}
             ],
             temperature=0.3,  # Niższa temperatura dla bardziej przewidywalnych wyników
-            max_tokens=300
+            max_tokens=300,
+            timeout=20.0,  # v2: layout też ma limit czasu (wcześniej brak)
+            deadline=deadline,
         )
         
         # Parsowanie JSON
@@ -105,7 +119,7 @@ Tylko JSON, bez dodatkowych komentarzy."""
     except Exception as e:
         # Fallback na domyślny layout jeśli API nie działa
         print(f"⚠️ Error generating layout: {e}. Using default layout.")
-        return _get_default_layout(profile, grade)
+        return _fallback_layout(profile, grade, str(e))
 
 
 def _validate_layout(layout: dict, profile: str, grade: str) -> dict:
@@ -168,4 +182,9 @@ def _validate_layout(layout: dict, profile: str, grade: str) -> dict:
 
 def _get_default_layout(profile: str, grade: str) -> dict:
     """Zwraca domyślny layout bez użycia AI."""
-    return _validate_layout({}, profile, grade)
\ No newline at end of file
+    return _validate_layout({}, profile, grade)
+
+def _fallback_layout(profile: str, grade: str, error: str) -> dict:
+    """v2: Domyślny layout (bez API) z opisem przyczyny w "_error"."""
+    FALLBACKS.inc(stage="layout")
+    return {**_get_default_layout(profile, grade), "_error": error}
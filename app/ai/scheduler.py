@@ -0,0 +1,179 @@
+"""
+v2: Wspólny dla procesu harmonogram wywołań chat completion (limity dostawcy RPM/TPM).
+Dwa kubełki żetonów: zapytania na minutę i tokeny na minutę. Tokeny szacujemy z długości
+promptu + max_tokens, a po odpowiedzi rozliczamy różnicę z faktycznym zużyciem.
+Oczekujący są obsługiwani wg klasy priorytetu (interactive przed batch), potem FIFO.
+Po odpowiedzi 429 cały harmonogram wstrzymuje się na chwilę, zamiast wysyłać kolejne zapytania.
+"""
+from __future__ import annotations
+
+import heapq
+import itertools
+import os
+import threading
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Iterator, Optional
+
+# Mniejsza liczba = wyższy priorytet
+PRIORITY_CLASSES = {"interactive": 0, "batch": 1}
+
+# Domyślne limity (nadpisywane przez FRIENDLY_MATH_RPM / FRIENDLY_MATH_TPM w .env); 0 = bez limitu
+_DEFAULT_RPM = 500
+_DEFAULT_TPM = 200_000
+
+_priority: ContextVar[str] = ContextVar("friendly_math_api_priority", default="interactive")
+
+
+@contextmanager
+def api_priority(name: str) -> Iterator[None]:
+    """Klasa priorytetu dla wywołań API w bloku with (np. „batch” w trybie wsadowym)."""
+    if name not in PRIORITY_CLASSES:
+        raise ValueError(f"Nieznana klasa priorytetu: {name!r} (dozwolone: {', '.join(PRIORITY_CLASSES)}).")
+    token = _priority.set(name)
+    try:
+        yield
+    finally:
+        _priority.reset(token)
+
+
+def current_priority() -> str:
+    return _priority.get()
+
+
+def estimate_tokens(messages: list[dict], max_tokens: int = 0) -> int:
+    """Przybliżenie: ~3 znaki na token dla polskiego tekstu + narzut na wiadomość + limit odpowiedzi."""
+    chars = sum(len(str(m.get("content") or "")) for m in messages)
+    return chars // 3 + 4 * len(messages) + int(max_tokens or 0)
+
+
+class TokenBucket:
+    """Kubełek: pojemność = limit na minutę, uzupełnianie ciągłe (limit / 60 na sekundę)."""
+
+    def __init__(self, per_minute: float) -> None:
+        self.capacity = float(per_minute)
+        self.rate = float(per_minute) / 60.0
+        self.level = float(per_minute)
+        self._last = time.monotonic()
+
+    def refill(self, now: float) -> None:
+        self.level = min(self.capacity, self.level + (now - self._last) * self.rate)
+        self._last = now
+
+    def wait_time(self, amount: float) -> float:
+        """Ile sekund do chwili, gdy w kubełku będzie amount (po refill)."""
+        missing = amount - self.level
+        return 0.0 if missing <= 0 else missing / self.rate
+
+
+class RateLimitScheduler:
+    """
+    acquire(tokens) blokuje, aż oba kubełki pozwolą na zapytanie i nadejdzie kolej wywołującego.
+    rpm/tpm = 0 wyłącza dany limit.
+    """
+
+    def __init__(self, rpm: float = _DEFAULT_RPM, tpm: float = _DEFAULT_TPM) -> None:
+        self._requests = TokenBucket(rpm) if rpm else None
+        self._tokens = TokenBucket(tpm) if tpm else None
+        self._cond = threading.Condition()
+        self._waiting: list[tuple[int, int]] = []  # kopiec (priorytet, numer zgłoszenia)
+        self._seq = itertools.count()
+        self._paused_until = 0.0
+        self.granted = {name: 0 for name in PRIORITY_CLASSES}
+        self.wait_s = {name: 0.0 for name in PRIORITY_CLASSES}
+        self.rate_limited = 0
+
+    def acquire(self, tokens: int, priority: Optional[str] = None, timeout: Optional[float] = None) -> None:
+        """Rezerwuje jedno zapytanie i `tokens` tokenów; TimeoutError, gdy kolejka nie zdąży w `timeout` s."""
+        priority = priority or current_priority()
+        entry = (PRIORITY_CLASSES.get(priority, len(PRIORITY_CLASSES)), next(self._seq))
+        started = time.monotonic()
+        with self._cond:
+            heapq.heappush(self._waiting, entry)
+            try:
+                while True:
+                    now = time.monotonic()
+                    delay = self._delay_for(tokens, now) if self._waiting[0] == entry else None
+                    if delay == 0.0:
+                        self._consume(tokens)
+                        heapq.heappop(self._waiting)
+                        self.granted[priority] = self.granted.get(priority, 0) + 1
+                        self.wait_s[priority] = self.wait_s.get(priority, 0.0) + (now - started)
+                        return
+                    if timeout is not None and now - started >= timeout:
+                        raise TimeoutError("Przekroczono czas oczekiwania w kolejce zapytań API.")
+                    wait = delay if delay is not None else 0.5
+                    if timeout is not None:
+                        wait = min(wait, timeout - (now - started))
+                    self._cond.wait(max(wait, 0.001))
+            finally:
+                if entry in self._waiting:
+                    self._waiting.remove(entry)
+                    heapq.heapify(self._waiting)
+                self._cond.notify_all()
+
+    def settle(self, estimated: int, actual: int) -> None:
+        """Rozlicza różnicę między szacunkiem a faktycznym zużyciem tokenów (zwrot lub dopłata)."""
+        if self._tokens is None or not actual:
+            return
+        with self._cond:
+            self._tokens.refill(time.monotonic())
+            self._tokens.level = min(self._tokens.capacity, self._tokens.level + (estimated - actual))
+            self._cond.notify_all()
+
+    def backoff(self, seconds: float) -> None:
+        """Wstrzymuje wszystkie wywołania (po odpowiedzi 429 od dostawcy)."""
+        with self._cond:
+            self.rate_limited += 1
+            self._paused_until = max(self._paused_until, time.monotonic() + seconds)
+            self._cond.notify_all()
+
+    def stats(self) -> dict:
+        with self._cond:
+            return {
+                "granted": dict(self.granted),
+                "wait_s": {k: round(v, 3) for k, v in self.wait_s.items()},
+                "waiting": len(self._waiting),
+                "rate_limited": self.rate_limited,
+            }
+
+    def _delay_for(self, tokens: int, now: float) -> float:
+        delay = max(0.0, self._paused_until - now)
+        if self._requests is not None:
+            self._requests.refill(now)
+            delay = max(delay, self._requests.wait_time(1))
+        if self._tokens is not None:
+            self._tokens.refill(now)
+            # Zapytanie większe niż cały kubełek czeka na pełny kubełek (inaczej nigdy by nie przeszło)
+            delay = max(delay, self._tokens.wait_time(min(tokens, self._tokens.capacity)))
+        return delay
+
+    def _consume(self, tokens: int) -> None:
+        if self._requests is not None:
+            self._requests.level -= 1
+        if self._tokens is not None:
+            self._tokens.level -= min(tokens, self._tokens.capacity)
+
+
+_scheduler: Optional[RateLimitScheduler] = None
+_scheduler_lock = threading.Lock()
+
+
+def get_scheduler() -> RateLimitScheduler:
+    """Harmonogram procesu (limity z FRIENDLY_MATH_RPM / FRIENDLY_MATH_TPM)."""
+    global _scheduler
+    with _scheduler_lock:
+        if _scheduler is None:
+            _scheduler = RateLimitScheduler(
+                rpm=float(os.getenv("FRIENDLY_MATH_RPM", _DEFAULT_RPM)),
+                tpm=float(os.getenv("FRIENDLY_MATH_TPM", _DEFAULT_TPM)),
+            )
+        return _scheduler
+
+
+def set_scheduler(scheduler: Optional[RateLimitScheduler]) -> None:
+    """Podmienia harmonogram (np. inne limity w benchmarku); None = ponowna inicjalizacja z env."""
+    global _scheduler
+    with _scheduler_lock:
+        _scheduler = scheduler
@@ -0,0 +1,78 @@
+"""
+v2: Łączenie identycznych, równoczesnych wywołań (single-flight).
+Gdy kilka wątków prosi o to samo (ten sam znormalizowany klucz), tylko pierwszy wywołuje API,
+a pozostali czekają i dostają jego wynik. Liczniki pokazują, ile wywołań zaoszczędzono.
+"""
+from __future__ import annotations
+
+import threading
+from typing import Any, Callable, Hashable
+
+# Wszystkie grupy w procesie (do metryk: ile wywołań API zaoszczędzono)
+_groups: list["SingleFlight"] = []
+
+
+class _Call:
+    __slots__ = ("done", "value", "error", "waiters")
+
+    def __init__(self) -> None:
+        self.done = threading.Event()
+        self.value: Any = None
+        self.error: BaseException | None = None
+        self.waiters = 0
+
+
+class SingleFlight:
+    """Grupa wywołań: do(klucz, fn) wykonuje fn raz na klucz w danej chwili."""
+
+    def __init__(self, name: str) -> None:
+        self.name = name
+        self._lock = threading.Lock()
+        self._calls: dict[Hashable, _Call] = {}
+        self.executed = 0  # wywołania fn (faktyczne zapytania do API)
+        self.shared = 0    # wywołania obsłużone wynikiem cudzego zapytania (zaoszczędzone)
+        _groups.append(self)
+
+    def do(self, key: Hashable, fn: Callable[[], Any], timeout: float | None = None) -> tuple[Any, bool]:
+        """
+        Zwraca (wynik, czy_współdzielony). Wyjątek z fn trafia do wszystkich czekających.
+        Wynik jest wspólnym obiektem — wywołujący nie powinni go modyfikować (kopiować przed zmianą).
+        timeout: ile najwyżej czekać na cudze zapytanie (TimeoutError po upływie).
+        """
+        with self._lock:
+            call = self._calls.get(key)
+            if call is not None:
+                call.waiters += 1
+                self.shared += 1
+                leader = False
+            else:
+                call = self._calls[key] = _Call()
+                self.executed += 1
+                leader = True
+
+        if not leader:
+            if not call.done.wait(timeout):
+                raise TimeoutError("Nie doczekano się wyniku współdzielonego zapytania.")
+            if call.error is not None:
+                raise call.error
+            return call.value, True
+
+        try:
+            call.value = fn()
+        except BaseException as e:
+            call.error = e
+            raise
+        finally:
+            with self._lock:
+                del self._calls[key]
+            call.done.set()
+        return call.value, False
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {"executed": self.executed, "shared": self.shared, "in_flight": len(self._calls)}
+
+
+def coalescing_stats() -> dict:
+    """Liczniki wszystkich grup: {nazwa: {"executed", "shared", "in_flight"}}."""
+    return {g.name: g.stats() for g in _groups}
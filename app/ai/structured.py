@@ -0,0 +1,149 @@
+"""
+v2: Zadania jako dane (function calling z JSON Schema) zamiast wolnego tekstu.
+Model wywołuje funkcję zapisz_zadania: dla każdego zadania treść do wyświetlenia, działanie, liczby,
+ułamki, oczekiwany wynik i wskazówkę ilustracji. Etapy po generowaniu (ilustracje, klucz odpowiedzi)
+korzystają z tych pól zamiast wyciągać liczby z treści wyrażeniami regularnymi.
+Włączane przez FRIENDLY_MATH_STRUCTURED=1; bez tego generate_tasks dzieli odpowiedź na linie jak dotąd.
+"""
+from __future__ import annotations
+
+import json
+import os
+import re
+from typing import Optional
+
+TOOL_NAME = "zapisz_zadania"
+
+# Działanie zadania: cztery podstawowe, zaznaczanie/dodawanie ułamków, równanie z niewiadomą x
+OPERATORS = ("+", "−", "×", ":", "ułamek", "równanie", "inne")
+# Wskazówka ilustracji (app/generators/images.py): grupy kół, przekreślone koła, siatka, podział na grupy,
+# koła podzielone na części, waga (lewa = prawa), bez ilustracji
+ILLUSTRATIONS = ("grupy", "zabrane", "siatka", "podział", "ułamek", "waga", "brak")
+_DEFAULT_ILLUSTRATION = {"+": "grupy", "−": "zabrane", "×": "siatka", ":": "podział", "ułamek": "ułamek", "równanie": "waga"}
+_OPERATOR_ALIASES = {"-": "−", "*": "×", "·": "×", "x": "×", "÷": ":", "/": ":"}
+_MAX_NUMBERS = 4
+
+TASK_SCHEMA = {
+    "type": "object",
+    "properties": {
+        "text": {"type": "string", "description": "Treść zadania na karcie, bez numeru, np. \"Policz: 3 + 4 = ____\"."},
+        "operator": {"type": "string", "enum": list(OPERATORS)},
+        "operands": {"type": "array", "items": {"type": "integer"}, "description": "Liczby z zadania po kolei."},
+        "fractions": {
+            "type": "array",
+            "items": {"type": "array", "items": {"type": "integer"}, "minItems": 2, "maxItems": 2},
+            "description": "Ułamki [licznik, mianownik]; pusta lista, gdy brak.",
+        },
+        "answer": {"type": "string", "description": "Oczekiwany wynik, np. \"7\", \"3/4\", \"x = 5\"."},
+        "illustration": {"type": "string", "enum": list(ILLUSTRATIONS)},
+    },
+    "required": ["text", "operator", "operands", "fractions", "answer", "illustration"],
+    "additionalProperties": False,
+}
+
+TASKS_SCHEMA = {
+    "type": "object",
+    "properties": {"tasks": {"type": "array", "items": TASK_SCHEMA}},
+    "required": ["tasks"],
+    "additionalProperties": False,
+}
+
+_NUMBERING = re.compile(r"^(?:\d+[.)]|[-•*])\s+")
+
+
+def structured_enabled() -> bool:
+    """Tryb zadań jako danych włączany przez FRIENDLY_MATH_STRUCTURED=1."""
+    return os.getenv("FRIENDLY_MATH_STRUCTURED", "").strip().lower() in ("1", "true", "yes", "tak")
+
+
+def tool_request(n: int) -> dict:
+    """Parametry chat completion wymuszające wywołanie funkcji z listą n zadań (dopisywane do zapytania)."""
+    return {
+        "tools": [{
+            "type": "function",
+            "function": {
+                "name": TOOL_NAME,
+                "description": f"Zapisuje {n} zadań karty pracy (każde z działaniem, liczbami i wynikiem).",
+                "parameters": TASKS_SCHEMA,
+            },
+        }],
+        "tool_choice": {"type": "function", "function": {"name": TOOL_NAME}},
+        # JSON na zadanie to ~60–70 tokenów; limit rośnie z liczbą zadań zamiast stałych 500
+        "max_tokens": min(4000, 100 + 80 * n),
+    }
+
+
+def parse_response(response) -> list[dict]:
+    """
+    Zadania z wywołania funkcji (poprawione i sprawdzone); ValueError, gdy odpowiedź nie zawiera
+    wywołania lub JSON jest nieczytelny. Pozycje bez treści są pomijane.
+    """
+    message = response.choices[0].message
+    calls = getattr(message, "tool_calls", None) or []
+    if not calls:
+        raise ValueError("Odpowiedź bez wywołania funkcji zapisz_zadania.")
+    try:
+        payload = json.loads(calls[0].function.arguments)
+    except (TypeError, ValueError) as e:
+        raise ValueError(f"Nieczytelny JSON zadań: {e}") from None
+    items = payload.get("tasks") if isinstance(payload, dict) else None
+    if not isinstance(items, list):
+        raise ValueError("JSON zadań bez listy \"tasks\".")
+    return [detail for detail in (normalize(item) for item in items) if detail is not None]
+
+
+def normalize(item) -> Optional[dict]:
+    """Jedno zadanie w postaci TASK_SCHEMA (typy, dozwolone wartości, bez numeru w treści) albo None."""
+    if not isinstance(item, dict):
+        return None
+    text = _NUMBERING.sub("", str(item.get("text") or "").strip())
+    if not text or "\n" in text:
+        return None
+    operator = str(item.get("operator") or "").strip()
+    operator = _OPERATOR_ALIASES.get(operator, operator)
+    if operator not in OPERATORS:
+        operator = "inne"
+    operands = [v for v in _ints(item.get("operands")) if v >= 0][:_MAX_NUMBERS]
+    fractions = []
+    for pair in item.get("fractions") or []:
+        values = _ints(pair)
+        if len(values) == 2 and values[1] > 0 and values[0] >= 0:
+            fractions.append(values)
+    illustration = str(item.get("illustration") or "").strip()
+    if illustration not in ILLUSTRATIONS:
+        illustration = _DEFAULT_ILLUSTRATION.get(operator, "brak")
+    return {
+        "text": text,
+        "operator": operator,
+        "operands": operands,
+        "fractions": fractions[:_MAX_NUMBERS],
+        "answer": str(item.get("answer") if item.get("answer") is not None else "").strip(),
+        "illustration": illustration,
+    }
+
+
+def placeholder(i: int) -> dict:
+    """Zadanie zastępcze (uzupełnienie krótkiej odpowiedzi) — te same liczby co w trybie tekstowym."""
+    a, b = 2 + i, 3 + i
+    return {
+        "text": f"Policz: {a} + {b} = ____",
+        "operator": "+",
+        "operands": [a, b],
+        "fractions": [],
+        "answer": str(a + b),
+        "illustration": "grupy",
+    }
+
+
+def _ints(values) -> list[int]:
+    if not isinstance(values, (list, tuple)):
+        return []
+    out = []
+    for v in values:
+        if isinstance(v, bool):
+            continue
+        try:
+            out.append(int(v))
+        except (TypeError, ValueError):
+            continue
+    return out
@@ -0,0 +1,235 @@
+"""
+v2: Zadania z szablonów — jedno zapytanie API na rodzinę (profil, klasa, temat) zamiast jednego na kartę.
+Model zwraca szablony z parametrami (np. "Policz: {a} + {b} = ____", a, b z zakresów), szablony trafiają
+do cache, a liczby losujemy lokalnie z ziarnem (seed) w zakresie liczb profilu — każdy seed to inny
+wariant karty (np. A/B dla kolejnych uczniów) bez kolejnych wywołań API.
+"""
+from __future__ import annotations
+
+import json
+import os
+import random
+import re
+import string
+from typing import Optional
+
+from app.ai.client import chat_completion
+from app.ai.singleflight import SingleFlight
+from app.cache import LRUCache
+from app.generators.dedup import DuplicateIndex
+from app.generators.bank import profile_limit
+from app.metrics import FALLBACKS, register_cache
+from app.tracing import traced
+
+# Szablony rodzin (profil, klasa, temat) — jedno zapytanie API na rodzinę na proces
+_templates_cache = LRUCache(max_entries=256)
+_templates_flight = SingleFlight("templates")
+register_cache("templates", _templates_cache)
+
+_MIN_API_TIME_S = 1.0
+_MAX_TEMPLATES = 8
+_MAX_ATTEMPTS = 50  # losowań na jedno zadanie (odrzucane: wynik ujemny, dzielenie z resztą, duplikat)
+
+# Szablony wbudowane — gdy API niedostępne (nie trafiają do cache, następne wywołanie spróbuje ponownie)
+_BUILTIN_TEMPLATES = {
+    "dodawanie": ["Policz: {a} + {b} = ____"],
+    "odejmowanie": ["Policz: {a} − {b} = ____"],
+    "mnożenie": ["Policz: {a} × {b} = ____"],
+    "dzielenie": ["Policz: {a} : {b} = ____"],
+    "ułamki": ["Zaznacz {a}/{b} koła."],
+    "równania": ["Rozwiąż: x + {a} = {b}, x = ____"],
+}
+_GIFTED_CHAIN = "Policz: {a} + {b}, wynik pomnóż przez {c} = ____"
+
+
+def templates_enabled() -> bool:
+    """Tryb szablonów włączany przez FRIENDLY_MATH_TEMPLATES=1."""
+    return os.getenv("FRIENDLY_MATH_TEMPLATES", "").strip().lower() in ("1", "true", "yes", "tak")
+
+
+@traced("templates.expand_tasks")
+def expand_tasks(profile, grade, topic, n=3, seed=0, deadline=None) -> dict:
+    """
+    n zadań z szablonów rodziny (profil, klasa, temat) — wynik w formacie generate_tasks.
+    Przy błędzie API zadania powstają z szablonów wbudowanych, a przyczyna trafia do "_error".
+    """
+    templates, error = get_templates(profile, grade, topic, deadline=deadline)
+    result = {
+        "tasks": instantiate(templates, n, seed=f"{seed}:{profile}:{grade}:{topic}", limit=profile_limit(grade, profile)),
+        "profile": profile,
+        "grade": grade,
+        "topic": topic,
+    }
+    if error:
+        FALLBACKS.inc(stage="templates")
+        result["_error"] = error
+    return result
+
+
+def get_templates(profile, grade, topic, deadline=None) -> tuple[list[dict], Optional[str]]:
+    """(szablony, błąd): z cache, z jednego zapytania API albo — przy błędzie — wbudowane."""
+    key = (profile, str(grade).strip(), (topic or "").strip().lower())
+    cached = _templates_cache.get(key)
+    if cached is not None:
+        return cached, None
+    if deadline is not None and deadline.nearly_spent(_MIN_API_TIME_S):
+        return _builtin_templates(profile, grade, topic), "Brak czasu na zapytanie API (budżet karty wyczerpany)."
+    try:
+        templates, _ = _templates_flight.do(
+            key,
+            lambda: _fetch_templates(profile, grade, topic, deadline),
+            timeout=deadline.remaining() if deadline is not None else None,
+        )
+    except Exception as e:
+        return _builtin_templates(profile, grade, topic), str(e)
+    _templates_cache.put(key, templates)
+    return templates, None
+
+
+def instantiate(templates: list[dict], n: int, seed: object = 0, limit: Optional[int] = None) -> list[str]:
+    """n różnych zadań z szablonów; ten sam seed daje te same zadania. limit: największa dozwolona suma i iloczyn."""
+    rng = random.Random(str(seed))
+    order = list(range(len(templates)))
+    rng.shuffle(order)
+    tasks: list[str] = []
+    seen = DuplicateIndex()
+    for i in range(n * _MAX_ATTEMPTS):
+        if len(tasks) >= n:
+            break
+        template = templates[order[i % len(order)]]
+        values = {name: rng.randint(lo, hi) for name, (lo, hi) in template["params"].items()}
+        try:
+            task = template["text"].format(**values)
+        except (ValueError, KeyError, IndexError):  # szablon z nieobsługiwanym polem — pomijamy
+            continue
+        if _acceptable(task, limit) and seen.add(task):
+            tasks.append(task)
+    # Bardzo wąskie zakresy mogą dać mniej różnych zadań niż n — uzupełniamy jak generate_tasks
+    while len(tasks) < n:
+        tasks.append(f"Policz: {2 + len(tasks)} + {3 + len(tasks)} = ____")
+    return tasks
+
+
+def _fetch_templates(profile, grade, topic, deadline=None) -> list[dict]:
+    """Jedno zapytanie API o szablony rodziny; wyjątek, gdy odpowiedź nie zawiera poprawnych szablonów."""
+    limit = profile_limit(grade, profile)
+    prompt = f"""Jesteś nauczycielem matematyki. Przygotuj do {_MAX_TEMPLATES} szablonów zadań dla klasy {grade} na temat: {topic}, profil ucznia: {profile}.
+
+Szablon to treść zadania z parametrami w nawiasach klamrowych, np. "Policz: {{a}} + {{b}} = ____",
+oraz zakres liczb całkowitych dla każdego parametru. Wszystkie liczby w zadaniu (także wynik) nie większe niż {limit}.
+Format treści jak na kartach: "Policz: ... = ____", "Zaznacz {{a}}/{{b}} koła." itp., jedno zadanie w jednej linii.
+
+Zwróć TYLKO JSON w formacie:
+[{{"text": "Policz: {{a}} + {{b}} = ____", "params": {{"a": [1, 10], "b": [1, 10]}}}}]"""
+    response = chat_completion(
+        model="gpt-3.5-turbo",
+        messages=[
+            {"role": "system", "content": "Jesteś pomocnym nauczycielem matematyki. Zwracasz tylko poprawny JSON."},
+            {"role": "user", "content": prompt},
+        ],
+        temperature=0.5,
+        max_tokens=600,
+        timeout=30.0,
+        deadline=deadline,
+    )
+    text = response.choices[0].message.content.strip()
+    # Usuń markdown code blocks jeśli są
+    if text.startswith("```"):
+        text = text.split("```")[1]
+        if text.startswith("json"):
+            text = text[4:]
+    templates = _validate_templates(json.loads(text.strip()), limit)
+    if not templates:
+        raise ValueError("API nie zwróciło poprawnych szablonów zadań.")
+    return templates
+
+
+def _validate_templates(raw, limit: int) -> list[dict]:
+    """Zostawia szablony, których parametry pokrywają się z polami treści; zakresy przycięte do [1, limit]."""
+    out = []
+    for item in raw if isinstance(raw, list) else []:
+        if not isinstance(item, dict) or not isinstance(item.get("text"), str) or not isinstance(item.get("params"), dict):
+            continue
+        text = item["text"].strip()
+        try:
+            parsed = [(name, spec, conversion) for _, name, spec, conversion in string.Formatter().parse(text)]
+        except ValueError:
+            continue
+        # Tylko proste pola {a} — format ("{a:s}") lub konwersja ("{a!r}") psułyby format() przy losowaniu
+        if any(name is not None and (spec or conversion) for name, spec, conversion in parsed):
+            continue
+        fields = {name for name, _, _ in parsed if name is not None}
+        params = {}
+        for name, bounds in item["params"].items():
+            try:
+                lo, hi = sorted(int(v) for v in bounds)
+            except (TypeError, ValueError):
+                break
+            params[str(name)] = (max(1, min(lo, limit)), max(1, min(hi, limit)))
+        else:
+            if fields and fields == set(params) and all(f.isidentifier() for f in fields) and len(text) <= 200:
+                out.append({"text": text, "params": params})
+        if len(out) >= _MAX_TEMPLATES:
+            break
+    return out
+
+
+def _builtin_templates(profile, grade, topic) -> list[dict]:
+    limit = profile_limit(grade, profile)
+    key = next((k for k in _BUILTIN_TEMPLATES if k in (topic or "").lower() or (topic or "").lower() in k), "dodawanie")
+    texts = list(_BUILTIN_TEMPLATES[key])
+    if profile == "zdolny" and key in ("dodawanie", "mnożenie"):
+        texts.append(_GIFTED_CHAIN)
+    small = min(10, limit)  # czynniki, dzielniki i mianowniki — jak tabliczka mnożenia
+    half = max(1, limit // 2)  # suma dwóch liczb też nie przekracza limitu
+    params_for = {
+        "dodawanie": {"a": (1, half), "b": (1, half)},
+        "równania": {"a": (1, half), "b": (2, limit)},
+        "mnożenie": {"a": (1, small), "b": (1, small)},
+        "dzielenie": {"a": (1, limit), "b": (1, small)},
+        "ułamki": {"a": (1, small - 1 if small > 2 else 1), "b": (2, max(2, small))},
+    }
+    out = []
+    for text in texts:
+        fields = [name for _, name, _, _ in string.Formatter().parse(text) if name]
+        params = {name: (1, limit) for name in fields}
+        if text == _GIFTED_CHAIN:
+            params = {"a": (1, small), "b": (1, small), "c": (2, 5)}
+        else:
+            params.update(params_for.get(key, {}))
+        out.append({"text": text, "params": params})
+    return out
+
+
+_FRACTION = re.compile(r"(\d+)\s*/\s*(\d+)")
+_BINARY = re.compile(r"(\d+)\s*([+−\-:÷×*·])\s*(\d+)")
+_EQUATION = re.compile(r"x\s*\+\s*(\d+)\s*=\s*(\d+)")
+_CHAIN = re.compile(r"(\d+)\s*\+\s*(\d+)\s*,\s*wynik pomnóż przez\s*(\d+)")  # jak _GIFTED_CHAIN: (a + b) · c
+
+
+def _acceptable(task: str, limit: Optional[int] = None) -> bool:
+    """
+    Odrzuca wartości bez sensu dla ucznia: ułamek niewłaściwy, suma lub iloczyn ponad limit, wynik ujemny,
+    dzielenie z resztą, x ≤ 0, wynik łańcucha „a + b, wynik pomnóż przez c” ponad limit.
+    """
+    for num, den in _FRACTION.findall(task):
+        if not 0 < int(num) < int(den):
+            return False
+    m = _BINARY.search(_FRACTION.sub("", task))
+    if m:
+        a, op, b = int(m.group(1)), m.group(2), int(m.group(3))
+        if op == "+" and limit is not None and a + b > limit:
+            return False
+        if op in "×*·" and limit is not None and a * b > limit:
+            return False
+        if op in "−-" and a < b:
+            return False
+        if op in ":÷" and (b == 0 or a % b):
+            return False
+    m = _EQUATION.search(task)
+    if m and int(m.group(2)) <= int(m.group(1)):
+        return False
+    m = _CHAIN.search(task)
+    if m and limit is not None and (int(m.group(1)) + int(m.group(2))) * int(m.group(3)) > limit:
+        return False
+    return True
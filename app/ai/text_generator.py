@@ -1,25 +1,19 @@
-import os
-from dotenv import load_dotenv
-from openai import OpenAI
-
-# Ładowanie zmiennych z .env
-load_dotenv()
-
-# Inicjalizacja klienta OpenAI
-_client = None
-
-def _get_client():
-    """Lazy initialization OpenAI client."""
-    global _client
-    if _client is None:
-        api_key = os.getenv("OPENAI_API_KEY")
-        if not api_key:
-            raise ValueError(
-                "OPENAI_API_KEY nie znaleziony w .env. "
-                "Sprawdź czy masz plik .env z kluczem API."
-            )
-        _client = OpenAI(api_key=api_key)
-    return _client
+import copy
+import re
+
+from app.ai import structured as structured_output
+from app.ai.client import chat_completion
+from app.ai.singleflight import SingleFlight
+from app.generators.dedup import distinct
+from app.metrics import FALLBACKS
+from app.tracing import traced
+
+# v2: równoczesne prośby o te same zadania (np. podwójne kliknięcie) dzielą jedno wywołanie API
+_tasks_flight = SingleFlight("tasks")
+
+# v2: poniżej tylu sekund budżetu nie ma sensu pytać API — od razu zadania zastępcze
+_MIN_API_TIME_S = 1.0
+
 
 def _build_prompt(grade: str, topic: str, profile: str, n: int) -> str:
     """
@@ -92,30 +86,82 @@ Wygeneruj tylko listę zadań, po jednym w linii, bez numeracji, bez dodatkowych
 
     return prompt
 
-def generate_tasks(profile, grade, topic, n=3):
+
+def _tasks_request(grade: str, topic: str, profile: str, n: int, structured: bool = False) -> dict:
+    """
+    Parametry zapytania chat completion o n zadań (model, wiadomości, temperatura, limit tokenów).
+    v2: wspólne dla generate_tasks i oceny zgodności z profilami (app/bench/compliance.py).
+    v2: structured — zadania jako wywołanie funkcji z JSON Schema (app/ai/structured.py) zamiast linii tekstu.
+    """
+    prompt = _build_prompt(grade=str(grade), topic=topic, profile=profile, n=n)
+    if structured:
+        prompt += (
+            f"\n\nZwróć zadania wywołaniem funkcji {structured_output.TOOL_NAME}: w polu text treść jak w przykładach, "
+            "a także działanie, liczby, ułamki, wynik i rodzaj ilustracji."
+        )
+    # Wywołanie API (używamy gpt-3.5-turbo dla oszczędności kosztów)
+    request = {
+        "model": "gpt-3.5-turbo",
+        "messages": [
+            {"role": "system", "content": "Jesteś pomocnym nauczycielem matematyki."},
+            {"role": "user", "content": prompt},
+        ],
+        "temperature": 0.7,
+        "max_tokens": 500,
+    }
+    if structured:
+        request.update(structured_output.tool_request(n))
+    return request
+
+
+def _parse_tasks(content: str) -> list[str]:
+    """Odpowiedź modelu → zadania (każda niepusta linia to jedno zadanie)."""
+    return [line.strip() for line in content.strip().split("\n") if line.strip()]
+
+@traced("text_generator.generate_tasks")
+def generate_tasks(profile, grade, topic, n=3, deadline=None, seed=None):
     """
     Generuje zadania matematyczne używając OpenAI API.
     Day 6: prosty prompt, jeden typ zadania, edukacyjne.
+    v2: identyczne równoczesne wywołania (profil, klasa, temat, n, seed) są łączone w jedno zapytanie;
+    seed (wariant karty, WorksheetSpec.seed) rozdziela karty różniące się tylko wariantem — każda ma własne zadania.
+    v2: deadline (app/deadline.py) — timeout z pozostałego budżetu; gdy budżetu brak, od razu zadania zastępcze.
+    v2: FRIENDLY_MATH_STRUCTURED=1 — zadania jako dane (function calling); wynik ma też "details" (po jednym
+    słowniku na zadanie: text, operator, operands, fractions, answer, illustration), używane przez ilustracje i odpowiedzi.
     """
+    if deadline is not None and deadline.nearly_spent(_MIN_API_TIME_S):
+        return _fallback_result(profile, grade, topic, "Brak czasu na zapytanie API (budżet karty wyczerpany).")
+    structured = structured_output.structured_enabled()
+    key = (profile, str(grade).strip(), (topic or "").strip().lower(), int(n), structured, seed)
     try:
-        client = _get_client()
-        prompt = _build_prompt(grade=str(grade), topic=topic, profile=profile, n=n)
-        
-        # Wywołanie API (używamy gpt-3.5-turbo dla oszczędności kosztów). v1.0: timeout 30 s
-        response = client.chat.completions.create(
-            model="gpt-3.5-turbo",
-            messages=[
-                {"role": "system", "content": "Jesteś pomocnym nauczycielem matematyki."},
-                {"role": "user", "content": prompt}
-            ],
-            temperature=0.7,
-            max_tokens=500,
+        result, _ = _tasks_flight.do(
+            key,
+            lambda: _generate_tasks(profile, grade, topic, n, deadline, structured),
+            timeout=deadline.remaining() if deadline is not None else None,
+        )
+    except TimeoutError as e:
+        return _fallback_result(profile, grade, topic, str(e))
+    result = copy.deepcopy(result)  # każdy wywołujący dostaje własną kopię
+    result.update(profile=profile, grade=grade, topic=topic)
+    return result
+
+
+def _generate_tasks(profile, grade, topic, n, deadline=None, structured=False):
+    """Jedno zapytanie do API (z fallbackiem na zadania zastępcze)."""
+    try:
+        # v1.0: timeout 30 s (v2: lub mniej — deadline)
+        response = chat_completion(
+            **_tasks_request(str(grade), topic, profile, n, structured=structured),
             timeout=30.0,
+            deadline=deadline,
         )
+        if structured:
+            return {**_structured_tasks(response, n), "profile": profile, "grade": grade, "topic": topic}
         
         # Parsowanie odpowiedzi - każda linia to jedno zadanie
-        tasks_text = response.choices[0].message.content.strip()
-        tasks = [line.strip() for line in tasks_text.split("\n") if line.strip()]
+        tasks = _parse_tasks(response.choices[0].message.content)
+        # v2: bez (prawie) powtórzeń w odpowiedzi — „3 + 4” i „4 + 3” to jedno zadanie
+        tasks = distinct(tasks)
         
         # Fallback jeśli AI zwróciło mniej zadań niż prosiłeś
         if len(tasks) < n:
@@ -132,17 +178,86 @@ def generate_tasks(profile, grade, topic, n=3):
     
     except Exception as e:
         # Fallback na hardcoded zadania jeśli API nie działa
-        return {
-            "tasks": [
-                "Policz: 3 + 4 = ____",
-                "Policz: 7 − 2 = ____",
-                "Policz: 5 + 5 = ____"
-            ],
-            "profile": profile,
-            "grade": grade,
-            "topic": topic,
-            "_error": str(e)  # Opcjonalnie: możesz to wyświetlić w UI dla debugowania
-        }
+        return _fallback_result(profile, grade, topic, str(e))
+
+
+def _structured_tasks(response, n) -> dict:
+    """v2: Zadania z wywołania funkcji — bez powtórzeń, uzupełnione zadaniami zastępczymi do n."""
+    by_text: dict[str, dict] = {}
+    for detail in structured_output.parse_response(response):
+        by_text.setdefault(detail["text"], detail)
+    details = [by_text[text] for text in distinct(by_text)]
+    while len(details) < n:
+        details.append(structured_output.placeholder(len(details)))
+    details = details[:n]
+    return {"tasks": [d["text"] for d in details], "details": details}
+
+
+def _fallback_result(profile, grade, topic, error: str) -> dict:
+    """Zadania zastępcze (bez API) z opisem przyczyny w "_error"."""
+    FALLBACKS.inc(stage="tasks")
+    return {
+        "tasks": [
+            "Policz: 3 + 4 = ____",
+            "Policz: 7 − 2 = ____",
+            "Policz: 5 + 5 = ____"
+        ],
+        "profile": profile,
+        "grade": grade,
+        "topic": topic,
+        "_error": error  # Opcjonalnie: możesz to wyświetlić w UI dla debugowania
+    }
+
+@traced("text_generator.generate_single_task")
+def generate_single_task(profile, grade, topic, existing_tasks=(), deadline=None):
+    """
+    v2: Jedno nowe zadanie do podmiany w gotowej karcie — jedno małe zapytanie API zamiast całej karty.
+    Nowe zadanie ma się różnić od existing_tasks. Zwraca {"task": str} (przy błędzie API także "_error"
+    i lokalne zadanie zastępcze, którego nie ma w existing_tasks).
+    v2: w trybie FRIENDLY_MATH_STRUCTURED także "detail" — zadanie jako dane (jak "details" w generate_tasks).
+    """
+    existing = [t for t in existing_tasks if t]
+    if deadline is not None and deadline.nearly_spent(_MIN_API_TIME_S):
+        FALLBACKS.inc(stage="single_task")
+        return {"task": _local_task(existing), "_error": "Brak czasu na zapytanie API (budżet karty wyczerpany)."}
+    try:
+        structured = structured_output.structured_enabled()
+        request = _tasks_request(str(grade), topic, profile, 1, structured=structured)
+        if existing:
+            request["messages"][-1]["content"] += "\n\nNowe zadanie musi być inne niż te, które już są na karcie:\n" + (
+                "\n".join(f"- {t}" for t in existing)
+            )
+        request["temperature"] = 0.9  # większa różnorodność — zależy nam na innym zadaniu
+        if not structured:
+            request["max_tokens"] = 80
+        response = chat_completion(**request, timeout=15.0, deadline=deadline)
+        detail = None
+        if structured:
+            details = structured_output.parse_response(response)
+            detail = details[0] if details else None
+            task = detail["text"] if detail else ""
+        else:
+            lines = _parse_tasks(response.choices[0].message.content)
+            # Model czasem numeruje mimo prośby — usuwamy „1.”, „-” itp. z początku linii
+            task = re.sub(r"^(?:\d+[.)]|[-•*])\s+", "", lines[0]) if lines else ""
+        if not task or not distinct([task], existing):
+            FALLBACKS.inc(stage="single_task")
+            return {"task": _local_task(existing), "_error": "API zwróciło puste lub powtórzone zadanie."}
+        return {"task": task, "detail": detail} if detail else {"task": task}
+    except Exception as e:
+        FALLBACKS.inc(stage="single_task")
+        return {"task": _local_task(existing), "_error": str(e)}
+
+
+def _local_task(existing) -> str:
+    """Proste zadanie zastępcze, którego nie ma jeszcze na karcie."""
+    i = 0
+    while True:
+        task = f"Policz: {2 + i} + {3 + i} = ____"
+        if task not in existing:
+            return task
+        i += 1
+
 
 # Initial version for v0.4.0 testing - hardcoded
 #
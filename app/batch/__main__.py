@@ -0,0 +1,52 @@
+"""
+v2: Generowanie wsadowe kart pracy.
+Uruchom: python -m app.batch specs.jsonl --out data/out/batch --workers 8 --api-concurrency 4
+v2: przerwany wsad wznawia się tym samym poleceniem (dziennik <out>/journal.sqlite, --no-journal wyłącza).
+
+Każda linia pliku wejściowego to obiekt JSON z polami WorksheetSpec, np.:
+{"id": "2a-dodawanie", "grade": 2, "topic": "dodawanie", "number_of_tasks": 5,
+ "student_profile": "dyskalkulia", "include_answers": true}
+"""
+from __future__ import annotations
+
+import argparse
+import sys
+from pathlib import Path
+
+from app.batch.runner import run_batch
+
+
+def main(argv: list[str] | None = None) -> int:
+    parser = argparse.ArgumentParser(prog="python -m app.batch", description="Friendly Math — generowanie wsadowe kart pracy.")
+    parser.add_argument("input", type=Path, help="Plik JSONL ze specyfikacjami kart (jedna na linię).")
+    parser.add_argument("--out", type=Path, default=Path("data/out/batch"), help="Katalog na PDF-y (domyślnie data/out/batch).")
+    parser.add_argument("--manifest", type=Path, default=None, help="Plik manifestu JSONL (domyślnie <out>/manifest.jsonl).")
+    parser.add_argument("--workers", type=int, default=4, help="Liczba kart generowanych równolegle.")
+    parser.add_argument("--api-concurrency", type=int, default=4, help="Maks. liczba równoczesnych wywołań API (0 = bez limitu).")
+    parser.add_argument("--journal", type=Path, default=None, help="Dziennik wsadu SQLite (domyślnie <out>/journal.sqlite).")
+    parser.add_argument("--no-journal", action="store_true", help="Bez dziennika — każde uruchomienie od początku.")
+    args = parser.parse_args(argv)
+
+    if not args.input.exists():
+        print(f"❌ Brak pliku wejściowego: {args.input}", file=sys.stderr)
+        return 2
+
+    summary = run_batch(
+        input_path=args.input,
+        out_dir=args.out,
+        manifest_path=args.manifest,
+        workers=args.workers,
+        api_concurrency=args.api_concurrency,
+        journal_path=None if args.no_journal else (args.journal or args.out / "journal.sqlite"),
+    )
+    print(
+        f"Gotowe: {summary.ok}/{summary.total} kart w {summary.elapsed_s:.1f} s "
+        f"(błędy: {summary.failed}, zadania zastępcze: {summary.fallback})."
+    )
+    if summary.skipped or summary.resumed:
+        print(f"Z dziennika: {summary.skipped} kart gotowych wcześniej, {summary.resumed} wznowionych od zapisanych etapów.")
+    return 1 if summary.failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,176 @@
+"""
+v2: Dziennik wsadu (SQLite) — wznawianie przerwanego generowania bez ponownych wywołań API.
+Dla każdej karty: stan (running / ok / error), wpis manifestu i wyniki etapów z API (zadania, layout).
+Ponowne uruchomienie tego samego wsadu pomija karty zakończone (PDF na dysku, zadania z API), a karty przerwane
+w połowie kończy od ostatniego zapisanego etapu. Zmieniona linia wejścia (inna specyfikacja pod tym samym id)
+liczona jest od nowa. Zapis w trybie WAL — przerwanie procesu nie psuje dziennika.
+"""
+from __future__ import annotations
+
+import json
+import os
+import sqlite3
+import threading
+import time
+from pathlib import Path
+from typing import Any, Iterable, Iterator, Optional
+
+from app.cache import stable_hash
+
+# Etapy z wywołaniami API — tylko te warto przechowywać (ilustracje, odpowiedzi i PDF liczone lokalnie)
+CHECKPOINT_STAGES = ("tasks", "layout")
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS items (
+    id TEXT PRIMARY KEY,
+    line INTEGER NOT NULL,
+    spec TEXT NOT NULL,
+    status TEXT NOT NULL,
+    attempts INTEGER NOT NULL DEFAULT 0,
+    entry TEXT,
+    tasks TEXT,
+    updated_at REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS stages (
+    id TEXT NOT NULL,
+    stage TEXT NOT NULL,
+    value TEXT NOT NULL,
+    created_at REAL NOT NULL,
+    PRIMARY KEY (id, stage)
+);
+"""
+
+
+class BatchJournal:
+    """
+    Plik SQLite z postępem wsadu; jedno połączenie na proces, bezpieczne wątkowo (blokada wokół zapytań).
+    Każda zmiana zatwierdzana od razu — po przerwaniu zostaje wszystko, co zakończono przed nim.
+    """
+
+    def __init__(self, path: Path) -> None:
+        self.path = Path(path)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(self.path, check_same_thread=False, timeout=30.0)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute("PRAGMA synchronous=NORMAL")
+        self._db.executescript(_SCHEMA)
+
+    def close(self) -> None:
+        with self._lock:
+            self._db.close()
+
+    def __enter__(self) -> "BatchJournal":
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self.close()
+
+    def begin(self, item_id: str, line_no: int, data: Optional[dict]) -> tuple[Optional[dict], int]:
+        """
+        Rejestruje kartę przed generowaniem. Zwraca (wpis manifestu, liczba zapisanych etapów):
+        wpis — karta już zakończona z tą samą specyfikacją (do pominięcia), None — do wygenerowania
+        (także karta zakończona zadaniami zastępczymi po błędzie API — tasks_error we wpisie).
+        """
+        spec = stable_hash(data)
+        now = time.time()
+        with self._lock:
+            row = self._db.execute("SELECT spec, status, entry FROM items WHERE id = ?", (item_id,)).fetchone()
+            if row is not None and row[0] == spec and row[1] == "ok":
+                entry = json.loads(row[2])
+                # Karta z zadaniami zastępczymi (błąd API) nie jest gotowa — ponawiamy ją jak nieudaną
+                if Path(entry.get("pdf", "")).is_file() and not entry.get("tasks_error"):
+                    return entry, 0
+            with self._db:
+                if row is not None and row[0] != spec:
+                    self._db.execute("DELETE FROM stages WHERE id = ?", (item_id,))
+                    self._db.execute("DELETE FROM items WHERE id = ?", (item_id,))
+                self._db.execute(
+                    "INSERT INTO items (id, line, spec, status, attempts, updated_at) VALUES (?, ?, ?, 'running', 1, ?) "
+                    "ON CONFLICT(id) DO UPDATE SET line = excluded.line, status = 'running', "
+                    "attempts = attempts + 1, updated_at = excluded.updated_at",
+                    (item_id, line_no, spec, now),
+                )
+            saved = self._db.execute("SELECT COUNT(*) FROM stages WHERE id = ?", (item_id,)).fetchone()[0]
+        return None, saved
+
+    def finish(self, item_id: str, entry: dict, tasks: Optional[list[str]] = None) -> None:
+        """Zapisuje wynik karty (status z wpisu manifestu: ok / error) — po atomowym zapisie PDF."""
+        payload = json.dumps(entry, ensure_ascii=False)
+        with self._lock, self._db:
+            self._db.execute(
+                "UPDATE items SET status = ?, entry = ?, tasks = ?, updated_at = ? WHERE id = ?",
+                (entry.get("status", "error"), payload, json.dumps(tasks, ensure_ascii=False) if tasks else None,
+                 time.time(), item_id),
+            )
+
+    def checkpoint(self, item_id: str) -> "StageCheckpoint":
+        """Wyniki etapów jednej karty dla WorksheetPipeline.run(spec, checkpoint=...)."""
+        return StageCheckpoint(self, item_id)
+
+    def tasks(self, item_id: str) -> list[str]:
+        """Zadania zakończonej karty (np. do indeksu powtórzeń przy wznowieniu)."""
+        with self._lock:
+            row = self._db.execute("SELECT tasks FROM items WHERE id = ?", (item_id,)).fetchone()
+        return json.loads(row[0]) if row and row[0] else []
+
+    def counts(self) -> dict[str, int]:
+        """Liczba kart w każdym stanie."""
+        with self._lock:
+            return dict(self._db.execute("SELECT status, COUNT(*) FROM items GROUP BY status").fetchall())
+
+    def entries(self) -> Iterator[dict]:
+        """Wpisy manifestu zakończonych kart w kolejności linii pliku wejściowego."""
+        with self._lock:
+            rows = self._db.execute("SELECT entry FROM items WHERE entry IS NOT NULL ORDER BY line, id").fetchall()
+        for (entry,) in rows:
+            yield json.loads(entry)
+
+    def export_manifest(self, path: Path) -> int:
+        """Manifest JSONL z dziennika (jeden wpis na kartę, bez duplikatów z wcześniejszych prób); zapis atomowy."""
+        return write_jsonl_atomic(path, self.entries())
+
+    def _get_stage(self, item_id: str, stage: str) -> Optional[str]:
+        with self._lock:
+            row = self._db.execute("SELECT value FROM stages WHERE id = ? AND stage = ?", (item_id, stage)).fetchone()
+        return row[0] if row else None
+
+    def _put_stage(self, item_id: str, stage: str, value: Any) -> None:
+        payload = json.dumps(value, ensure_ascii=False)
+        with self._lock, self._db:
+            self._db.execute(
+                "INSERT OR REPLACE INTO stages (id, stage, value, created_at) VALUES (?, ?, ?, ?)",
+                (item_id, stage, payload, time.time()),
+            )
+
+
+def write_jsonl_atomic(path: Path, entries: Iterable[dict]) -> int:
+    """Zapis JSONL strumieniowo do pliku tymczasowego + os.replace (jak write_atomic, bez całości w pamięci)."""
+    path = Path(path)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp = path.with_name(f".{path.name}.{os.getpid()}.tmp")
+    count = 0
+    with open(tmp, "w", encoding="utf-8") as f:
+        for entry in entries:
+            f.write(json.dumps(entry, ensure_ascii=False) + "\n")
+            count += 1
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp, path)
+    return count
+
+
+class StageCheckpoint:
+    """Widok dziennika dla jednej karty: get(etap, brak) / put(etap, wynik) — jak LRUCache, ale trwały."""
+
+    def __init__(self, journal: BatchJournal, item_id: str) -> None:
+        self.journal = journal
+        self.item_id = item_id
+
+    def get(self, stage: str, default: Any = None) -> Any:
+        value = self.journal._get_stage(self.item_id, stage)
+        return default if value is None else json.loads(value)
+
+    def put(self, stage: str, value: Any) -> None:
+        if stage in CHECKPOINT_STAGES:
+            self.journal._put_stage(self.item_id, stage, value)
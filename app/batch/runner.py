@@ -0,0 +1,220 @@
+"""
+v2: Generowanie wsadowe kart pracy z pliku JSONL (jedna specyfikacja karty na linię).
+Karty liczone są na puli wątków (workers); liczbę równoczesnych wywołań API ogranicza
+set_max_in_flight(). Wynik: PDF-y w katalogu wyjściowym + manifest JSONL (czasy, błędy)
+oraz v2: metryki wsadu w formacie Prometheusa (<out>/metrics.prom).
+v2: dziennik wsadu (app/batch/journal.py, domyślnie <out>/journal.sqlite) — ponowne uruchomienie po przerwaniu
+pomija gotowe karty i kończy przerwane od ostatniego zapisanego etapu; manifest na końcu odtwarzany z dziennika.
+"""
+from __future__ import annotations
+
+import json
+import re
+import time
+from concurrent.futures import ALL_COMPLETED, FIRST_COMPLETED, Future, ThreadPoolExecutor, wait
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Iterator, Optional
+
+from app.ai.client import set_max_in_flight
+from app.ai.scheduler import api_priority
+from app.ai.templates import templates_enabled
+from app.batch.journal import BatchJournal
+from app.cache import LRUCache
+from app.generators.bank import default_bank
+from app.generators.dedup import DuplicateIndex
+from app.metrics import register_cache, write_textfile
+from app.pdf.store import write_atomic
+from app.pipeline.worksheet import WorksheetPipeline, WorksheetResult, WorksheetSpec
+
+
+@dataclass
+class BatchItem:
+    """Jedna linia pliku wejściowego: numer linii, identyfikator karty i surowe dane (lub błąd parsowania)."""
+    line_no: int
+    item_id: str
+    data: Optional[dict]
+    error: Optional[str] = None
+
+
+@dataclass
+class BatchSummary:
+    total: int = 0
+    ok: int = 0
+    failed: int = 0
+    fallback: int = 0
+    skipped: int = 0  # v2: gotowe w dzienniku z wcześniejszego uruchomienia
+    resumed: int = 0  # v2: przerwane wcześniej, z zapisanymi etapami
+    elapsed_s: float = 0.0
+
+
+_SAFE_ID = re.compile(r"[^A-Za-z0-9._-]+")
+# v2: najwięcej podmian zadań powtórzonych z innych kart na jedną kartę (każda to jedno zapytanie API;
+# przy wąskim zakresie liczb profilu, np. dyskalkulia 1–12, powtórzeń w dużym wsadzie nie da się uniknąć)
+_MAX_REPLACED = 3
+
+
+def read_specs(path: Path) -> Iterator[BatchItem]:
+    """Czyta plik JSONL linia po linii (bez wczytywania całości); puste linie i komentarze '#' są pomijane."""
+    with open(path, encoding="utf-8") as f:
+        for line_no, line in enumerate(f, start=1):
+            line = line.strip()
+            if not line or line.startswith("#"):
+                continue
+            default_id = f"{path.stem}-{line_no:06d}"
+            try:
+                data = json.loads(line)
+            except json.JSONDecodeError as e:
+                yield BatchItem(line_no, default_id, None, f"Niepoprawny JSON: {e}")
+                continue
+            if not isinstance(data, dict):
+                yield BatchItem(line_no, default_id, None, "Linia musi być obiektem JSON.")
+                continue
+            raw_id = str(data.get("id") or data.get("request_id") or default_id)
+            yield BatchItem(line_no, _SAFE_ID.sub("_", raw_id), data)
+
+
+def process_item(
+    item: BatchItem,
+    pipeline: WorksheetPipeline,
+    out_dir: Path,
+    seen_tasks: Optional[DuplicateIndex] = None,
+    journal: Optional[BatchJournal] = None,
+) -> dict:
+    """
+    Generuje jedną kartę i zwraca wpis manifestu (nigdy nie zgłasza wyjątku).
+    seen_tasks: zadania całego wsadu — v2: zadania powtórzone z innych kart podmieniane (regenerate_task, najwyżej
+    _MAX_REPLACED na kartę); w manifeście "replaced_tasks" i "repeated_tasks" = ile powtórzeń zostało na karcie.
+    journal: wyniki etapów z API zapisywane na bieżąco, wpis manifestu po atomowym zapisie PDF
+    (BatchJournal albo v2: kolejka wielu maszyn WorkQueue — ten sam interfejs checkpoint(id) / finish(id, wpis, zadania)).
+    """
+    entry = {"id": item.item_id, "line": item.line_no}
+    started = time.perf_counter()
+    tasks = None
+    try:
+        if item.error:
+            raise ValueError(item.error)
+        spec = WorksheetSpec.from_dict(item.data)
+        entry["spec"] = spec.to_dict()
+        checkpoint = journal.checkpoint(item.item_id) if journal is not None else None
+        replaced = 0
+        with api_priority("batch"):  # sesje interaktywne mają pierwszeństwo w limitach API
+            result = pipeline.run(spec, checkpoint=checkpoint)
+            report = result.report()
+            if seen_tasks is not None:
+                result, replaced = _replace_repeated(pipeline, result, seen_tasks)
+        if replaced:
+            report.update(pdf_bytes=len(result.pdf_bytes), pdf_key=result.pdf_key)
+        tasks = result.tasks
+        pdf_path = out_dir / f"{item.item_id}.pdf"
+        write_atomic(pdf_path, result.pdf_bytes)
+        entry.update(status="ok", pdf=str(pdf_path), **report)
+        if seen_tasks is not None:
+            entry["replaced_tasks"] = replaced
+            entry["repeated_tasks"] = len(result.tasks) - len(seen_tasks.filter(result.tasks))
+    except Exception as e:
+        entry.update(status="error", error=f"{type(e).__name__}: {e}")
+    entry["elapsed_s"] = round(time.perf_counter() - started, 4)
+    if journal is not None:
+        journal.finish(item.item_id, entry, tasks)
+    return entry
+
+
+def _replace_repeated(
+    pipeline: WorksheetPipeline, result: WorksheetResult, seen_tasks: DuplicateIndex
+) -> tuple[WorksheetResult, int]:
+    """
+    Podmienia zadania powtórzone z innych kart wsadu (jedno małe zapytanie API na zadanie, jak „🔄” w UI).
+    Nowe zadanie też może być powtórzeniem — zostaje, liczone w "repeated_tasks". Podmiana z ostrzeżeniem
+    (np. zadanie zastępcze po błędzie API) jest odrzucana i kończy podmiany dla tej karty.
+    """
+    replaced = 0
+    for index, task in enumerate(list(result.tasks)):
+        if replaced >= _MAX_REPLACED:
+            break
+        if not seen_tasks.is_duplicate(task):
+            continue
+        candidate = pipeline.regenerate_task(result, index)
+        if candidate.warnings:
+            break
+        result = candidate
+        replaced += 1
+    return result, replaced
+
+
+def batch_pipeline(cache_entries: int = 256) -> WorksheetPipeline:
+    """Pipeline wsadu: wspólny cache etapów — powtarzające się layouty/ilustracje liczone są raz na cały wsad."""
+    pipeline = WorksheetPipeline(
+        cache=LRUCache(max_entries=cache_entries, max_bytes=256 * 1024 * 1024),
+        bank=default_bank(),
+        templates=templates_enabled(),
+    )
+    register_cache("stages", pipeline.cache)
+    return pipeline
+
+
+def run_batch(
+    input_path: Path,
+    out_dir: Path,
+    manifest_path: Optional[Path] = None,
+    workers: int = 4,
+    api_concurrency: Optional[int] = 4,
+    cache_entries: int = 256,
+    journal_path: Optional[Path] = None,
+) -> BatchSummary:
+    """
+    Przetwarza plik JSONL i dopisuje wyniki do manifestu w kolejności ukończenia.
+    W locie jest co najwyżej 2 × workers kart, więc pamięć nie rośnie z długością pliku.
+    v2: journal_path — dziennik wsadu (SQLite): karty gotowe z wcześniejszego uruchomienia są pomijane,
+    przerwane wznawiane od zapisanych etapów; na końcu manifest zapisywany atomowo z dziennika
+    (jeden wpis na kartę, w kolejności pliku wejściowego).
+    """
+    out_dir.mkdir(parents=True, exist_ok=True)
+    manifest_path = manifest_path or out_dir / "manifest.jsonl"
+    set_max_in_flight(api_concurrency)
+    pipeline = batch_pipeline(cache_entries)
+    summary = BatchSummary()
+    seen_tasks = DuplicateIndex()  # zadania całego wsadu (powtórzenia między kartami)
+    started = time.perf_counter()
+    max_pending = max(1, workers) * 2
+    journal = BatchJournal(journal_path) if journal_path is not None else None
+
+    with open(manifest_path, "a", encoding="utf-8") as manifest, ThreadPoolExecutor(
+        max_workers=max(1, workers), thread_name_prefix="fm-batch"
+    ) as pool:
+        pending: set[Future] = set()
+
+        def _drain(return_when) -> None:
+            nonlocal pending
+            done, pending = wait(pending, return_when=return_when)
+            for fut in done:
+                entry = fut.result()
+                summary.total += 1
+                if entry["status"] == "ok":
+                    summary.ok += 1
+                    summary.fallback += bool(entry.get("tasks_error"))
+                else:
+                    summary.failed += 1
+                manifest.write(json.dumps(entry, ensure_ascii=False) + "\n")
+                manifest.flush()
+
+        for item in read_specs(input_path):
+            if journal is not None:
+                done, saved_stages = journal.begin(item.item_id, item.line_no, item.data)
+                if done is not None:
+                    summary.skipped += 1
+                    seen_tasks.filter(journal.tasks(item.item_id))
+                    continue
+                summary.resumed += bool(saved_stages)
+            pending.add(pool.submit(process_item, item, pipeline, out_dir, seen_tasks, journal))
+            if len(pending) >= max_pending:
+                _drain(FIRST_COMPLETED)
+        if pending:
+            _drain(ALL_COMPLETED)
+
+    if journal is not None:
+        journal.export_manifest(manifest_path)
+        journal.close()
+    summary.elapsed_s = time.perf_counter() - started
+    write_textfile(out_dir / "metrics.prom")
+    return summary
@@ -0,0 +1,435 @@
+"""
+v2: Wsad na wielu maszynach — wspólna kolejka kart w katalogu (np. NFS/SMB widoczny dla wszystkich hostów).
+Procesy robocze (python -m app.batch.workqueue work) na dowolnej liczbie maszyn pobierają karty z kolejki,
+generują je zwykłym pipeline wsadu i zgłaszają wynik do wspólnego katalogu; manifest składany centralnie.
+
+Katalog kolejki:
+- pending/<id>.json — karty do zrobienia,
+- leases/<id>.json — karty w trakcie: przejęcie to atomowe os.rename z pending/ (wygrywa jeden proces),
+  dzierżawa odnawiana co --heartbeat (mtime pliku); po --lease sekundach bez odnowienia karta wraca do pending/;
+  znacznik w pliku (token) wskazuje właściciela — proces z wygasłą dzierżawą nie zwalnia cudzej,
+- stages/<id>/<etap>.json — zapisane etapy z API (jak dziennik wsadu) — przejęta po awarii karta nie powtarza zapytań,
+- done/<id>.json — wpis manifestu (zapis atomowy); manifest.jsonl składany z done/ w kolejności pliku wejściowego.
+Karta przerwana więcej niż --max-attempts razy trafia do done/ z błędem (np. proces pada zawsze na tej karcie).
+Każdy host ma własny klucz API i limity (OPENAI_API_KEY, FRIENDLY_MATH_RPM/TPM w jego .env).
+
+Uruchom:
+  python -m app.batch.workqueue submit specs.jsonl --queue /mnt/shared/fm-queue
+  python -m app.batch.workqueue work --queue /mnt/shared/fm-queue --workers 8      (na każdej maszynie)
+  python -m app.batch.workqueue status --queue /mnt/shared/fm-queue
+  python -m app.batch.workqueue manifest --queue /mnt/shared/fm-queue
+Lokalnie (kilka procesów na jednej maszynie, np. do testów): python -m app.batch.workqueue local specs.jsonl --processes 3
+"""
+from __future__ import annotations
+
+import argparse
+import json
+import os
+import random
+import shutil
+import socket
+import subprocess
+import sys
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from typing import Any, Iterable, Optional
+
+from app.ai.client import set_client, set_max_in_flight
+from app.batch.journal import CHECKPOINT_STAGES, write_jsonl_atomic
+from app.batch.runner import BatchItem, BatchSummary, batch_pipeline, process_item, read_specs
+from app.generators.dedup import DuplicateIndex
+from app.metrics import write_textfile
+from app.pdf.store import write_atomic
+
+_DIRS = ("pending", "leases", "stages", "done")
+_CLAIM_SAMPLE = 64  # przejmowana losowa karta z pierwszych N — mniej kolizji między procesami
+
+
+class WorkQueue:
+    """
+    Kolejka kart w katalogu współdzielonym przez procesy i maszyny (tylko operacje plikowe: rename, utime, replace).
+    Dla process_item zachowuje się jak BatchJournal: checkpoint(id) i finish(id, wpis, zadania).
+    Dostarczenie „co najmniej raz”: karta z wygasłą dzierżawą może zostać dokończona dwukrotnie —
+    wynik jest ten sam (PDF i wpis zapisywane atomowo pod id karty).
+    """
+
+    def __init__(self, root: Path, lease_s: float = 120.0, max_attempts: int = 3) -> None:
+        self.root = Path(root)
+        self.lease_s = lease_s
+        self.max_attempts = max_attempts
+        self._tokens: dict[str, str] = {}  # id karty → znacznik dzierżawy przejętej przez ten proces
+        self._lock = threading.Lock()
+        for name in _DIRS:
+            (self.root / name).mkdir(parents=True, exist_ok=True)
+
+    def submit(self, items: Iterable[BatchItem]) -> int:
+        """Dodaje karty do pending/; karty o id już obecnym w kolejce (w dowolnym stanie) są pomijane."""
+        added = 0
+        for item in items:
+            name = f"{item.item_id}.json"
+            if any((self.root / d / name).exists() for d in ("pending", "leases", "done")):
+                continue
+            job = {"id": item.item_id, "line": item.line_no, "data": item.data, "error": item.error, "attempts": 0}
+            write_atomic(self.root / "pending" / name, json.dumps(job, ensure_ascii=False).encode("utf-8"))
+            added += 1
+        return added
+
+    def claim(self, owner: str) -> Optional[BatchItem]:
+        """Przejmuje jedną kartę z pending/ (atomowe przeniesienie do leases/) albo None, gdy pending/ jest puste."""
+        names = []
+        with os.scandir(self.root / "pending") as entries:
+            for entry in entries:
+                if entry.name.endswith(".json"):
+                    names.append(entry.name)
+                    if len(names) >= _CLAIM_SAMPLE:
+                        break
+        random.shuffle(names)
+        for name in names:
+            lease = self.root / "leases" / name
+            try:
+                os.rename(self.root / "pending" / name, lease)
+                os.utime(lease)  # rename zachowuje mtime z chwili submit — dzierżawa liczy się od teraz
+            except FileNotFoundError:  # inny proces był szybszy
+                continue
+            job = json.loads(lease.read_text(encoding="utf-8"))
+            token = uuid.uuid4().hex
+            job.update(attempts=job.get("attempts", 0) + 1, owner=owner, token=token, claimed_at=time.time())
+            write_atomic(lease, json.dumps(job, ensure_ascii=False).encode("utf-8"))
+            with self._lock:
+                self._tokens[job["id"]] = token
+            return BatchItem(job["line"], job["id"], job["data"], job.get("error"))
+        return None
+
+    def renew(self, item_id: str) -> bool:
+        """Odnawia dzierżawę (heartbeat); False — dzierżawa wygasła (karta wróciła do kolejki lub ma innego właściciela)."""
+        lease = self.root / "leases" / f"{item_id}.json"
+        if not self._owns(lease, item_id):
+            return False
+        try:
+            os.utime(lease)
+            return True
+        except FileNotFoundError:
+            return False
+
+    def reclaim_expired(self) -> int:
+        """Karty z wygasłą dzierżawą wracają do pending/ (albo do done/ z błędem po max_attempts próbach)."""
+        now = time.time()
+        reclaimed = 0
+        with os.scandir(self.root / "leases") as entries:
+            expired = [e.path for e in entries if e.name.endswith(".json") and now - _mtime(e) > self.lease_s]
+        for path in map(Path, expired):
+            try:
+                job = json.loads(path.read_text(encoding="utf-8"))
+            except (FileNotFoundError, ValueError):
+                continue
+            if job.get("attempts", 0) >= self.max_attempts:
+                entry = {
+                    "id": job["id"],
+                    "line": job["line"],
+                    "status": "error",
+                    "error": f"Dzierżawa wygasła {job['attempts']} razy (ostatnio: {job.get('owner')}).",
+                }
+                write_atomic(self.root / "done" / path.name, json.dumps(entry, ensure_ascii=False).encode("utf-8"))
+                path.unlink(missing_ok=True)
+                continue
+            try:
+                os.rename(path, self.root / "pending" / path.name)
+                reclaimed += 1
+            except FileNotFoundError:  # właściciel właśnie skończył albo inny proces przejął
+                continue
+        return reclaimed
+
+    def checkpoint(self, item_id: str) -> "DirCheckpoint":
+        return DirCheckpoint(self.root / "stages" / item_id)
+
+    def finish(self, item_id: str, entry: dict, tasks: Optional[list[str]] = None) -> None:
+        """
+        Wpis manifestu do done/ (atomowo), potem zwolnienie dzierżawy i zapisanych etapów — tylko własnej dzierżawy:
+        po wygaśnięciu karta mogła zostać przejęta przez inny proces (jego dzierżawa i etapy zostają).
+        """
+        if tasks:
+            entry = {**entry, "tasks": tasks}
+        write_atomic(self.root / "done" / f"{item_id}.json", json.dumps(entry, ensure_ascii=False).encode("utf-8"))
+        if self._release(item_id):
+            shutil.rmtree(self.root / "stages" / item_id, ignore_errors=True)
+        with self._lock:
+            self._tokens.pop(item_id, None)
+
+    def _owns(self, lease: Path, item_id: str) -> bool:
+        """Plik dzierżawy ma znacznik nadany przy przejęciu karty przez ten proces."""
+        with self._lock:
+            token = self._tokens.get(item_id)
+        try:
+            return token is not None and json.loads(lease.read_text(encoding="utf-8")).get("token") == token
+        except (FileNotFoundError, ValueError):
+            return False
+
+    def _release(self, item_id: str) -> bool:
+        """
+        Usuwa własną dzierżawę; True — nikt inny nie trzyma karty (etapy można usunąć).
+        Dzierżawa najpierw przenoszona pod nazwę spoza kolejki (atomowo), więc nie zniknie dzierżawa innego procesu
+        przejęta między sprawdzeniem a usunięciem. Karta zwrócona do pending/ i jeszcze nieprzejęta jest z niej usuwana.
+        """
+        name = f"{item_id}.json"
+        lease = self.root / "leases" / name
+        if not lease.exists():
+            try:
+                (self.root / "pending" / name).unlink()
+                return True
+            except FileNotFoundError:  # przejęta ponownie (albo zakończona) przez inny proces
+                return False
+        if not self._owns(lease, item_id):
+            return False
+        released = lease.with_name(f".{name}.{uuid.uuid4().hex}.release")
+        try:
+            os.rename(lease, released)
+        except FileNotFoundError:
+            return False
+        if self._owns(released, item_id):
+            released.unlink(missing_ok=True)
+            return True
+        os.rename(released, lease)  # przejęta w międzyczasie przez inny proces — dzierżawa wraca
+        return False
+
+    def counts(self) -> dict[str, int]:
+        """Liczba kart: pending, leased (w tym expired), ok, error."""
+        now = time.time()
+        with os.scandir(self.root / "leases") as entries:
+            leases = [_mtime(e) for e in entries if e.name.endswith(".json")]
+        out = {
+            "pending": _count(self.root / "pending"),
+            "leased": len(leases),
+            "expired": sum(now - m > self.lease_s for m in leases),
+            "ok": 0,
+            "error": 0,
+        }
+        for entry in self.entries():
+            out["ok" if entry.get("status") == "ok" else "error"] += 1
+        return out
+
+    def idle(self) -> bool:
+        """Nic do zrobienia i nic w trakcie (także u innych procesów)."""
+        return _count(self.root / "pending") == 0 and _count(self.root / "leases") == 0
+
+    def entries(self) -> Iterable[dict]:
+        """Wpisy done/ w kolejności pliku wejściowego (bez listy zadań)."""
+        entries = []
+        with os.scandir(self.root / "done") as found:
+            for e in found:
+                if e.name.endswith(".json"):
+                    try:
+                        entry = json.loads(Path(e.path).read_text(encoding="utf-8"))
+                    except (FileNotFoundError, ValueError):
+                        continue
+                    entry.pop("tasks", None)
+                    entries.append(entry)
+        entries.sort(key=lambda x: (x.get("line", 0), x.get("id", "")))
+        return entries
+
+    def export_manifest(self, path: Path) -> int:
+        """Centralny manifest JSONL z done/ (zapis atomowy)."""
+        return write_jsonl_atomic(path, self.entries())
+
+    def done_tasks(self) -> Iterable[list[str]]:
+        """Zadania kart zakończonych (do indeksu powtórzeń nowego procesu roboczego)."""
+        with os.scandir(self.root / "done") as found:
+            paths = [e.path for e in found if e.name.endswith(".json")]
+        for path in paths:
+            try:
+                yield json.loads(Path(path).read_text(encoding="utf-8")).get("tasks") or []
+            except (FileNotFoundError, ValueError):
+                continue
+
+
+class DirCheckpoint:
+    """Zapisane etapy jednej karty jako pliki JSON (jak StageCheckpoint dziennika, ale na wspólnym dysku)."""
+
+    def __init__(self, root: Path) -> None:
+        self.root = Path(root)
+
+    def get(self, stage: str, default: Any = None) -> Any:
+        try:
+            return json.loads((self.root / f"{stage}.json").read_text(encoding="utf-8"))
+        except (FileNotFoundError, ValueError):
+            return default
+
+    def put(self, stage: str, value: Any) -> None:
+        if stage in CHECKPOINT_STAGES:
+            write_atomic(self.root / f"{stage}.json", json.dumps(value, ensure_ascii=False).encode("utf-8"))
+
+
+def run_worker(
+    queue: WorkQueue,
+    out_dir: Path,
+    workers: int = 4,
+    api_concurrency: Optional[int] = 4,
+    heartbeat_s: Optional[float] = None,
+    poll_s: float = 1.0,
+    owner: Optional[str] = None,
+) -> BatchSummary:
+    """
+    Proces roboczy: `workers` wątków pobiera karty z kolejki, aż kolejka będzie pusta i bez dzierżaw.
+    Osobny wątek odnawia dzierżawy trzymanych kart (co heartbeat_s, domyślnie lease / 4)
+    i zwraca do kolejki karty porzucone przez procesy, które przestały odpowiadać.
+    """
+    out_dir.mkdir(parents=True, exist_ok=True)
+    owner = owner or f"{socket.gethostname()}-{os.getpid()}"
+    heartbeat_s = heartbeat_s or max(1.0, queue.lease_s / 4)
+    set_max_in_flight(api_concurrency)
+    pipeline = batch_pipeline()
+    seen_tasks = DuplicateIndex()  # powtórzenia względem kart już zrobionych (także przez inne procesy)
+    for tasks in queue.done_tasks():
+        seen_tasks.filter(tasks)
+    summary = BatchSummary()
+    held: set[str] = set()
+    lock = threading.Lock()
+    stop = threading.Event()
+    started = time.perf_counter()
+
+    def _heartbeat() -> None:
+        while not stop.wait(heartbeat_s):
+            with lock:
+                ids = list(held)
+            for item_id in ids:
+                if not queue.renew(item_id):
+                    print(f"⚠️ {owner}: dzierżawa {item_id} wygasła — karta mogła trafić do innego procesu.", file=sys.stderr)
+            queue.reclaim_expired()
+
+    def _work() -> None:
+        while True:
+            item = queue.claim(owner)
+            if item is None:
+                if queue.idle():
+                    return
+                time.sleep(poll_s)  # karty w trakcie u innych — czekamy na wynik albo wygaśnięcie dzierżawy
+                continue
+            with lock:
+                held.add(item.item_id)
+            try:
+                entry = process_item(item, pipeline, out_dir, seen_tasks, journal=queue)
+            finally:
+                with lock:
+                    held.discard(item.item_id)
+            with lock:
+                summary.total += 1
+                if entry["status"] == "ok":
+                    summary.ok += 1
+                    summary.fallback += bool(entry.get("tasks_error"))
+                else:
+                    summary.failed += 1
+
+    queue.reclaim_expired()
+    beat = threading.Thread(target=_heartbeat, name="fm-workqueue-heartbeat", daemon=True)
+    beat.start()
+    try:
+        with ThreadPoolExecutor(max_workers=max(1, workers), thread_name_prefix="fm-queue") as pool:
+            for fut in [pool.submit(_work) for _ in range(max(1, workers))]:
+                fut.result()
+    finally:
+        stop.set()
+        beat.join()
+    summary.elapsed_s = time.perf_counter() - started
+    write_textfile(out_dir / f"metrics-{owner}.prom")
+    return summary
+
+
+def run_local(
+    input_path: Path, queue_dir: Path, out_dir: Path, processes: int = 2, worker_args: Optional[list[str]] = None
+) -> int:
+    """Lokalny zamiennik klastra: submit + `processes` procesów roboczych na tej maszynie + manifest. Zwraca liczbę błędów."""
+    queue = WorkQueue(queue_dir)
+    queue.submit(read_specs(input_path))
+    cmd = [sys.executable, "-m", "app.batch.workqueue", "work", "--queue", str(queue_dir), "--out", str(out_dir)]
+    procs = [subprocess.Popen(cmd + list(worker_args or [])) for _ in range(max(1, processes))]
+    for proc in procs:
+        proc.wait()
+    queue.export_manifest(queue_dir / "manifest.jsonl")
+    return queue.counts()["error"]
+
+
+def _mtime(entry: os.DirEntry) -> float:
+    try:
+        return entry.stat().st_mtime
+    except FileNotFoundError:
+        return time.time()
+
+
+def _count(path: Path) -> int:
+    with os.scandir(path) as entries:
+        return sum(1 for e in entries if e.name.endswith(".json"))
+
+
+def main(argv: list[str] | None = None) -> int:
+    parser = argparse.ArgumentParser(prog="python -m app.batch.workqueue", description="Friendly Math — wsad na wielu maszynach.")
+    sub = parser.add_subparsers(dest="command", required=True)
+    queue_arg = {"type": Path, "default": Path("data/out/queue"), "help": "Katalog kolejki (wspólny dla wszystkich maszyn)."}
+
+    p_submit = sub.add_parser("submit", help="Dodaj karty z pliku JSONL do kolejki.")
+    p_submit.add_argument("input", type=Path)
+    p_submit.add_argument("--queue", **queue_arg)
+
+    p_work = sub.add_parser("work", help="Proces roboczy: pobieraj karty, aż kolejka będzie pusta.")
+    p_local = sub.add_parser("local", help="Submit + kilka procesów roboczych na tej maszynie + manifest.")
+    p_local.add_argument("input", type=Path)
+    p_local.add_argument("--processes", type=int, default=2, help="Liczba procesów roboczych.")
+    for p in (p_work, p_local):
+        p.add_argument("--queue", **queue_arg)
+        p.add_argument("--out", type=Path, default=None, help="Katalog na PDF-y (domyślnie <queue>/pdf).")
+        p.add_argument("--workers", type=int, default=4, help="Karty generowane równolegle w procesie.")
+        p.add_argument("--api-concurrency", type=int, default=4, help="Maks. równoczesnych wywołań API w procesie (0 = bez limitu).")
+        p.add_argument("--lease", type=float, default=120.0, help="Czas dzierżawy karty [s] bez odnowienia.")
+        p.add_argument("--heartbeat", type=float, default=None, help="Odnawianie dzierżaw co [s] (domyślnie lease / 4).")
+        p.add_argument("--max-attempts", type=int, default=3, help="Po tylu wygasłych dzierżawach karta kończy się błędem.")
+        p.add_argument("--fake-llm", default=None, metavar="LATENCY", help="Atrapa LLM z opóźnieniem (testy bez API).")
+
+    for name in ("status", "manifest"):
+        p = sub.add_parser(name, help="Stan kolejki." if name == "status" else "Złóż manifest z done/.")
+        p.add_argument("--queue", **queue_arg)
+        p.add_argument("--lease", type=float, default=120.0, help=argparse.SUPPRESS)
+    sub.choices["manifest"].add_argument("--manifest", type=Path, default=None, help="Plik manifestu (domyślnie <queue>/manifest.jsonl).")
+    args = parser.parse_args(argv)
+
+    if args.command in ("submit", "local") and not args.input.exists():
+        print(f"❌ Brak pliku wejściowego: {args.input}", file=sys.stderr)
+        return 2
+    queue = WorkQueue(args.queue, lease_s=getattr(args, "lease", 120.0), max_attempts=getattr(args, "max_attempts", 3))
+    if args.command == "submit":
+        print(f"Dodano {queue.submit(read_specs(args.input))} kart do {args.queue}.")
+        return 0
+    if args.command == "status":
+        print(json.dumps(queue.counts()))
+        return 0
+    if args.command == "manifest":
+        path = args.manifest or args.queue / "manifest.jsonl"
+        print(f"Manifest: {path} ({queue.export_manifest(path)} kart).")
+        return 0
+
+    out_dir = args.out or args.queue / "pdf"
+    if args.command == "local":
+        worker_args = ["--workers", str(args.workers), "--api-concurrency", str(args.api_concurrency),
+                       "--lease", str(args.lease), "--max-attempts", str(args.max_attempts)]
+        if args.heartbeat:
+            worker_args += ["--heartbeat", str(args.heartbeat)]
+        if args.fake_llm:
+            worker_args += ["--fake-llm", args.fake_llm]
+        errors = run_local(args.input, args.queue, out_dir, args.processes, worker_args)
+        print(f"Gotowe: {json.dumps(queue.counts())}; manifest: {args.queue / 'manifest.jsonl'}")
+        return 1 if errors else 0
+
+    if args.fake_llm:
+        from app.bench.fake_llm import FakeLLM, parse_latency
+
+        set_client(FakeLLM(latency=parse_latency(args.fake_llm)))
+    summary = run_worker(queue, out_dir, args.workers, args.api_concurrency, args.heartbeat)
+    print(
+        f"Proces roboczy: {summary.ok}/{summary.total} kart w {summary.elapsed_s:.1f} s "
+        f"(błędy: {summary.failed}, zadania zastępcze: {summary.fallback})."
+    )
+    return 1 if summary.failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
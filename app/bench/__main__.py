@@ -0,0 +1,59 @@
+"""
+v2: Benchmarki offline.
+Uruchom: python -m app.bench [--quick] [--filter pdf] [--out data/out/bench/latest.json]
+Porównanie z app/bench/baseline.json; kod wyjścia 1 przy regresji czasu lub rozmiaru.
+Nowa baza (po świadomej zmianie wydajności): python -m app.bench --update-baseline
+"""
+from __future__ import annotations
+
+import argparse
+import json
+import sys
+from pathlib import Path
+
+from app.bench.suite import (
+    BASELINE_PATH,
+    SIZE_TOLERANCE,
+    TIME_TOLERANCE,
+    compare,
+    format_results,
+    load_json,
+    run_suite,
+)
+from app.pdf.store import write_atomic
+
+
+def main(argv: list[str] | None = None) -> int:
+    parser = argparse.ArgumentParser(prog="python -m app.bench", description="Friendly Math — benchmarki offline.")
+    parser.add_argument("--quick", action="store_true", help="Bez najcięższych przypadków (PDF na 500 zadań).")
+    parser.add_argument("--filter", default=None, help="Tylko przypadki zawierające ten tekst w nazwie.")
+    parser.add_argument("--out", type=Path, default=Path("data/out/bench/latest.json"), help="Plik wyników JSON.")
+    parser.add_argument("--baseline", type=Path, default=BASELINE_PATH, help="Plik bazy do porównania.")
+    parser.add_argument("--update-baseline", action="store_true", help="Zapisz wyniki jako nową bazę.")
+    parser.add_argument("--time-tolerance", type=float, default=TIME_TOLERANCE, help="Dopuszczalny wzrost czasu (min z powtórzeń; 0.5 = +50%%).")
+    parser.add_argument("--size-tolerance", type=float, default=SIZE_TOLERANCE, help="Dopuszczalny wzrost rozmiaru wyniku (0.05 = +5%%).")
+    parser.add_argument("--min-time", type=float, default=0.2, help="Minimalny czas pomiaru jednego przypadku [s].")
+    args = parser.parse_args(argv)
+
+    current = run_suite(quick=args.quick, name_filter=args.filter, min_time_s=args.min_time)
+    payload = json.dumps(current, ensure_ascii=False, indent=1).encode("utf-8")
+    write_atomic(args.out, payload)
+    baseline = load_json(args.baseline)
+    print(format_results(current, baseline))
+    print(f"\nWyniki: {args.out}")
+
+    if args.update_baseline:
+        write_atomic(args.baseline, payload)
+        print(f"Zapisano bazę: {args.baseline}")
+        return 0
+    if baseline is None:
+        print("Brak bazy do porównania (uruchom z --update-baseline).")
+        return 0
+    problems = compare(current, baseline, args.time_tolerance, args.size_tolerance)
+    for problem in problems:
+        print(f"❌ Regresja — {problem}", file=sys.stderr)
+    return 1 if problems else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
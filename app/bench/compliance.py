@@ -0,0 +1,488 @@
+"""
+v2: Ocena zgodności zadań z regułami profili na dużą skalę (zamiast ręcznego test_profiles.py).
+Dla każdego profilu tysiące zadań (zapytania współbieżne, mieszanka klas i tematów) z wybranego źródła:
+atrapa LLM (fake), OpenAI (openai[:MODEL], z harmonogramem limitów) albo nagrane odpowiedzi (replay:PLIK.jsonl,
+nagrywane przez --record). Reguły sprawdzane wektorowo na wszystkich zadaniach naraz (regex na połączonym
+tekście + numpy): zakres liczb profilu, liczba działań (ADHD — jedno), długość linii, format, liczby całkowite,
+działanie zgodne z tematem. Raport porównuje źródła: zgodność, powtórzenia, czas zapytania, tokeny
+i koszt na 1000 zadań. --structured: zapytania jak z FRIENDLY_MATH_STRUCTURED=1 (zadania jako dane, ocena pola text).
+
+Uruchom: python -m app.bench.compliance --backend fake --backend replay:data/out/bench/recorded.jsonl --tasks 2000
+"""
+from __future__ import annotations
+
+import argparse
+import json
+import math
+import random
+import re
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import asdict, dataclass, field
+from pathlib import Path
+from typing import Callable, Optional
+
+import numpy as np
+
+from app.ai import structured as structured_output
+from app.ai.client import chat_completion, set_client, track_api_usage
+from app.ai.scheduler import RateLimitScheduler, set_scheduler
+from app.ai.text_generator import _parse_tasks, _tasks_request
+from app.bench.fake_llm import FakeLLM, parse_latency
+from app.bench.load import percentiles
+from app.generators.bank import profile_limit
+from app.pdf.store import write_atomic
+from app.pipeline.worksheet import GRADES, PROFILES, TOPICS
+
+# Ceny (USD za 1 mln tokenów: prompt, odpowiedź) — do nadpisania przez --price MODEL=WEJŚCIE,WYJŚCIE
+PRICES_PER_1M = {
+    "gpt-3.5-turbo": (0.5, 1.5),
+    "gpt-4o-mini": (0.15, 0.6),
+    "gpt-4o": (2.5, 10.0),
+}
+
+# Reguły z _build_prompt (app/ai/text_generator.py): jeden krok dla profili wspierających, zdolny — do dwóch
+MAX_OPERATIONS = {"standardowy": 2, "zdolny": 2}
+_DEFAULT_MAX_OPERATIONS = 1
+# Najkrótsza linia PDF to 60 znaków (app/pdf/generator.py) minus numer „10. ”; ADHD — krótkie polecenia
+LINE_LIMITS = {"ADHD": 40}
+_DEFAULT_LINE_LIMIT = 56
+
+CHECKS = ("format", "range", "operations", "line", "integers", "topic")
+_EXAMPLES_PER_CHECK = 3
+
+_NUMBER = re.compile(r"\d+")
+_DECIMAL = re.compile(r"\d[.,]\d")
+# Działanie: znak między liczbami/niewiadomą (ukośnik to kreska ułamkowa) albo kolejny krok łańcucha
+_OPERATION = re.compile(r"(?<=[\dx)])[ \t]*[+\-−×*·:÷][ \t]*(?=[\dx(])|\b(?:wynik|następnie|potem)\b", re.IGNORECASE)
+_FORMAT = re.compile(r"^(?:(?:Policz|Oblicz|Rozwiąż|Uzupełnij)\b.*_{3,}.*|(?:Zaznacz|Pokoloruj)\b.*)$", re.MULTILINE)
+_ADHD_FORMAT = re.compile(r"^Policz: \d+ [+−×:] \d+ = _{3,}$", re.MULTILINE)  # tematy z _ADHD_STRICT_TOPICS
+_ADHD_STRICT_TOPICS = ("dodawanie", "odejmowanie", "mnożenie", "dzielenie")
+_TOPIC_OPERATION = {
+    "dodawanie": re.compile(r"\+"),
+    "odejmowanie": re.compile(r"[−-]"),
+    "mnożenie": re.compile(r"[×*·]"),
+    "dzielenie": re.compile(r"[:÷]"),
+    "ułamki": re.compile(r"\d\s*/\s*\d"),
+    "równania": re.compile(r"\bx\b"),
+}
+
+
+@dataclass
+class EvalConfig:
+    backends: tuple[str, ...] = ("fake",)
+    profiles: tuple[str, ...] = PROFILES
+    grades: tuple[str, ...] = GRADES
+    topics: tuple[str, ...] = TOPICS
+    tasks: int = 1000  # zadań na profil
+    batch: int = 10  # zadań na zapytanie
+    concurrency: int = 16
+    seed: int = 0
+    record: Optional[Path] = None
+    structured: bool = False  # zadania jako dane (function calling) zamiast wolnego tekstu
+    prices: dict = field(default_factory=lambda: dict(PRICES_PER_1M))
+
+
+@dataclass(frozen=True)
+class EvalRequest:
+    profile: str
+    grade: str
+    topic: str
+    n: int
+
+
+@dataclass
+class EvalResponse:
+    content: str
+    latency_s: float
+    prompt_tokens: int
+    completion_tokens: int
+    model: str
+
+
+class ApiBackend:
+    """Zapytania jak w generate_tasks (ten sam prompt i parametry) przez chat_completion — atrapa lub OpenAI."""
+
+    def __init__(self, name: str, client=None, model: Optional[str] = None, structured: bool = False) -> None:
+        self.name = name
+        self.client = client  # None — prawdziwy klient OpenAI (OPENAI_API_KEY)
+        self.model = model
+        self.structured = structured
+
+    def __enter__(self) -> "ApiBackend":
+        set_client(self.client)
+        if self.client is not None:  # atrapa — bez limitów RPM/TPM
+            set_scheduler(RateLimitScheduler(rpm=0, tpm=0))
+        return self
+
+    def __exit__(self, *exc) -> None:
+        set_client(None)
+        set_scheduler(None)
+
+    def complete(self, request: EvalRequest) -> EvalResponse:
+        kwargs = _tasks_request(request.grade, request.topic, request.profile, request.n, self.structured)
+        if self.model:
+            kwargs["model"] = self.model
+        with track_api_usage() as usage:
+            response = chat_completion(**kwargs, timeout=60.0)
+        if self.structured:
+            # Treści zadań z wywołania funkcji, linia na zadanie (ten sam format nagrań i ocena co w trybie tekstowym)
+            try:
+                content = "\n".join(detail["text"] for detail in structured_output.parse_response(response))
+            except ValueError:
+                content = ""
+        else:
+            content = response.choices[0].message.content or ""
+        return EvalResponse(
+            content=content,
+            latency_s=usage.latency_s,
+            prompt_tokens=usage.prompt_tokens,
+            completion_tokens=usage.completion_tokens,
+            model=kwargs["model"],
+        )
+
+
+class ReplayBackend:
+    """
+    Nagrane odpowiedzi (JSONL z --record): dla każdej prośby (profil, klasa, temat, n) kolejne nagrania po kolei,
+    w kółko. Czas i tokeny z nagrania — porównanie modeli bez ponownych zapytań.
+    """
+
+    def __init__(self, name: str, path: Path) -> None:
+        self.name = name
+        self._records: dict[EvalRequest, list[dict]] = {}
+        self._next: dict[EvalRequest, int] = {}
+        self._lock = threading.Lock()
+        with open(path, encoding="utf-8") as f:
+            for line in f:
+                if line.strip():
+                    record = json.loads(line)
+                    key = EvalRequest(record["profile"], str(record["grade"]), record["topic"], int(record["n"]))
+                    self._records.setdefault(key, []).append(record)
+
+    def __enter__(self) -> "ReplayBackend":
+        return self
+
+    def __exit__(self, *exc) -> None:
+        pass
+
+    def complete(self, request: EvalRequest) -> EvalResponse:
+        records = self._records.get(request)
+        if not records:
+            raise KeyError(f"Brak nagrania dla {request.profile}/{request.grade}/{request.topic}/{request.n}.")
+        with self._lock:
+            i = self._next.get(request, 0)
+            self._next[request] = i + 1
+        record = records[i % len(records)]
+        return EvalResponse(
+            content=record["content"],
+            latency_s=float(record.get("latency_s", 0.0)),
+            prompt_tokens=int(record.get("prompt_tokens", 0)),
+            completion_tokens=int(record.get("completion_tokens", 0)),
+            model=record.get("model", ""),
+        )
+
+
+def make_backend(spec: str, seed: int = 0, structured: bool = False):
+    """fake[:ROZKŁAD_OPÓŹNIENIA] | openai[:MODEL] | replay:PLIK.jsonl"""
+    kind, _, arg = spec.partition(":")
+    if kind == "fake":
+        return ApiBackend(spec, client=FakeLLM(latency=parse_latency(arg or "0", seed), seed=seed), structured=structured)
+    if kind == "openai":
+        return ApiBackend(spec, model=arg or None, structured=structured)
+    if kind == "replay" and arg:
+        return ReplayBackend(spec, Path(arg))
+    raise ValueError(f"Nieznane źródło zadań: {spec!r} (fake[:OPÓŹNIENIE], openai[:MODEL], replay:PLIK.jsonl).")
+
+
+def plan_requests(config: EvalConfig) -> list[EvalRequest]:
+    """Zapytania dla wszystkich profili: config.tasks zadań na profil, klasy i tematy po równo (kolejność losowa)."""
+    rng = random.Random(config.seed)
+    combos = [(g, t) for g in config.grades for t in config.topics]
+    requests = []
+    for profile in config.profiles:
+        rng.shuffle(combos)
+        count = math.ceil(config.tasks / config.batch)
+        requests.extend(EvalRequest(profile, *combos[i % len(combos)], config.batch) for i in range(count))
+    rng.shuffle(requests)  # profile przemieszane — równe warunki przy limitach API
+    return requests
+
+
+def check_tasks(tasks: list[str], profiles: list[str], grades: list[str], topics: list[str]) -> dict[str, np.ndarray]:
+    """
+    Reguły profili dla wszystkich zadań naraz: {nazwa reguły: tablica bool (zadanie spełnia regułę)}.
+    Jeden przebieg wyrażeń regularnych po połączonym tekście, przypisanie trafień do zadań przez searchsorted.
+    """
+    n = len(tasks)
+    if n == 0:
+        return {name: np.zeros(0, dtype=bool) for name in CHECKS}
+    blob = "\n".join(tasks)
+    lengths = np.fromiter((len(t) for t in tasks), dtype=np.int64, count=n)
+    starts = np.concatenate(([0], np.cumsum(lengths + 1)[:-1]))
+
+    def _owners(pattern: re.Pattern) -> np.ndarray:
+        positions = np.fromiter((m.start() for m in pattern.finditer(blob)), dtype=np.int64)
+        return np.searchsorted(starts, positions, side="right") - 1
+
+    def _any(pattern: re.Pattern) -> np.ndarray:
+        hit = np.zeros(n, dtype=bool)
+        hit[_owners(pattern)] = True
+        return hit
+
+    matches = list(_NUMBER.finditer(blob))
+    owners = np.searchsorted(starts, np.fromiter((m.start() for m in matches), dtype=np.int64), side="right") - 1
+    values = np.fromiter((min(int(m.group()), 10**9) for m in matches), dtype=np.int64, count=len(matches))
+    max_number = np.zeros(n, dtype=np.int64)
+    np.maximum.at(max_number, owners, values)
+
+    profile_names = sorted(set(profiles))
+    profile_codes = np.array([profile_names.index(p) for p in profiles], dtype=np.int64)
+    limit_of = {(g, p): profile_limit(g, p) for g, p in set(zip(grades, profiles))}
+    limits = np.fromiter((limit_of[g, p] for g, p in zip(grades, profiles)), dtype=np.int64, count=n)
+    max_ops = np.array([MAX_OPERATIONS.get(p, _DEFAULT_MAX_OPERATIONS) for p in profile_names])[profile_codes]
+    line_limits = np.array([LINE_LIMITS.get(p, _DEFAULT_LINE_LIMIT) for p in profile_names])[profile_codes]
+
+    topic_array = np.array(topics, dtype=object)
+    is_adhd = profile_codes == profile_names.index("ADHD") if "ADHD" in profile_names else np.zeros(n, dtype=bool)
+    strict_format = is_adhd & np.isin(topic_array, _ADHD_STRICT_TOPICS)
+    topic_hits = np.zeros(n, dtype=bool)
+    for topic, pattern in _TOPIC_OPERATION.items():
+        mask = topic_array == topic
+        if mask.any():
+            topic_hits |= mask & _any(pattern)
+    known_topic = np.isin(topic_array, list(_TOPIC_OPERATION))
+
+    return {
+        "format": np.where(strict_format, _any(_ADHD_FORMAT), _any(_FORMAT)),
+        "range": max_number <= limits,
+        "operations": np.bincount(_owners(_OPERATION), minlength=n) <= max_ops,
+        "line": lengths <= line_limits,
+        "integers": ~_any(_DECIMAL) | (topic_array == "ułamki"),
+        "topic": topic_hits | ~known_topic,
+    }
+
+
+def evaluate_backend(backend, requests: list[EvalRequest], config: EvalConfig, record: Optional[Callable] = None) -> dict:
+    """Wszystkie zapytania współbieżnie (config.concurrency), potem reguły dla wszystkich zadań naraz."""
+    results: list[Optional[EvalResponse]] = [None] * len(requests)
+    errors: list[str] = []
+    lock = threading.Lock()
+
+    def _run(i: int) -> None:
+        try:
+            response = backend.complete(requests[i])
+        except Exception as e:
+            with lock:
+                errors.append(f"{type(e).__name__}: {e}")
+            return
+        results[i] = response
+        if record is not None:
+            record(requests[i], response)
+
+    started = time.perf_counter()
+    with backend, ThreadPoolExecutor(max_workers=max(1, config.concurrency), thread_name_prefix="fm-eval") as pool:
+        list(pool.map(_run, range(len(requests))))
+    elapsed = time.perf_counter() - started
+
+    tasks, profiles, grades, topics = [], [], [], []
+    per_profile: dict[str, dict] = {p: {"requests": 0, "short": 0, "latency": [], "prompt": 0, "completion": 0, "model": ""}
+                                    for p in config.profiles}
+    for request, response in zip(requests, results):
+        if response is None:
+            continue
+        parsed = _parse_tasks(response.content)[: request.n]
+        stats = per_profile[request.profile]
+        stats["requests"] += 1
+        stats["short"] += len(parsed) < request.n
+        stats["latency"].append(response.latency_s)
+        stats["prompt"] += response.prompt_tokens
+        stats["completion"] += response.completion_tokens
+        stats["model"] = response.model
+        tasks.extend(parsed)
+        profiles.extend([request.profile] * len(parsed))
+        grades.extend([request.grade] * len(parsed))
+        topics.extend([request.topic] * len(parsed))
+
+    checks = check_tasks(tasks, profiles, grades, topics)
+    compliant = np.logical_and.reduce([checks[name] for name in CHECKS]) if tasks else np.zeros(0, dtype=bool)
+    profile_array = np.array(profiles, dtype=object)
+    report = {}
+    for profile in config.profiles:
+        mask = profile_array == profile
+        count = int(mask.sum())
+        stats = per_profile[profile]
+        price_in, price_out = config.prices.get(stats["model"], (0.0, 0.0))
+        cost = (stats["prompt"] * price_in + stats["completion"] * price_out) / 1e6
+        profile_tasks = [t for t, m in zip(tasks, mask) if m]
+        report[profile] = {
+            "tasks": count,
+            "requests": stats["requests"],
+            "short_responses": stats["short"],
+            "compliance": _rate(compliant[mask]),
+            "checks": {name: _rate(checks[name][mask]) for name in CHECKS},
+            "duplicates": round(1 - len(set(profile_tasks)) / count, 4) if count else 0.0,
+            "latency_s": percentiles(stats["latency"]),
+            "tokens_per_1000_tasks": round((stats["prompt"] + stats["completion"]) / count * 1000) if count else 0,
+            "cost_per_1000_tasks_usd": round(cost / count * 1000, 4) if count else 0.0,
+            "model": stats["model"],
+            "examples": {
+                name: [profile_tasks[i] for i in np.flatnonzero(~checks[name][mask])[:_EXAMPLES_PER_CHECK]]
+                for name in CHECKS
+            },
+        }
+    return {
+        "backend": backend.name,
+        "requests": len(requests),
+        "errors": len(errors),
+        "error_examples": sorted(set(errors))[:3],
+        "elapsed_s": round(elapsed, 3),
+        "tasks_per_s": round(len(tasks) / elapsed, 1) if elapsed else 0.0,
+        "profiles": report,
+    }
+
+
+def run_eval(config: EvalConfig) -> dict:
+    """Te same zapytania dla każdego źródła po kolei; opcjonalny zapis odpowiedzi do config.record (JSONL)."""
+    requests = plan_requests(config)
+    recorder = _Recorder(config.record) if config.record else None
+    try:
+        backends = [evaluate_backend(make_backend(spec, config.seed, config.structured), requests, config, recorder) for spec in config.backends]
+    finally:
+        if recorder is not None:
+            recorder.close()
+    return {
+        "meta": {
+            "config": {k: list(v) if isinstance(v, tuple) else (str(v) if isinstance(v, Path) else v)
+                       for k, v in asdict(config).items()},
+            "python": sys.version.split()[0],
+            "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        },
+        "backends": backends,
+    }
+
+
+class _Recorder:
+    """Dopisuje odpowiedzi do JSONL w formacie ReplayBackend (bezpieczny wątkowo)."""
+
+    def __init__(self, path: Path) -> None:
+        Path(path).parent.mkdir(parents=True, exist_ok=True)
+        self._file = open(path, "a", encoding="utf-8")
+        self._lock = threading.Lock()
+
+    def __call__(self, request: EvalRequest, response: EvalResponse) -> None:
+        line = json.dumps({**asdict(request), **asdict(response)}, ensure_ascii=False)
+        with self._lock:
+            self._file.write(line + "\n")
+
+    def close(self) -> None:
+        self._file.close()
+
+
+def _rate(mask: np.ndarray) -> float:
+    return round(float(mask.mean()), 4) if mask.size else 0.0
+
+
+def format_report(result: dict) -> str:
+    """Tabela: wiersz na (źródło, profil) — zgodność i reguły [%], powtórzenia, czas zapytania, koszt na 1000 zadań."""
+    header = (
+        f"{'źródło':<22}{'profil':<19}{'zadania':>8}{'zgodne':>8}"
+        + "".join(f"{name:>11}" for name in CHECKS)
+        + f"{'powt.':>7}{'p50/p95 [s]':>13}{'tok./1k':>9}{'USD/1k':>9}"
+    )
+    lines = [header]
+    for backend in result["backends"]:
+        for profile, r in backend["profiles"].items():
+            lat = r["latency_s"]
+            lines.append(
+                f"{backend['backend'][:21]:<22}{profile:<19}{r['tasks']:>8}{r['compliance'] * 100:>7.1f}%"
+                + "".join(f"{r['checks'][name] * 100:>10.1f}%" for name in CHECKS)
+                + f"{r['duplicates'] * 100:>6.1f}%{lat['p50']:>6.2f}/{lat['p95']:<6.2f}"
+                f"{r['tokens_per_1000_tasks']:>9}{r['cost_per_1000_tasks_usd']:>9.3f}"
+            )
+        if backend["errors"]:
+            lines.append(f"  ❌ {backend['errors']} nieudanych zapytań, np. {'; '.join(backend['error_examples'])}")
+    return "\n".join(lines)
+
+
+def _csv(value: str) -> tuple[str, ...]:
+    return tuple(v.strip() for v in value.split(",") if v.strip())
+
+
+def _price(value: str) -> tuple[str, tuple[float, float]]:
+    model, _, prices = value.partition("=")
+    try:
+        price_in, price_out = (float(p) for p in prices.split(","))
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"Niepoprawna cena: {value!r} (MODEL=WEJŚCIE,WYJŚCIE)") from None
+    return model.strip(), (price_in, price_out)
+
+
+def main(argv: list[str] | None = None) -> int:
+    parser = argparse.ArgumentParser(
+        prog="python -m app.bench.compliance", description="Friendly Math — zgodność zadań z regułami profili."
+    )
+    parser.add_argument("--backend", action="append", default=None,
+                        help="Źródło zadań (można powtórzyć): fake[:OPÓŹNIENIE] | openai[:MODEL] | replay:PLIK.jsonl.")
+    parser.add_argument("--profiles", default=",".join(PROFILES), help="Profile do oceny.")
+    parser.add_argument("--grades", default=",".join(GRADES), help="Klasy (po równo na profil).")
+    parser.add_argument("--topics", default=",".join(TOPICS), help="Tematy (po równo na profil).")
+    parser.add_argument("--tasks", type=int, default=1000, help="Liczba zadań na profil.")
+    parser.add_argument("--batch", type=int, default=10, help="Zadań na zapytanie (jak liczba zadań na karcie).")
+    parser.add_argument("--concurrency", type=int, default=16, help="Równoczesne zapytania.")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--record", type=Path, default=None, help="Dopisz odpowiedzi do JSONL (do replay:PLIK).")
+    parser.add_argument("--price", type=_price, action="append", default=[],
+                        help="Cena modelu w USD za 1 mln tokenów, np. gpt-4o-mini=0.15,0.6.")
+    parser.add_argument("--min-compliance", type=float, default=None, help="Kod wyjścia 1, gdy zgodność profilu niższa (0–1).")
+    parser.add_argument("--structured", action="store_true",
+                        help="Zadania jako dane (function calling, jak FRIENDLY_MATH_STRUCTURED=1).")
+    parser.add_argument("--out", type=Path, default=Path("data/out/bench/compliance.json"), help="Plik wyników JSON.")
+    args = parser.parse_args(argv)
+
+    try:
+        config = EvalConfig(
+            backends=tuple(args.backend or ("fake",)),
+            profiles=_csv(args.profiles),
+            grades=_csv(args.grades),
+            topics=_csv(args.topics),
+            tasks=max(1, args.tasks),
+            batch=max(1, min(30, args.batch)),
+            concurrency=args.concurrency,
+            seed=args.seed,
+            record=args.record,
+            structured=args.structured,
+            prices={**PRICES_PER_1M, **dict(args.price)},
+        )
+        unknown = (
+            [p for p in config.profiles if p not in PROFILES]
+            + [g for g in config.grades if g not in GRADES]
+            + [t for t in config.topics if t not in TOPICS]
+        )
+        if unknown:
+            raise ValueError(f"Nieznane profile/klasy/tematy: {', '.join(unknown)}.")
+        for spec in config.backends:
+            kind, _, arg = spec.partition(":")
+            if kind not in ("fake", "openai", "replay") or (kind == "replay" and not arg):
+                make_backend(spec)  # ValueError z opisem dozwolonych źródeł
+            if kind == "fake":
+                parse_latency(arg or "0")
+            if kind == "replay" and not Path(arg).is_file():
+                raise ValueError(f"Brak pliku nagrań: {arg}.")
+    except ValueError as e:
+        print(f"❌ {e}", file=sys.stderr)
+        return 2
+
+    result = run_eval(config)
+    write_atomic(args.out, json.dumps(result, ensure_ascii=False, indent=1).encode("utf-8"))
+    print(format_report(result))
+    print(f"\nWyniki: {args.out}")
+    below = args.min_compliance is not None and any(
+        r["compliance"] < args.min_compliance for b in result["backends"] for r in b["profiles"].values()
+    )
+    return 1 if below or any(b["errors"] for b in result["backends"]) else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
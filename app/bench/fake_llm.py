@@ -0,0 +1,133 @@
+"""
+v2: Atrapa klienta OpenAI do benchmarków i testów obciążeniowych (bez sieci i bez klucza API).
+Odpowiada deterministycznie na prompty zadań, layoutu i szablonów; opóźnienie stałe lub losowane.
+Zapytania z tools (zadania jako dane, app/ai/structured.py) dostają wywołanie funkcji z tymi samymi zadaniami.
+Użycie: app.ai.client.set_client(FakeLLM(latency=0.4)) albo FakeLLM(latency=parse_latency("lognormal:1.2,0.5")).
+"""
+from __future__ import annotations
+
+import json
+import math
+import random
+import re
+import threading
+import time
+from types import SimpleNamespace
+from typing import Callable, Optional, Union
+
+_TASKS_PROMPT = re.compile(r"Wygeneruj (\d+) zadań dla klasy (\S+) na temat: ([^.\n]+)")
+_OPERATORS = {"dodawanie": "+", "odejmowanie": "−", "mnożenie": "×", "dzielenie": ":"}
+
+
+class FakeLLM:
+    """
+    Zgodna z client.chat.completions.create(...) i client.with_options(...).
+    latency: sekundy na wywołanie albo funkcja () -> sekundy (np. rozkład z produkcji).
+    """
+
+    def __init__(self, latency: Union[float, Callable[[], float]] = 0.0, seed: int = 0) -> None:
+        self.latency = latency
+        self._rng = random.Random(seed)
+        self._lock = threading.Lock()
+        self.calls = 0
+        self.chat = SimpleNamespace(completions=SimpleNamespace(create=self._create))
+
+    def with_options(self, **_options) -> "FakeLLM":
+        return self
+
+    def _create(
+        self, model: str = "", messages: Optional[list] = None, max_tokens: int = 0, tools: Optional[list] = None, **_kwargs
+    ):
+        messages = messages or []
+        with self._lock:
+            self.calls += 1
+            delay = self.latency() if callable(self.latency) else self.latency
+            seed = self._rng.random()
+        if delay > 0:
+            time.sleep(delay)
+        prompt = str(messages[-1].get("content", "")) if messages else ""
+        system = str(messages[0].get("content", "")) if messages else ""
+        if "layout" in system.lower():
+            content = json.dumps({"task_font_size": 14, "task_spacing": 10, "margin": 50})
+        elif "szablon" in prompt.lower():
+            content = json.dumps([
+                {"text": "Policz: {a} + {b} = ____", "params": {"a": [1, 10], "b": [1, 10]}},
+                {"text": "Policz: {a} − {b} = ____", "params": {"a": [1, 20], "b": [1, 10]}},
+            ])
+        else:
+            content = "\n".join(item["text"] for item in _fake_tasks(prompt, random.Random(seed)))
+        message = SimpleNamespace(content=content)
+        if tools:
+            # Ten sam los co w trybie tekstowym — te same zadania, tylko jako argumenty funkcji
+            arguments = json.dumps({"tasks": _fake_tasks(prompt, random.Random(seed))}, ensure_ascii=False)
+            function = SimpleNamespace(name=tools[0]["function"]["name"], arguments=arguments)
+            message = SimpleNamespace(content=None, tool_calls=[SimpleNamespace(type="function", function=function)])
+            content = arguments
+        prompt_tokens = sum(len(str(m.get("content", ""))) for m in messages) // 3
+        completion_tokens = len(content) // 3
+        return SimpleNamespace(
+            choices=[SimpleNamespace(message=message)],
+            usage=SimpleNamespace(
+                prompt_tokens=prompt_tokens,
+                completion_tokens=completion_tokens,
+                total_tokens=prompt_tokens + completion_tokens,
+            ),
+        )
+
+
+def parse_latency(spec: str, seed: int = 0) -> Union[float, Callable[[], float]]:
+    """
+    Rozkład opóźnienia atrapy z opisu tekstowego:
+    "0.4" lub "const:0.4" — stałe; "uniform:0.2,1.5" — jednostajny; "lognormal:1.2,0.5" — log-normalny
+    (mediana w sekundach, sigma), typowy kształt czasów odpowiedzi API; "0" — bez opóźnienia.
+    """
+    kind, _, args = spec.partition(":") if ":" in spec else ("const", "", spec)
+    try:
+        values = [float(v) for v in args.split(",") if v.strip()]
+    except ValueError:
+        raise ValueError(f"Niepoprawny rozkład opóźnienia: {spec!r}.") from None
+    rng = random.Random(seed)
+    if kind == "const" and len(values) == 1:
+        return values[0]
+    if kind == "uniform" and len(values) == 2:
+        lo, hi = values
+        return lambda: rng.uniform(lo, hi)
+    if kind == "lognormal" and len(values) == 2:
+        median, sigma = values
+        return lambda: rng.lognormvariate(math.log(median), sigma) if median > 0 else 0.0
+    raise ValueError(f"Niepoprawny rozkład opóźnienia: {spec!r} (const:S, uniform:A,B, lognormal:MEDIANA,SIGMA).")
+
+
+def _fake_tasks(prompt: str, rng: random.Random) -> list[dict]:
+    """Zadania w postaci TASK_SCHEMA (app/ai/structured.py); tryb tekstowy używa tylko pola text."""
+    m = _TASKS_PROMPT.search(prompt)
+    n, topic = (int(m.group(1)), m.group(3).strip().lower()) if m else (1, "dodawanie")
+    tasks = []
+    for _ in range(n):
+        a, b = rng.randint(2, 12), rng.randint(1, 9)
+        if "ułamk" in topic:
+            den = rng.choice((2, 3, 4, 6, 8))
+            num = rng.randint(1, den - 1)
+            tasks.append(_item(f"Zaznacz {num}/{den} koła.", "ułamek", [], f"{num}/{den}", "ułamek", [[num, den]]))
+        elif "równani" in topic:
+            tasks.append(_item(f"Rozwiąż: x + {b} = {a + b}, x = ____", "równanie", [b, a + b], f"x = {a}", "waga"))
+        elif topic == "dzielenie":
+            tasks.append(_item(f"Policz: {a * b} : {b} = ____", ":", [a * b, b], str(a), "podział"))
+        else:
+            op = _OPERATORS.get(topic, "+")
+            hi, lo = max(a, b), min(a, b)
+            answer = {"+": hi + lo, "−": hi - lo, "×": hi * lo}[op]
+            illustration = {"+": "grupy", "−": "zabrane", "×": "siatka"}[op]
+            tasks.append(_item(f"Policz: {hi} {op} {lo} = ____", op, [hi, lo], str(answer), illustration))
+    return tasks
+
+
+def _item(text: str, operator: str, operands: list, answer: str, illustration: str, fractions=None) -> dict:
+    return {
+        "text": text,
+        "operator": operator,
+        "operands": operands,
+        "fractions": fractions or [],
+        "answer": answer,
+        "illustration": illustration,
+    }
@@ -0,0 +1,335 @@
+"""
+v2: Test obciążeniowy — wielu nauczycieli generuje karty jednocześnie (offline, atrapa LLM).
+Dla kolejnych poziomów współbieżności (np. 1,4,16,32) wirtualni nauczyciele wysyłają karty o losowym
+profilu, temacie i liczbie zadań; atrapa LLM odpowiada z zadanym rozkładem opóźnienia.
+Raport na poziom: przepustowość, p50/p95/p99 czasu karty i każdego etapu, błędy, wyniki zastępcze,
+szczytowe RSS procesu. Cel: WorksheetPipeline w procesie, usługa HTTP uruchomiona w procesie (--service)
+albo zewnętrzna (--url; offline: python -m app.service --fake-llm lognormal:1.2,0.5).
+
+Uruchom: python -m app.bench.load --concurrency 1,4,16 --requests 64 --latency lognormal:1.2,0.5
+"""
+from __future__ import annotations
+
+import argparse
+import json
+import math
+import random
+import resource
+import sys
+import threading
+import time
+from dataclasses import asdict, dataclass, field
+from pathlib import Path
+from typing import Callable, Optional
+
+from app.ai.client import set_client
+from app.ai.scheduler import RateLimitScheduler, set_scheduler
+from app.bench.fake_llm import FakeLLM, parse_latency
+from app.cache import LRUCache
+from app.deadline import Deadline
+from app.pdf.store import write_atomic
+from app.pipeline.worksheet import GRADES, PROFILES, TOPICS, WorksheetPipeline, WorksheetResult, WorksheetSpec
+
+STAGES = ("tasks", "layout", "images", "answers", "pdf")
+_RSS_INTERVAL_S = 0.05
+
+
+@dataclass
+class LoadConfig:
+    concurrency: tuple[int, ...] = (1, 4, 16)
+    requests: int = 64  # kart na poziom współbieżności
+    profiles: tuple[str, ...] = PROFILES
+    topics: tuple[str, ...] = TOPICS
+    task_counts: tuple[int, ...] = (5, 10, 15)
+    latency: str = "lognormal:1.2,0.5"
+    think_s: float = 0.0  # przerwa nauczyciela między kartami
+    slo_s: float = 0.0  # budżet czasu karty jak w UI (0 = bez budżetu)
+    cache: bool = False  # wspólny cache etapów (jak usługa); domyślnie każda karta liczona od zera
+    rpm: float = 0.0
+    tpm: float = 0.0
+    seed: int = 0
+    url: Optional[str] = None
+    service: bool = False
+    service_workers: int = 8
+
+
+@dataclass
+class _Sample:
+    total_s: float
+    stages: dict[str, float]
+    fallback: bool
+
+
+@dataclass
+class _LevelStats:
+    samples: list[_Sample] = field(default_factory=list)
+    errors: list[str] = field(default_factory=list)
+    lock: threading.Lock = field(default_factory=threading.Lock)
+
+
+def percentiles(values: list[float]) -> dict:
+    """p50/p95/p99/max (metoda najbliższej rangi) w sekundach."""
+    if not values:
+        return {"p50": 0.0, "p95": 0.0, "p99": 0.0, "max": 0.0}
+    ordered = sorted(values)
+
+    def _rank(p: float) -> float:
+        return ordered[max(0, math.ceil(p / 100 * len(ordered)) - 1)]
+
+    return {"p50": round(_rank(50), 4), "p95": round(_rank(95), 4), "p99": round(_rank(99), 4), "max": round(ordered[-1], 4)}
+
+
+def random_spec(rng: random.Random, config: LoadConfig, seed: int) -> WorksheetSpec:
+    """Losowa karta z mieszanki konfiguracji (liczba zadań przycięta do limitu klasy)."""
+    grade = rng.choice(GRADES)
+    n = rng.choice(config.task_counts)
+    if int(grade) <= 3:
+        n = min(n, 15)
+    return WorksheetSpec(
+        grade=grade,
+        topic=rng.choice(config.topics),
+        number_of_tasks=max(1, min(30, n)),
+        student_profile=rng.choice(config.profiles),
+        include_illustration=rng.random() < 0.5,
+        include_answers=rng.random() < 0.5,
+        seed=seed,  # inny wariant zadań dla każdej karty — bez trafień cache zadań
+    )
+
+
+class _RssSampler:
+    """Szczytowe RSS procesu w czasie pomiaru (próbkowanie /proc/self/statm; bez Linuksa — ru_maxrss)."""
+
+    def __init__(self) -> None:
+        self.peak = 0
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="fm-rss", daemon=True)
+
+    def __enter__(self) -> "_RssSampler":
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self._stop.set()
+        self._thread.join()
+
+    def _run(self) -> None:
+        while True:
+            self.peak = max(self.peak, current_rss())
+            if self._stop.wait(_RSS_INTERVAL_S):
+                self.peak = max(self.peak, current_rss())
+                return
+
+
+def current_rss() -> int:
+    """Bieżące RSS procesu w bajtach."""
+    try:
+        with open("/proc/self/statm", encoding="ascii") as f:
+            return int(f.read().split()[1]) * resource.getpagesize()
+    except (OSError, ValueError, IndexError):
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+
+
+def run_level(target: Callable[[WorksheetSpec], WorksheetResult], config: LoadConfig, concurrency: int) -> dict:
+    """Jeden poziom współbieżności: `concurrency` wątków-nauczycieli, łącznie config.requests kart."""
+    stats = _LevelStats()
+    counter = iter(range(config.requests))
+    counter_lock = threading.Lock()
+
+    def _teacher(worker: int) -> None:
+        rng = random.Random(f"{config.seed}:{concurrency}:{worker}")
+        while True:
+            with counter_lock:
+                i = next(counter, None)
+            if i is None:
+                return
+            spec = random_spec(rng, config, seed=config.seed * 1_000_000 + concurrency * 10_000 + i)
+            t0 = time.perf_counter()
+            try:
+                result = target(spec)
+            except Exception as e:
+                with stats.lock:
+                    stats.errors.append(f"{type(e).__name__}: {e}")
+            else:
+                sample = _Sample(
+                    total_s=time.perf_counter() - t0,
+                    stages={name: r.wall_s for name, r in result.stages.items()},
+                    fallback=bool(result.tasks_error) or bool(result.warnings),
+                )
+                with stats.lock:
+                    stats.samples.append(sample)
+            if config.think_s:
+                time.sleep(rng.expovariate(1.0 / config.think_s))
+
+    threads = [threading.Thread(target=_teacher, args=(w,), name=f"fm-teacher-{w}") for w in range(concurrency)]
+    started = time.perf_counter()
+    with _RssSampler() as rss:
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+    elapsed = time.perf_counter() - started
+    done = len(stats.samples)
+    return {
+        "concurrency": concurrency,
+        "requests": config.requests,
+        "completed": done,
+        "errors": len(stats.errors),
+        "error_examples": sorted(set(stats.errors))[:3],
+        "fallbacks": sum(s.fallback for s in stats.samples),
+        "elapsed_s": round(elapsed, 3),
+        "throughput_per_s": round(done / elapsed, 3) if elapsed else 0.0,
+        "latency_s": {
+            "worksheet": percentiles([s.total_s for s in stats.samples]),
+            **{
+                stage: percentiles([s.stages[stage] for s in stats.samples if stage in s.stages])
+                for stage in STAGES
+            },
+        },
+        "peak_rss_mb": round(rss.peak / 2**20, 1),
+    }
+
+
+def run_load(config: LoadConfig) -> dict:
+    """Wszystkie poziomy współbieżności; atrapa LLM i harmonogram ustawiane na czas testu (poza --url)."""
+    fake = None
+    if not config.url:
+        fake = FakeLLM(latency=parse_latency(config.latency, config.seed), seed=config.seed)
+        set_client(fake)
+        set_scheduler(RateLimitScheduler(rpm=config.rpm, tpm=config.tpm))
+    httpd = jobs = None
+    try:
+        if config.url or config.service:
+            from app.service.client import ServiceClient
+
+            url = config.url
+            if config.service:
+                httpd, jobs = _start_service(config)
+                url = f"http://127.0.0.1:{httpd.server_address[1]}"
+            client = ServiceClient(url, timeout=600.0)
+            target = client.run
+        else:
+            pipeline = WorksheetPipeline(
+                cache=LRUCache(max_entries=512, max_bytes=256 * 1024 * 1024) if config.cache else None,
+                max_workers=4,
+            )
+
+            def target(spec: WorksheetSpec) -> WorksheetResult:
+                deadline = Deadline(config.slo_s) if config.slo_s else None
+                return pipeline.run(spec, deadline=deadline)
+
+        levels = [run_level(target, config, c) for c in config.concurrency]
+    finally:
+        if httpd is not None:
+            httpd.shutdown()
+            httpd.server_close()
+            jobs.stop()
+        if fake is not None:
+            set_client(None)
+            set_scheduler(None)
+    return {
+        "meta": {
+            "config": {k: list(v) if isinstance(v, tuple) else v for k, v in asdict(config).items()},
+            "api_calls": fake.calls if fake is not None else None,
+            "peak_rss_process_mb": round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1),
+            "python": sys.version.split()[0],
+            "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        },
+        "levels": levels,
+    }
+
+
+def _start_service(config: LoadConfig):
+    from app.service.jobs import JobQueue
+    from app.service.server import WorksheetService
+
+    pipeline = WorksheetPipeline(
+        cache=LRUCache(max_entries=512, max_bytes=256 * 1024 * 1024) if config.cache else None,
+    )
+    jobs = JobQueue(workers=config.service_workers, pipeline=pipeline, slo_s=config.slo_s or None)
+    jobs.start()
+    httpd = WorksheetService(("127.0.0.1", 0), jobs)
+    threading.Thread(target=httpd.serve_forever, name="fm-load-service", daemon=True).start()
+    return httpd, jobs
+
+
+def format_report(result: dict) -> str:
+    """Tabela: jeden wiersz na poziom współbieżności, p50/p95/p99 karty i etapów w sekundach."""
+    lines = [
+        f"{'równ.':>6}{'karty':>7}{'błędy':>7}{'zast.':>7}{'karty/s':>9}{'RSS MB':>8}  "
+        f"{'karta p50/p95/p99':>20}" + "".join(f"{s + ' p50/p95/p99':>22}" for s in STAGES)
+    ]
+    for level in result["levels"]:
+        lat = level["latency_s"]
+
+        def _fmt(p: dict) -> str:
+            return f"{p['p50']:.2f}/{p['p95']:.2f}/{p['p99']:.2f}"
+
+        lines.append(
+            f"{level['concurrency']:>6}{level['completed']:>7}{level['errors']:>7}{level['fallbacks']:>7}"
+            f"{level['throughput_per_s']:>9.2f}{level['peak_rss_mb']:>8.0f}  {_fmt(lat['worksheet']):>20}"
+            + "".join(f"{_fmt(lat[s]):>22}" for s in STAGES)
+        )
+        for example in level["error_examples"]:
+            lines.append(f"        ❌ {example}")
+    return "\n".join(lines)
+
+
+def _csv(value: str, cast=str) -> tuple:
+    return tuple(cast(v.strip()) for v in value.split(",") if v.strip())
+
+
+def main(argv: list[str] | None = None) -> int:
+    parser = argparse.ArgumentParser(prog="python -m app.bench.load", description="Friendly Math — test obciążeniowy (offline).")
+    parser.add_argument("--concurrency", default="1,4,16", help="Poziomy współbieżności, np. 1,4,16,32.")
+    parser.add_argument("--requests", type=int, default=64, help="Liczba kart na poziom.")
+    parser.add_argument("--profiles", default=",".join(PROFILES), help="Mieszanka profili (losowane równomiernie).")
+    parser.add_argument("--topics", default=",".join(TOPICS), help="Mieszanka tematów.")
+    parser.add_argument("--tasks", default="5,10,15", help="Mieszanka liczby zadań na kartę.")
+    parser.add_argument("--latency", default="lognormal:1.2,0.5", help="Opóźnienie atrapy LLM: const:S | uniform:A,B | lognormal:MEDIANA,SIGMA.")
+    parser.add_argument("--think", type=float, default=0.0, help="Średnia przerwa nauczyciela między kartami [s].")
+    parser.add_argument("--slo", type=float, default=0.0, help="Budżet czasu karty [s] (0 = bez budżetu).")
+    parser.add_argument("--cache", action="store_true", help="Wspólny cache etapów (jak w usłudze).")
+    parser.add_argument("--rpm", type=float, default=0.0, help="Limit zapytań API na minutę (0 = bez limitu).")
+    parser.add_argument("--tpm", type=float, default=0.0, help="Limit tokenów na minutę (0 = bez limitu).")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--service", action="store_true", help="Uruchom usługę HTTP w procesie i testuj przez HTTP.")
+    parser.add_argument("--service-workers", type=int, default=8, help="Wątki usługi przy --service.")
+    parser.add_argument("--url", default=None, help="Zewnętrzna usługa (python -m app.service) zamiast pipeline w procesie.")
+    parser.add_argument("--out", type=Path, default=Path("data/out/bench/load.json"), help="Plik wyników JSON.")
+    args = parser.parse_args(argv)
+
+    try:
+        config = LoadConfig(
+            concurrency=_csv(args.concurrency, int),
+            requests=args.requests,
+            profiles=_csv(args.profiles),
+            topics=_csv(args.topics),
+            task_counts=_csv(args.tasks, int),
+            latency=args.latency,
+            think_s=args.think,
+            slo_s=args.slo,
+            cache=args.cache,
+            rpm=args.rpm,
+            tpm=args.tpm,
+            seed=args.seed,
+            url=args.url,
+            service=args.service,
+            service_workers=args.service_workers,
+        )
+        parse_latency(config.latency)
+        unknown = [p for p in config.profiles if p not in PROFILES] + [t for t in config.topics if t not in TOPICS]
+        if unknown:
+            raise ValueError(f"Nieznane profile/tematy: {', '.join(unknown)}.")
+    except ValueError as e:
+        print(f"❌ {e}", file=sys.stderr)
+        return 2
+
+    result = run_load(config)
+    write_atomic(args.out, json.dumps(result, ensure_ascii=False, indent=1).encode("utf-8"))
+    print(format_report(result))
+    print(f"\nWyniki: {args.out}")
+    return 1 if any(level["errors"] for level in result["levels"]) else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
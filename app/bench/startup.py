@@ -0,0 +1,93 @@
+"""
+v2: Pomiar zimnego startu i rerunów skryptu Streamlit (offline, bez klucza API).
+Każdy pomiar w osobnym procesie Pythona (zimny start):
+- import: czas importu modułów aplikacji (python -X importtime, suma dla modułu głównego),
+- first_run: pierwsze wykonanie app/ui/app.py (AppTest — pierwsze wyświetlenie strony),
+- rerun: kolejne wykonanie bez zmian (np. kliknięcie checkboxa), także po wygenerowaniu karty,
+- generate: kliknięcie „Generuj kartę” po chwili wypełniania formularza (--think, domyślnie 1 s).
+
+Uruchom: python -m app.bench.startup [--repeat 3]
+"""
+from __future__ import annotations
+
+import argparse
+import json
+import statistics
+import subprocess
+import sys
+from pathlib import Path
+
+from app.pdf.store import write_atomic
+
+ROOT_DIR = Path(__file__).resolve().parents[2]
+IMPORT_MODULES = ("app.pipeline.worksheet", "app.pdf.preview", "app.service.client")
+
+# Skrypt mierzący w świeżym procesie; wynik JSON w ostatniej linii wyjścia
+_APP_PROBE = r"""
+import json, os, sys, time
+os.environ.setdefault("OPENAI_API_KEY", "sk-offline")
+sys.path.insert(0, {root!r})
+from streamlit.testing.v1 import AppTest
+from app.ai.client import set_client
+from app.bench.fake_llm import FakeLLM
+set_client(FakeLLM())
+at = AppTest.from_file({script!r}, default_timeout=120)
+out = {{}}
+t = time.perf_counter(); at.run(); out["first_run_s"] = time.perf_counter() - t
+time.sleep({think!r})  # użytkownik wypełnia formularz — przygotowanie w tle ma czas się skończyć
+t = time.perf_counter(); at.run(); out["rerun_s"] = time.perf_counter() - t
+submit = [b for b in at.sidebar.button if "Generuj" in b.label]
+t = time.perf_counter(); submit[0].click().run(); out["generate_s"] = time.perf_counter() - t
+t = time.perf_counter(); at.run(); out["rerun_with_worksheet_s"] = time.perf_counter() - t
+out["exception"] = bool(at.exception)
+print(json.dumps(out))
+"""
+
+
+def measure_import(module: str) -> float:
+    """Łączny czas importu modułu [s] w świeżym procesie (z -X importtime)."""
+    proc = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+        cwd=ROOT_DIR, capture_output=True, text=True, check=True,
+    )
+    for line in reversed(proc.stderr.splitlines()):
+        parts = line.split("|")
+        if len(parts) == 3 and parts[2].strip() == module:
+            return int(parts[1]) / 1e6
+    return 0.0
+
+
+def measure_app(think_s: float = 1.0) -> dict:
+    """Czasy AppTest (pierwsze wyświetlenie, rerun, generowanie, rerun z kartą) w świeżym procesie."""
+    probe = _APP_PROBE.format(root=str(ROOT_DIR), script=str(ROOT_DIR / "app" / "ui" / "app.py"), think=think_s)
+    proc = subprocess.run([sys.executable, "-c", probe], cwd=ROOT_DIR, capture_output=True, text=True, check=True)
+    return json.loads(proc.stdout.strip().splitlines()[-1])
+
+
+def run_startup(repeat: int = 3, think_s: float = 1.0) -> dict:
+    """Mediana z `repeat` świeżych procesów dla każdego pomiaru."""
+    results: dict[str, float] = {}
+    for module in IMPORT_MODULES:
+        results[f"import/{module}"] = statistics.median(measure_import(module) for _ in range(repeat))
+    app_runs = [measure_app(think_s) for _ in range(repeat)]
+    for key in ("first_run_s", "rerun_s", "generate_s", "rerun_with_worksheet_s"):
+        results[f"app/{key}"] = statistics.median(run[key] for run in app_runs)
+    return {"results": {k: round(v, 4) for k, v in results.items()}, "errors": sum(r["exception"] for r in app_runs)}
+
+
+def main(argv: list[str] | None = None) -> int:
+    parser = argparse.ArgumentParser(prog="python -m app.bench.startup", description="Friendly Math — zimny start i reruny UI.")
+    parser.add_argument("--repeat", type=int, default=3, help="Liczba świeżych procesów na pomiar (mediana).")
+    parser.add_argument("--think", type=float, default=1.0, help="Przerwa [s] między pierwszym wyświetleniem a rerunem.")
+    parser.add_argument("--out", type=Path, default=Path("data/out/bench/startup.json"), help="Plik wyników JSON.")
+    args = parser.parse_args(argv)
+    result = run_startup(max(1, args.repeat), max(0.0, args.think))
+    write_atomic(args.out, json.dumps(result, ensure_ascii=False, indent=1).encode("utf-8"))
+    for name, seconds in result["results"].items():
+        print(f"{name:<40}{seconds * 1000:>10.1f} ms")
+    print(f"\nWyniki: {args.out}")
+    return 1 if result["errors"] else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
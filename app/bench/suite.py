@@ -0,0 +1,225 @@
+"""
+v2: Benchmarki offline (atrapa LLM, bez sieci): prompt, odpowiedzi, ilustracje, łamanie tekstu,
+rysowanie ułamków, budowa PDF (1/5/15/30/500 zadań) i cały pipeline.
+Wynik: JSON {nazwa: mediana/min czasu w ms, liczba powtórzeń, bajty wyniku}; porównanie z bazą
+(baseline.json) z progami regresji czasu i rozmiaru; czasy skalowane pętlą kalibracyjną (różne obciążenie maszyny).
+"""
+from __future__ import annotations
+
+import json
+import platform
+import statistics
+import sys
+import time
+from dataclasses import dataclass
+from io import BytesIO
+from pathlib import Path
+from typing import Any, Callable, Optional
+
+from app.ai.client import set_client
+from app.ai.scheduler import RateLimitScheduler, set_scheduler
+from app.ai.text_generator import _build_prompt
+from app.bench.fake_llm import FakeLLM
+from app.generators.answers import compute_answers
+from app.generators.images import generate_worksheet_image, generate_worksheet_images_for_tasks
+from app.pdf.generator import (
+    WorksheetMeta,
+    _draw_task_line_with_fractions,
+    _register_font,
+    _wrap_text,
+    build_worksheet_pdf_bytes,
+)
+from app.pipeline.worksheet import PROFILES, TOPICS, WorksheetPipeline, WorksheetSpec
+
+BASELINE_PATH = Path(__file__).with_name("baseline.json")
+PDF_SIZES = (1, 5, 15, 30, 500)
+
+# Domyślne progi: czas mierzony na różnych maszynach jest szumny, rozmiar — deterministyczny
+TIME_TOLERANCE = 0.5   # +50% czasu
+SIZE_TOLERANCE = 0.05  # +5% bajtów
+_MIN_TIME_DELTA_MS = 0.05  # różnice poniżej tej wartości to szum pomiaru (np. _build_prompt ~1 µs)
+
+_SAMPLE_TASKS = {
+    "dodawanie": "Policz: {a} + {b} = ____",
+    "odejmowanie": "Policz: {a} − {b} = ____",
+    "mnożenie": "Policz: {a} × {b} = ____",
+    "dzielenie": "Policz: {a} : {b} = ____",
+    "ułamki": "Policz: {b}/{a} + 1/{a} = ____",
+    "równania": "Rozwiąż: x + {b} = {a}, x = ____",
+}
+
+
+@dataclass
+class Case:
+    """Jeden pomiar: func() zwraca wynik (bytes/list/str), z którego liczymy rozmiar."""
+    name: str
+    func: Callable[[], Any]
+    quick: bool = True  # False — pomijany w trybie --quick (np. PDF na 500 zadań)
+
+
+def sample_tasks(topic: str, n: int) -> list[str]:
+    template = _SAMPLE_TASKS.get(topic, _SAMPLE_TASKS["dodawanie"])
+    return [template.format(a=12 + i % 9, b=1 + i % 7) for i in range(n)]
+
+
+def build_cases() -> list[Case]:
+    meta = WorksheetMeta(title="Karta pracy – klasa 3", grade="3", topic_range="ułamki", student_profile="standardowy")
+    font_name, _ = _register_font()
+    cases = [
+        Case(f"build_prompt/{profile}", lambda p=profile: _build_prompt("3", "dodawanie", p, 10))
+        for profile in (*PROFILES, "dysleksja")
+    ]
+    cases.append(Case("compute_answers/30", lambda: compute_answers(sample_tasks("dodawanie", 30))))
+    cases.append(Case("compute_answers/500", lambda: compute_answers(sample_tasks("mnożenie", 500))))
+    for topic in TOPICS:
+        cases.append(Case(f"image/{topic}", lambda t=topic: generate_worksheet_image(t, "standardowy")))
+        cases.append(Case(
+            f"task_images/{topic}/5",
+            lambda t=topic: generate_worksheet_images_for_tasks(sample_tasks(t, 5), t, "dyskalkulia"),
+        ))
+    long_text = " ".join(sample_tasks("dodawanie", 20))
+    cases.append(Case("wrap_text/long", lambda: _wrap_text(long_text, 60)))
+    cases.append(Case("draw_fractions/line", lambda: _draw_fractions(font_name)))
+    for n in PDF_SIZES:
+        cases.append(Case(
+            f"pdf/{n}",
+            lambda n=n: build_worksheet_pdf_bytes(meta=meta, tasks=sample_tasks("ułamki", n), answers=["1"] * n),
+            quick=n <= 30,
+        ))
+    image_tasks = sample_tasks("dodawanie", 15)
+    images = generate_worksheet_images_for_tasks(image_tasks, "dodawanie", "dyskalkulia")
+    cases.append(Case(
+        "pdf/15+task_images",
+        lambda: build_worksheet_pdf_bytes(meta=meta, tasks=image_tasks, task_images=images),
+    ))
+    cases.append(Case("pipeline/5", lambda: _pipeline_run(5).pdf_bytes))
+    return cases
+
+
+def run_suite(quick: bool = False, name_filter: Optional[str] = None, min_time_s: float = 0.2) -> dict:
+    """Uruchamia przypadki z atrapą LLM (bez opóźnień i bez limitów RPM/TPM) i zwraca wynik w formacie JSON."""
+    set_client(FakeLLM())
+    set_scheduler(RateLimitScheduler(rpm=0, tpm=0))
+    results = {}
+    try:
+        for case in build_cases():
+            if quick and not case.quick:
+                continue
+            if name_filter and name_filter not in case.name:
+                continue
+            results[case.name] = _measure(case.func, min_time_s)
+    finally:
+        set_client(None)
+        set_scheduler(None)
+    return {
+        "meta": {
+            "calibration_ms": _calibrate(),
+            "python": sys.version.split()[0],
+            "platform": platform.platform(),
+            "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        },
+        "results": results,
+    }
+
+
+def compare(
+    current: dict,
+    baseline: dict,
+    time_tolerance: float = TIME_TOLERANCE,
+    size_tolerance: float = SIZE_TOLERANCE,
+) -> list[str]:
+    """Opisy regresji: czas (min) lub rozmiar wyniku ponad bazę o więcej niż tolerancja."""
+    problems = []
+    base = baseline.get("results", {})
+    # Czasy przeliczane na szybkość maszyny bazy (stała pętla kalibracyjna w obu pomiarach)
+    scale = 1.0
+    calib, base_calib = current.get("meta", {}).get("calibration_ms"), baseline.get("meta", {}).get("calibration_ms")
+    if calib and base_calib:
+        scale = base_calib / calib
+    for name, r in current.get("results", {}).items():
+        b = base.get(name)
+        if not b:
+            continue
+        # Porównujemy najlepszy czas (min) — mniej wrażliwy na chwilowe obciążenie maszyny niż mediana
+        t = r["min_ms"] * scale
+        if t - b["min_ms"] > _MIN_TIME_DELTA_MS and t > b["min_ms"] * (1 + time_tolerance):
+            problems.append(f"{name}: czas {t:.3f} ms po kalibracji (baza {b['min_ms']:.3f} ms)")
+        if b.get("bytes") and r.get("bytes", 0) > b["bytes"] * (1 + size_tolerance):
+            problems.append(f"{name}: rozmiar {r['bytes']} B (baza {b['bytes']} B)")
+    return problems
+
+
+def format_results(current: dict, baseline: Optional[dict] = None) -> str:
+    """Tabela wyników (z kolumną zmiany względem bazy, gdy podana)."""
+    base = (baseline or {}).get("results", {})
+    lines = [f"{'przypadek':<28}{'mediana [ms]':>14}{'min [ms]':>11}{'powt.':>7}{'bajty':>10}{'vs baza':>9}"]
+    for name, r in current["results"].items():
+        b = base.get(name)
+        delta = f"{(r['min_ms'] / b['min_ms'] - 1) * 100:+.0f}%" if b and b["min_ms"] else "-"
+        lines.append(
+            f"{name:<28}{r['median_ms']:>14.3f}{r['min_ms']:>11.3f}{r['runs']:>7}{r.get('bytes', 0):>10}{delta:>9}"
+        )
+    return "\n".join(lines)
+
+
+def load_json(path: Path) -> Optional[dict]:
+    try:
+        return json.loads(Path(path).read_text(encoding="utf-8"))
+    except (OSError, ValueError):
+        return None
+
+
+def _calibrate() -> float:
+    """Czas [ms] stałej pętli Pythona (najlepszy z 7) — miara szybkości maszyny w chwili pomiaru."""
+    best = float("inf")
+    for _ in range(7):
+        t0 = time.perf_counter()
+        total = 0
+        for i in range(200_000):
+            total += i * i % 7
+        best = min(best, (time.perf_counter() - t0) * 1000)
+    return round(best, 4)
+
+
+def _measure(func: Callable[[], Any], min_time_s: float) -> dict:
+    value = func()  # rozgrzewka (import fontów, cache reportlab)
+    times = []
+    started = time.perf_counter()
+    while len(times) < 3 or (time.perf_counter() - started < min_time_s and len(times) < 1000):
+        t0 = time.perf_counter()
+        func()
+        times.append((time.perf_counter() - t0) * 1000)
+    return {
+        "median_ms": round(statistics.median(times), 4),
+        "min_ms": round(min(times), 4),
+        "runs": len(times),
+        "bytes": _size(value),
+    }
+
+
+def _size(value: Any) -> int:
+    if isinstance(value, (bytes, bytearray)):
+        return len(value)
+    if isinstance(value, str):
+        return len(value.encode("utf-8"))
+    if isinstance(value, (list, tuple)):
+        return sum(_size(v) for v in value)
+    return 0
+
+
+def _draw_fractions(font_name: str) -> bytes:
+    from reportlab.lib.pagesizes import A4
+    from reportlab.pdfgen import canvas
+
+    buffer = BytesIO()
+    c = canvas.Canvas(buffer, pagesize=A4)
+    for i in range(40):
+        _draw_task_line_with_fractions(c, 50, 800 - i * 18, f"{i + 1}. Policz: 1/{i + 2} + 3/{i + 4} = ____", font_name, 13)
+    c.save()
+    return buffer.getvalue()
+
+
+def _pipeline_run(n: int):
+    # Bez cache etapów — mierzymy pełne generowanie karty (z atrapą LLM)
+    spec = WorksheetSpec(grade="4", topic="dodawanie", number_of_tasks=n, student_profile="dyskalkulia", include_answers=True)
+    return WorksheetPipeline().run(spec)
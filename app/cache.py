@@ -0,0 +1,129 @@
+"""
+v2: Ograniczony cache LRU dla etapów generowania karty (zadania, layout, grafiki, PDF, podgląd).
+Limit liczby wpisów i łącznego rozmiaru w bajtach — najdawniej używane wpisy są usuwane.
+"""
+from __future__ import annotations
+
+import hashlib
+import json
+import threading
+from collections import OrderedDict
+from io import BytesIO
+from typing import Any, Callable, Hashable, Optional
+
+
+def stable_hash(*parts: Any) -> str:
+    """
+    Deterministyczny skrót (sha256, hex) z dowolnych danych JSON-owalnych.
+    bytes są zastępowane własnym skrótem, więc klucz nie zależy od kolejności pamięci ani id obiektów.
+    """
+    def _default(obj: Any):
+        if isinstance(obj, (bytes, bytearray, memoryview)):
+            return "sha256:" + hashlib.sha256(bytes(obj)).hexdigest()
+        if isinstance(obj, (set, frozenset)):
+            return sorted(obj, key=repr)
+        if hasattr(obj, "__dataclass_fields__"):
+            return {k: getattr(obj, k) for k in obj.__dataclass_fields__}
+        return repr(obj)
+
+    payload = json.dumps(parts, sort_keys=True, ensure_ascii=False, default=_default)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+def approx_size(value: Any) -> int:
+    """Przybliżony rozmiar wartości w bajtach (wystarczający do limitu pamięci cache)."""
+    if value is None:
+        return 0
+    if isinstance(value, (bytes, bytearray)):
+        return len(value)
+    if isinstance(value, BytesIO):
+        return value.getbuffer().nbytes
+    if isinstance(value, str):
+        return len(value.encode("utf-8"))
+    if isinstance(value, dict):
+        return sum(approx_size(k) + approx_size(v) for k, v in value.items()) + 64
+    if isinstance(value, (list, tuple)):
+        return sum(approx_size(v) for v in value) + 16 * len(value)
+    return 64
+
+
+class LRUCache:
+    """
+    Cache LRU bezpieczny wątkowo, ograniczony liczbą wpisów (max_entries)
+    i opcjonalnie łącznym rozmiarem (max_bytes). Zlicza trafienia, chybienia i wyrzucenia.
+    """
+
+    def __init__(self, max_entries: int = 32, max_bytes: Optional[int] = None) -> None:
+        self.max_entries = max(1, int(max_entries))
+        self.max_bytes = max_bytes
+        self._data: "OrderedDict[Hashable, tuple[Any, int]]" = OrderedDict()
+        self._lock = threading.RLock()
+        self.nbytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+    def __contains__(self, key: Hashable) -> bool:
+        return key in self._data
+
+    def get(self, key: Hashable, default: Any = None) -> Any:
+        with self._lock:
+            if key not in self._data:
+                self.misses += 1
+                return default
+            self._data.move_to_end(key)
+            self.hits += 1
+            return self._data[key][0]
+
+    def put(self, key: Hashable, value: Any, size: Optional[int] = None) -> None:
+        size = approx_size(value) if size is None else size
+        with self._lock:
+            if key in self._data:
+                self.nbytes -= self._data.pop(key)[1]
+            if self.max_bytes is not None and size > self.max_bytes:
+                return  # pojedyncza wartość większa niż cały cache — nie przechowujemy
+            self._data[key] = (value, size)
+            self.nbytes += size
+            self._evict()
+
+    def get_or_compute(self, key: Hashable, compute: Callable[[], Any]) -> Any:
+        """Zwraca wartość z cache albo liczy ją (compute()) i zapamiętuje."""
+        sentinel = object()
+        value = self.get(key, sentinel)
+        if value is not sentinel:
+            return value
+        value = compute()
+        self.put(key, value)
+        return value
+
+    def discard(self, key: Hashable) -> None:
+        with self._lock:
+            if key in self._data:
+                self.nbytes -= self._data.pop(key)[1]
+
+    def clear(self) -> None:
+        with self._lock:
+            self._data.clear()
+            self.nbytes = 0
+
+    def stats(self) -> dict:
+        total = self.hits + self.misses
+        return {
+            "entries": len(self._data),
+            "bytes": self.nbytes,
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "hit_ratio": (self.hits / total) if total else 0.0,
+        }
+
+    def _evict(self) -> None:
+        while len(self._data) > self.max_entries or (
+            self.max_bytes is not None and self.nbytes > self.max_bytes and len(self._data) > 1
+        ):
+            _, (_, size) = self._data.popitem(last=False)
+            self.nbytes -= size
+            self.evictions += 1
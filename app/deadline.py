@@ -0,0 +1,53 @@
+"""
+v2: Budżet czasu na całą kartę pracy (deadline), przekazywany przez wszystkie etapy.
+Każdy etap bierze swój timeout z pozostałego budżetu, a gdy budżetu prawie nie ma,
+przechodzi na lokalny fallback (domyślny layout, zadania lokalne, brak ilustracji).
+"""
+from __future__ import annotations
+
+import os
+import time
+
+# Domyślny czas odpowiedzi strony (SLO); nadpisywany przez FRIENDLY_MATH_SLO_S
+DEFAULT_SLO_S = 25.0
+
+
+class Deadline:
+    """Termin w czasie monotonicznym; tworzony przy wysłaniu formularza / przyjęciu zgłoszenia."""
+
+    def __init__(self, budget_s: float) -> None:
+        self.budget_s = float(budget_s)
+        self._expires_at = time.monotonic() + self.budget_s
+
+    @classmethod
+    def from_env(cls) -> "Deadline":
+        """Deadline z budżetem FRIENDLY_MATH_SLO_S (domyślnie DEFAULT_SLO_S)."""
+        try:
+            budget = float(os.getenv("FRIENDLY_MATH_SLO_S", DEFAULT_SLO_S))
+        except ValueError:
+            budget = DEFAULT_SLO_S
+        return cls(budget)
+
+    def remaining(self) -> float:
+        return max(0.0, self._expires_at - time.monotonic())
+
+    def expired(self) -> bool:
+        return self.remaining() <= 0.0
+
+    def nearly_spent(self, needed_s: float) -> bool:
+        """True, gdy do końca budżetu zostało mniej niż needed_s sekund."""
+        return self.remaining() < needed_s
+
+    def timeout(self, cap_s: float, reserve_s: float = 0.0) -> float:
+        """Timeout dla etapu: nie więcej niż cap_s i nie więcej niż budżet pomniejszony o reserve_s (≥ 0)."""
+        return max(0.0, min(cap_s, self.remaining() - reserve_s))
+
+    def reserve(self, seconds: float) -> "Deadline":
+        """Wcześniejszy termin dla etapów, które muszą zostawić `seconds` na kolejne (np. PDF)."""
+        child = Deadline.__new__(Deadline)
+        child._expires_at = self._expires_at - seconds
+        child.budget_s = max(0.0, self.budget_s - seconds)
+        return child
+
+    def __repr__(self) -> str:
+        return f"Deadline(budget_s={self.budget_s}, remaining={self.remaining():.2f})"
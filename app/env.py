@@ -0,0 +1,24 @@
+"""
+v2: Jednorazowe wczytanie zmiennych z .env dla całego procesu.
+Streamlit wykonuje skrypt od nowa przy każdej interakcji, a moduły (klient API, śledzenie) są
+importowane w różnej kolejności — load_env() czyta plik .env tylko przy pierwszym wywołaniu.
+"""
+from __future__ import annotations
+
+import threading
+
+_loaded = False
+_lock = threading.Lock()
+
+
+def load_env() -> None:
+    """Wczytuje .env (python-dotenv) raz na proces; zmienne już ustawione w środowisku mają pierwszeństwo."""
+    global _loaded
+    if _loaded:
+        return
+    with _lock:
+        if not _loaded:
+            from dotenv import load_dotenv
+
+            load_dotenv()
+            _loaded = True
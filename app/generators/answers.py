@@ -3,6 +3,10 @@ v1.0: Proste wyciąganie odpowiedzi do klucza (tylko działania a op b).
 """
 import re
 
+# v2: „a op b = ____” — niewiadoma to wynik działania (nie składnik, jak w „5 + ___ = 9”)
+_BLANK_RESULT = re.compile(r"(?<![\d/])(\d+)\s*([+*×·\-−:÷])\s*(\d+)(?![\d/])\s*=\s*(?:_+|\?|\.{2,}|…|$)")
+_CHAIN_BEFORE = re.compile(r"\d\s*[+*×·\-−:÷]\s*$")
+
 
 def compute_answers(tasks: list[str]) -> list[str]:
     """
@@ -12,6 +16,27 @@ def compute_answers(tasks: list[str]) -> list[str]:
     return [_answer_for_task(t) for t in tasks]
 
 
+def answers_from_details(tasks: list[str], details: list) -> list[str]:
+    """
+    v2: Odpowiedzi z zadań jako danych (app/ai/structured.py) — bez wyciągania liczb z treści.
+    Gdy treść to „a op b = ____”, wynik liczony lokalnie z treści widocznej na karcie (nie z odpowiedzi modelu);
+    pozostałe (brakujący składnik, ułamki, równania, zadania tekstowe) — wynik podany przez model.
+    Zadania bez danych (None) jak w compute_answers.
+    """
+    out = []
+    for task, detail in zip(tasks, details):
+        if not detail:
+            out.append(_answer_for_task(task))
+            continue
+        m = _BLANK_RESULT.search(task)
+        # Całe działanie to a op b — nie koniec łańcucha („10 − 3 + 2 = ____”)
+        if m is not None and not _CHAIN_BEFORE.search(task[: m.start()]):
+            out.append(_apply(int(m.group(1)), m.group(2), int(m.group(3))))
+        else:
+            out.append(detail.get("answer") or "—")
+    return out
+
+
 def _answer_for_task(task: str) -> str:
     """Jedno zadanie: szuka wzorca 'liczba operator liczba', zwraca wynik lub '—'."""
     # Operator: + - − × * · / : ÷ (bez spacji w środku)
@@ -23,6 +48,11 @@ def _answer_for_task(task: str) -> str:
         op = m.group(2).strip()
     except (ValueError, IndexError):
         return "—"
+    return _apply(a, op, b)
+
+
+def _apply(a: int, op: str, b: int) -> str:
+    """Wynik a op b jako tekst ("—" dla nieznanego działania lub dzielenia przez 0)."""
     if op in ("+",):
         return str(a + b)
     if op in ("-", "−"):
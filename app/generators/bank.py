@@ -0,0 +1,281 @@
+"""
+v2: Bank gotowych zadań — tablica strukturalna NumPy w pliku .npy, otwierana przez mmap.
+Wiersz = jedno zadanie: operandy, działanie, mianownik i wynik. Wiersze pogrupowane (klasa, temat,
+limit liczb profilu) w ciągłe zakresy — losowanie n zadań to n indeksów i jedno pobranie wierszy, bez pracy na wiersz.
+Wynik z wiersza trafia do klucza odpowiedzi (zadania jako dane, jak w app/ai/structured.py).
+
+Budowa offline (wektorowo, bez API):
+    python -m app.generators.bank --out data/bank --per-group 2048
+Użycie: FRIENDLY_MATH_BANK=data/bank — zadania z banku zamiast zapytania do API.
+"""
+from __future__ import annotations
+
+import argparse
+import io
+import json
+import os
+import sys
+from pathlib import Path
+from typing import Optional
+
+from app.generators.dedup import distinct
+from app.pdf.store import write_atomic
+
+BANK_VERSION = 2  # 2: bez nieużywanych kolumn max_value i carry
+TOPICS = ("dodawanie", "odejmowanie", "mnożenie", "dzielenie", "ułamki", "równania")
+GRADES = ("1", "2", "3", "4", "5", "6", "7", "8")
+
+# Zakres liczb dla klasy (profil standardowy i ADHD)
+GRADE_LIMITS = {"1": 20, "2": 100, "3": 100, "4": 1000, "5": 1000, "6": 1000, "7": 1000, "8": 1000}
+# Zakresy liczb z _build_prompt (app/ai/text_generator.py); „zdolny” — co najmniej do 50
+PROFILE_LIMITS = {"dyskalkulia": 12, "trudności w nauce": 15, "dysleksja": 20}
+_GIFTED_LIMIT = 50
+
+# Kody działań (kolumna "op")
+OP_ADD, OP_SUB, OP_MUL, OP_DIV, OP_MARK, OP_FRAC_ADD, OP_EQ_ADD = range(7)
+
+ROW_FIELDS = [
+    ("grade", "u1"),
+    ("topic", "u1"),
+    ("op", "u1"),
+    ("a", "<i4"),
+    ("b", "<i4"),
+    ("den", "u1"),        # mianownik (ułamki), 0 dla pozostałych
+    ("answer", "<i4"),    # wynik (dla ułamków: licznik, dla równań: x)
+]
+
+
+def _numpy():
+    """v2: numpy importowany przy pierwszym użyciu banku (import ~0,1 s), nie przy starcie aplikacji."""
+    try:
+        import numpy  # type: ignore
+    except ModuleNotFoundError:  # pip install numpy — bez niego bank zadań jest niedostępny
+        raise RuntimeError("Bank zadań wymaga pakietu numpy (pip install numpy).") from None
+    return numpy
+
+
+def profile_limit(grade: str, profile: str) -> int:
+    """Największa liczba dozwolona w zadaniu dla klasy i profilu."""
+    grade_limit = GRADE_LIMITS.get(str(grade), 100)
+    if profile in PROFILE_LIMITS:
+        return min(PROFILE_LIMITS[profile], grade_limit)
+    if profile == "zdolny":
+        return max(_GIFTED_LIMIT, grade_limit)
+    return grade_limit
+
+
+def format_task(row) -> str:
+    """Treść zadania w formacie z promptów (np. "Policz: 3 + 4 = ____")."""
+    op, a, b, den = int(row["op"]), int(row["a"]), int(row["b"]), int(row["den"])
+    if op == OP_ADD:
+        return f"Policz: {a} + {b} = ____"
+    if op == OP_SUB:
+        return f"Policz: {a} − {b} = ____"
+    if op == OP_MUL:
+        return f"Policz: {a} × {b} = ____"
+    if op == OP_DIV:
+        return f"Policz: {a} : {b} = ____"
+    if op == OP_MARK:
+        return f"Zaznacz {a}/{den} koła."
+    if op == OP_FRAC_ADD:
+        return f"Policz: {a}/{den} + {b}/{den} = ____"
+    return f"Rozwiąż: x + {a} = {b}, x = ____"
+
+
+def task_detail(row) -> dict:
+    """Zadanie jako dane (pola TASK_SCHEMA z app/ai/structured.py) z wiersza banku — wynik z kolumny answer."""
+    op, a, b, den, answer = int(row["op"]), int(row["a"]), int(row["b"]), int(row["den"]), int(row["answer"])
+    detail = {"text": format_task(row), "operator": "inne", "operands": [a, b], "fractions": [], "answer": str(answer)}
+    if op in _ARITHMETIC:
+        detail.update(operator=_ARITHMETIC[op][0], illustration=_ARITHMETIC[op][1])
+    elif op == OP_MARK:
+        detail.update(operator="ułamek", operands=[], fractions=[[a, den]], answer=f"{a}/{den}", illustration="ułamek")
+    elif op == OP_FRAC_ADD:
+        detail.update(operator="ułamek", operands=[], fractions=[[a, den], [b, den]], answer=f"{answer}/{den}",
+                      illustration="ułamek")
+    else:
+        detail.update(operator="równanie", illustration="waga")
+    return detail
+
+
+_ARITHMETIC = {OP_ADD: ("+", "grupy"), OP_SUB: ("−", "zabrane"), OP_MUL: ("×", "siatka"), OP_DIV: (":", "podział")}
+
+
+class ExerciseBank:
+    """
+    Bank otwarty z katalogu (exercises.npy + index.json). Tablica jest mapowana z dysku
+    (mmap_mode="r"), więc wiele procesów dzieli te same strony pamięci.
+    """
+
+    def __init__(self, root: Path) -> None:
+        np = _numpy()
+        self.root = Path(root)
+        index = json.loads((self.root / "index.json").read_text(encoding="utf-8"))
+        if index.get("version") != BANK_VERSION:
+            raise ValueError(f"Nieobsługiwana wersja banku zadań: {index.get('version')!r}.")
+        self.rows = np.load(self.root / "exercises.npy", mmap_mode="r")
+        self._groups: dict[tuple[str, str, int], tuple[int, int]] = {
+            (g["grade"], g["topic"], g["limit"]): (g["start"], g["stop"]) for g in index["groups"]
+        }
+
+    def __len__(self) -> int:
+        return len(self.rows)
+
+    def group(self, grade: str, topic: str, profile: str) -> tuple[int, int]:
+        """Zakres wierszy [start, stop) dla klasy, tematu i profilu; (0, 0), gdy brak grupy."""
+        return self._groups.get((str(grade), topic, profile_limit(grade, profile)), (0, 0))
+
+    def sample(self, grade: str, topic: str, profile: str, n: int, seed: int = 0):
+        """n różnych wierszy z grupy (kopia n wierszy) albo None, gdy grupa ma mniej niż n zadań."""
+        start, stop = self.group(grade, topic, profile)
+        if stop - start < n:
+            return None
+        np = _numpy()
+        rng = np.random.default_rng([BANK_VERSION, int(seed), start])
+        size = stop - start
+        if 4 * n > size:
+            picks = rng.choice(size, size=n, replace=False)  # permutacja całej grupy — tylko gdy n to duża jej część
+        else:
+            # Losowanie z odrzucaniem powtórzeń: O(n), kolizje rzadkie przy n ≤ 1/4 grupy
+            chosen: dict[int, None] = {}
+            while len(chosen) < n:
+                for i in rng.integers(0, size, n - len(chosen)).tolist():
+                    chosen[i] = None
+            picks = np.fromiter(chosen, dtype=np.int64, count=n)
+        return self.rows[start + picks]
+
+    def tasks_for(self, grade: str, topic: str, profile: str, n: int, seed: int = 0) -> Optional[dict]:
+        """
+        n różnych zadań z banku jako {"tasks": [treść], "details": [zadanie jako dane]} albo None
+        (brak pasującej grupy — trzeba zapytać API). details jak w generate_tasks w trybie zadań jako danych:
+        wynik z wiersza banku trafia do klucza odpowiedzi (answers_from_details) bez parsowania treści.
+        Losujemy z zapasem, bo bank zawiera np. i „3 + 4”, i „4 + 3”, a na karcie to jedno zadanie.
+        """
+        start, stop = self.group(grade, topic, profile)
+        rows = self.sample(grade, topic, profile, min(2 * n, stop - start), seed)
+        if rows is None:
+            return None
+        by_text = {}
+        for row in rows:
+            by_text.setdefault(format_task(row), row)
+        tasks = distinct(by_text)[:n]
+        if len(tasks) < n:
+            return None
+        return {"tasks": tasks, "details": [task_detail(by_text[t]) for t in tasks]}
+
+
+_default_bank: Optional[ExerciseBank] = None
+_default_bank_path: Optional[str] = None
+
+
+def default_bank() -> Optional[ExerciseBank]:
+    """Bank z katalogu FRIENDLY_MATH_BANK (otwierany raz na proces); None, gdy nieustawiony lub niedostępny."""
+    global _default_bank, _default_bank_path
+    path = os.getenv("FRIENDLY_MATH_BANK")
+    if not path:
+        return None
+    if path != _default_bank_path:
+        _default_bank_path = path
+        try:
+            _default_bank = ExerciseBank(Path(path))
+        except (OSError, ValueError, KeyError, RuntimeError) as e:
+            print(f"⚠️ Error opening exercise bank {path}: {e}")
+            _default_bank = None
+    return _default_bank
+
+
+# --------------------------------------------------
+# Budowa banku (offline, wektorowo)
+# --------------------------------------------------
+
+def build_bank(out_dir: Path, per_group: int = 2048, seed: int = 0) -> dict:
+    """Generuje wszystkie grupy (klasa × temat × limit profilu) i zapisuje exercises.npy + index.json."""
+    np = _numpy()
+    rng = np.random.default_rng(seed)
+    profiles = ("standardowy", "zdolny", *PROFILE_LIMITS)
+    parts, groups, start = [], [], 0
+    for grade in GRADES:
+        limits = sorted({profile_limit(grade, p) for p in profiles})
+        for topic_id, topic in enumerate(TOPICS):
+            for limit in limits:
+                rows = _generate_group(rng, int(grade), topic_id, limit, per_group)
+                parts.append(rows)
+                groups.append({"grade": grade, "topic": topic, "limit": limit, "start": start, "stop": start + len(rows)})
+                start += len(rows)
+    table = np.concatenate(parts)
+    buf = io.BytesIO()
+    np.save(buf, table)
+    out_dir = Path(out_dir)
+    write_atomic(out_dir / "exercises.npy", buf.getvalue())
+    index = {"version": BANK_VERSION, "rows": int(len(table)), "per_group": per_group, "seed": seed, "groups": groups}
+    write_atomic(out_dir / "index.json", json.dumps(index, ensure_ascii=False, indent=1).encode("utf-8"))
+    return index
+
+
+def _generate_group(rng, grade: int, topic_id: int, limit: int, size: int):
+    """Losuje kandydatów z zapasem, odrzuca zadania spoza limitu i duplikaty, zwraca do size wierszy."""
+    np = _numpy()
+    m = size * 4
+    topic = TOPICS[topic_id]
+    den = np.zeros(m, dtype=np.int64)
+    lo = 1 if grade <= 3 else 2
+    if topic == "dodawanie":
+        a = rng.integers(lo, max(lo + 1, limit), m)
+        b = rng.integers(lo, max(lo + 1, limit), m)
+        op = np.full(m, OP_ADD)
+        answer = a + b
+    elif topic == "odejmowanie":
+        a = rng.integers(lo + 1, limit + 1, m)
+        b = 1 + (rng.random(m) * (a - 1)).astype(np.int64)
+        op = np.full(m, OP_SUB)
+        answer = a - b
+    elif topic == "mnożenie":
+        table = 10 if grade <= 3 else 20
+        a = rng.integers(1, min(table, limit) + 1, m)
+        b = rng.integers(1, 11, m)
+        op = np.full(m, OP_MUL)
+        answer = a * b
+    elif topic == "dzielenie":
+        b = rng.integers(2, 11, m)
+        answer = rng.integers(1, (10 if grade <= 3 else 20) + 1, m)
+        a = answer * b
+        op = np.full(m, OP_DIV)
+    elif topic == "ułamki":
+        dens = np.array([2, 4] if grade <= 3 else [2, 3, 4, 5, 6, 8, 10, 12])
+        den = rng.choice(dens, m)
+        a = 1 + (rng.random(m) * (den - 1)).astype(np.int64)
+        b = 1 + (rng.random(m) * np.maximum(den - a, 1)).astype(np.int64)
+        # Klasy 1–3: tylko zaznaczanie części koła; starsze: także dodawanie o wspólnym mianowniku
+        frac_add = (rng.random(m) < 0.5) & (grade >= 4) & (a + b <= den)
+        op = np.where(frac_add, OP_FRAC_ADD, OP_MARK)
+        b = np.where(frac_add, b, 0)
+        answer = np.where(frac_add, a + b, a)
+    else:  # równania: x + a = b
+        x = rng.integers(1, max(2, limit // 2) + 1, m)
+        a = rng.integers(1, max(2, limit // 2) + 1, m)
+        b = x + a
+        op = np.full(m, OP_EQ_ADD)
+        answer = x
+
+    max_value = np.maximum(np.maximum(a, b), answer)
+    ok = max_value <= limit if topic != "ułamki" else np.ones(m, dtype=bool)
+    rows = np.zeros(int(ok.sum()), dtype=ROW_FIELDS)
+    rows["grade"], rows["topic"], rows["op"] = grade, topic_id, op[ok]
+    rows["a"], rows["b"], rows["den"], rows["answer"] = a[ok], b[ok], den[ok], answer[ok]
+    rows = np.unique(rows)  # różne zadania; unique sortuje, więc przed obcięciem do size tasujemy
+    return rows[rng.permutation(len(rows))[:size]]
+
+
+def main(argv: list[str] | None = None) -> int:
+    parser = argparse.ArgumentParser(prog="python -m app.generators.bank", description="Friendly Math — budowa banku zadań.")
+    parser.add_argument("--out", type=Path, default=Path("data/bank"), help="Katalog banku (domyślnie data/bank).")
+    parser.add_argument("--per-group", type=int, default=2048, help="Maks. liczba zadań na (klasa, temat, limit).")
+    parser.add_argument("--seed", type=int, default=0, help="Ziarno losowania.")
+    args = parser.parse_args(argv)
+    index = build_bank(args.out, per_group=args.per_group, seed=args.seed)
+    print(f"Bank zadań: {index['rows']} zadań w {len(index['groups'])} grupach → {args.out}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,162 @@
+"""
+v2: Wykrywanie (prawie) powtórzonych zadań.
+Dwa poziomy: postać kanoniczna (bez słów polecenia, ujednolicone znaki, posortowane składniki
+dodawania i mnożenia — „Policz: 3 + 4” == „4 + 3 = ____”) z kluczem 64-bit w zbiorze
+oraz MinHash + LSH po tokenach postaci kanonicznej dla różnic w sformułowaniu. Zadania z innymi
+liczbami nigdy nie są uznawane za duplikaty. Sprawdzenie jednego zadania to kilkadziesiąt
+mikrosekund niezależnie od liczby zadań w indeksie.
+"""
+from __future__ import annotations
+
+import hashlib
+import re
+import threading
+import zlib
+from array import array
+from typing import Iterable, Optional
+
+# Słowa polecenia — nie zmieniają treści matematycznej zadania
+_INSTRUCTION_WORDS = {
+    "policz", "oblicz", "rozwiąż", "podaj", "wynik", "ile", "to", "jest", "wynosi", "napisz", "wpisz",
+    "a", "teraz", "proszę",
+}
+_OPERATORS = str.maketrans({"−": "-", "–": "-", "×": "*", "·": "*", "÷": ":"})
+_TOKEN = re.compile(r"\d+/\d+|\d+|[a-ząćęłńóśźż]+|[+\-*:=<>]")
+_COMMUTATIVE = re.compile(r"(?<![\d/])(\d+) ([+*]) (\d+)(?![\d/])")
+# Działania obok pary, przy których zamiana składników zmienia wynik (poprzedzające / następujące)
+_LEFT_BOUND = {"+": {"-", "*", ":"}, "*": {":"}}
+_RIGHT_BOUND = {"+": {"*", ":"}, "*": set()}
+_NUMBER = re.compile(r"\d+")
+_PREFIX = re.compile(r"^[^\d=]*?:\s*")  # „Policz:”, „Oblicz:” — polecenie przed dwukropkiem
+
+_NUM_PERM = 32
+_BANDS = 8
+_ROWS = _NUM_PERM // _BANDS
+
+
+def canonical_form(task: str) -> str:
+    """Postać kanoniczna zadania (tokeny oddzielone spacją)."""
+    text = _PREFIX.sub("", task.lower().translate(_OPERATORS).replace("_", " "))
+    tokens = [t for t in _TOKEN.findall(text) if t not in _INSTRUCTION_WORDS]
+    # Końcowe „=” (miejsce na odpowiedź) nie należy do treści
+    while tokens and tokens[-1] == "=":
+        tokens.pop()
+    return _COMMUTATIVE.sub(_sort_operands, " ".join(tokens))
+
+
+def _sort_operands(m: re.Match) -> str:
+    # Zamiana tylko, gdy nie zmienia wyniku: „10 - 3 + 2” ≠ „10 - 2 + 3”, „12 : 3 * 2” ≠ „12 : 2 * 3”,
+    # „2 * 3 + 4” ≠ „2 * 4 + 3” (sąsiednie działanie odejmowania, dzielenia lub o wyższym priorytecie)
+    op = m.group(2)
+    before = m.string[: m.start()].split()
+    after = m.string[m.end():].split()
+    prev, nxt = (before[-1] if before else ""), (after[0] if after else "")
+    if prev in _LEFT_BOUND[op] or nxt in _RIGHT_BOUND[op]:
+        return m.group(0)
+    a, b = sorted((m.group(1), m.group(3)), key=int)
+    return f"{a} {op} {b}"
+
+
+def canonical_key(task: str) -> int:
+    """64-bitowy skrót postaci kanonicznej."""
+    return int.from_bytes(hashlib.blake2b(canonical_form(task).encode("utf-8"), digest_size=8).digest(), "big")
+
+
+def _shingles(canon: str) -> set[int]:
+    tokens = canon.split()
+    grams = tokens + [f"{a} {b}" for a, b in zip(tokens, tokens[1:])]
+    return {zlib.crc32(g.encode("utf-8")) for g in grams} or {0}
+
+
+# Stałe maski 32-bit (kolejne „permutacje” MinHash przez XOR) — sygnatury porównywalne między procesami
+_MASKS = [int.from_bytes(hashlib.blake2b(f"minhash-{i}".encode(), digest_size=4).digest(), "big") for i in range(_NUM_PERM)]
+
+
+def minhash(task: str) -> array:
+    """Sygnatura MinHash (32 wartości) postaci kanonicznej zadania."""
+    shingles = _shingles(canonical_form(task))
+    return array("I", [min(s ^ mask for s in shingles) for mask in _MASKS])
+
+
+class DuplicateIndex:
+    """
+    Indeks zadań: add() dodaje zadanie, jeśli nie jest (prawie) duplikatem, is_duplicate() tylko sprawdza.
+    threshold: minimalne podobieństwo (szacowany Jaccard tokenów) uznawane za duplikat.
+    Bezpieczny wątkowo.
+    """
+
+    def __init__(self, threshold: float = 0.8) -> None:
+        self.threshold = threshold
+        self._exact: set[int] = set()
+        self._buckets: dict[tuple[int, int, int], list[int]] = {}
+        self._signatures: list[array] = []
+        self._numbers: list[tuple[str, ...]] = []
+        self._lock = threading.Lock()
+        self.rejected = 0
+
+    def __len__(self) -> int:
+        return len(self._signatures)
+
+    def is_duplicate(self, task: str) -> bool:
+        with self._lock:
+            return self._match(*self._features(task)) is not None
+
+    def add(self, task: str) -> bool:
+        """True — zadanie dodane; False — duplikat zadania już w indeksie (niedodane)."""
+        key, signature, numbers = self._features(task)
+        with self._lock:
+            if self._match(key, signature, numbers) is not None:
+                self.rejected += 1
+                return False
+            idx = len(self._signatures)
+            self._exact.add(key)
+            self._signatures.append(signature)
+            self._numbers.append(numbers)
+            for bucket in _bucket_keys(signature, numbers):
+                self._buckets.setdefault(bucket, []).append(idx)
+            return True
+
+    def filter(self, tasks: Iterable[str]) -> list[str]:
+        """Zadania, które nie są duplikatami (ani indeksu, ani wcześniejszych z listy); dodaje je do indeksu."""
+        return [t for t in tasks if self.add(t)]
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {"tasks": len(self._signatures), "rejected": self.rejected}
+
+    @staticmethod
+    def _features(task: str) -> tuple[int, array, tuple[str, ...]]:
+        canon = canonical_form(task)
+        return canonical_key(task), minhash(task), tuple(sorted(_NUMBER.findall(canon)))
+
+    def _match(self, key: int, signature: array, numbers: tuple[str, ...]) -> Optional[int]:
+        if key in self._exact:
+            return -1
+        candidates: set[int] = set()
+        for bucket in _bucket_keys(signature, numbers):
+            candidates.update(self._buckets.get(bucket, ()))
+        for idx in candidates:
+            if self._numbers[idx] != numbers:
+                continue  # kolizja skrótu liczb
+            same = sum(1 for x, y in zip(signature, self._signatures[idx]) if x == y)
+            if same / _NUM_PERM >= self.threshold:
+                return idx
+        return None
+
+
+def _bucket_keys(signature: array, numbers: tuple[str, ...]) -> list[tuple[int, int, int]]:
+    # Kubełek LSH = pasmo sygnatury + zestaw liczb: zadania z innymi liczbami nie są nawet kandydatami,
+    # więc liczba kandydatów nie rośnie z rozmiarem indeksu
+    numbers_hash = hash(numbers)
+    return [
+        (band, numbers_hash, hash(tuple(signature[band * _ROWS:(band + 1) * _ROWS])))
+        for band in range(_BANDS)
+    ]
+
+
+def distinct(tasks: Iterable[str], existing: Iterable[str] = ()) -> list[str]:
+    """Zadania bez (prawie) duplikatów — względem siebie i względem existing; kolejność zachowana."""
+    index = DuplicateIndex()
+    for task in existing:
+        index.add(task)
+    return [t for t in tasks if index.add(t)]
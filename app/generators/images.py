@@ -6,9 +6,10 @@ from __future__ import annotations
 
 import re
 from io import BytesIO
-from typing import List, Tuple
+from typing import List, Optional, Tuple
 
-from PIL import Image, ImageDraw  # pyright: ignore[reportMissingModuleSource]
+from app.metrics import IMAGE_BYTES
+from app.tracing import traced
 
 
 # Kolory pastelowe, low-stimuli (spokojne, niski kontrast)
@@ -16,6 +17,7 @@ _PASTEL_BG = "#f5f8f5"
 _PASTEL_SHAPES = ("#c8e6c9", "#b3e5fc", "#fff9c4", "#ffccbc", "#d1c4e9")
 
 
+@traced("images.worksheet_image")
 def generate_worksheet_image(
     topic: str,
     profile: str,
@@ -30,6 +32,8 @@ def generate_worksheet_image(
     - ułamki: koło lub prostokąt przecięty linią (połowa / ćwiartka)
     - równania: dwie równe grupy (lewa = prawa)
     """
+    from PIL import Image, ImageDraw  # pyright: ignore[reportMissingModuleSource]  # v2: leniwie (zimny start UI)
+
     w, h = size
     img = Image.new("RGB", (w, h), _PASTEL_BG)
     draw = ImageDraw.Draw(img)
@@ -117,6 +121,7 @@ def generate_worksheet_image(
 
     buf = BytesIO()
     img.save(buf, format="PNG")
+    IMAGE_BYTES.observe(buf.tell(), kind="worksheet")
     return buf.getvalue()
 
 
@@ -154,6 +159,31 @@ def _parse_all_fractions_from_task(task: str) -> List[Tuple[int, int]]:
     return out
 
 
+# v2: wskazówka ilustracji zadania jako danych (app/ai/structured.py) → styl rysunku tematu
+_ILLUSTRATION_STYLE = {
+    "grupy": "dodawanie",
+    "zabrane": "odejmowanie",
+    "siatka": "mnożenie",
+    "podział": "dzielenie",
+    "ułamek": "ułamki",
+    "waga": "równania",
+}
+
+
+def _detail_numbers(detail: dict) -> Tuple[str, List[int], List[Tuple[int, int]]]:
+    """Styl rysunku, liczby (max 4, każda do 12) i ułamki (mianownik do 8) z zadania jako danych."""
+    fractions = []
+    for num, den in detail.get("fractions", [])[:4]:
+        if 0 < den and 0 <= num <= den:
+            den = min(den, 8)
+            fractions.append((min(num, den), den))
+    numbers = detail.get("operands") or [v for pair in fractions for v in pair]
+    style = _ILLUSTRATION_STYLE.get(detail.get("illustration"), "")
+    if detail.get("illustration") == "brak":
+        numbers = []
+    return style, [min(int(n), 12) for n in numbers[:4]], fractions
+
+
 def _circle_size_to_fit(available_w: int, available_h: int, num_cols: int, num_rows: int, gap: int = 6) -> int:
     """Oblicza rozmiar kółka ss tak, aby num_cols×num_rows mieściło się w available_w × available_h."""
     if num_cols <= 0 or num_rows <= 0:
@@ -164,17 +194,23 @@ def _circle_size_to_fit(available_w: int, available_h: int, num_cols: int, num_r
     return ss
 
 
+@traced("images.task_images")
 def generate_worksheet_images_for_tasks(
     tasks: List[str],
     topic: str,
     profile: str,
     size: Tuple[int, int] = (480, 100),
+    details: Optional[List[Optional[dict]]] = None,
 ) -> List[bytes]:
     """
     Day 11: Jedna ilustracja na zadanie, powiązana z tematem i treścią.
     v1.0: Ilustracje celowo ograniczone — czytelne i spójne z zadaniem.
     Najlepiej dopasowane: dodawanie, odejmowanie, proste mnożenie; reszta tematyczna.
+    v2: details — zadania jako dane (app/ai/structured.py): rodzaj rysunku ze wskazówki ilustracji, liczby
+    i ułamki z pól zadania zamiast z treści; zadania bez danych (None) jak dotąd.
     """
+    from PIL import Image, ImageDraw  # pyright: ignore[reportMissingModuleSource]  # v2: leniwie (zimny start UI)
+
     result: List[bytes] = []
     colors = list(_PASTEL_SHAPES)
     topic_lower = (topic or "").strip().lower()
@@ -186,8 +222,12 @@ def generate_worksheet_images_for_tasks(
     ah = h - 2 * margin - 2 * pad
     max_circles = 10  # mniej ambitnie — zawsze czytelne (np. 5+5)
 
-    for task in tasks:
-        nums = _parse_numbers_from_task(task)
+    for i, task in enumerate(tasks):
+        detail = details[i] if details and i < len(details) else None
+        if detail:
+            style, nums, fractions = _detail_numbers(detail)
+        else:
+            style, nums, fractions = topic_lower, _parse_numbers_from_task(task), None
         img = Image.new("RGB", (w, h), _PASTEL_BG)
         draw = ImageDraw.Draw(img)
         # Początek obszaru rysowania (z paddingiem)
@@ -197,7 +237,7 @@ def generate_worksheet_images_for_tasks(
             ss = min(aw, ah) // 4
             cx, cy = w // 2, h // 2
             draw.ellipse([cx - ss, cy - ss, cx + ss, cy + ss], fill=colors[0], outline="#9e9e9e", width=1)
-        elif topic_lower == "mnożenie" and len(nums) >= 2:
+        elif style == "mnożenie" and len(nums) >= 2:
             # Siatka — limit 5×5 dla czytelności (v1.0: mniej ambitne ilustracje)
             rows, cols = min(nums[0], 5), min(nums[1], 5)
             ss = _circle_size_to_fit(aw, ah, cols, rows, gap)
@@ -210,7 +250,7 @@ def generate_worksheet_images_for_tasks(
                     x = ox + c * (ss + gap)
                     y = oy + r * (ss + gap)
                     draw.ellipse([x, y, x + ss, y + ss], fill=colors[(r + c) % len(colors)], outline="#9e9e9e", width=1)
-        elif topic_lower == "odejmowanie" and len(nums) >= 1:
+        elif style == "odejmowanie" and len(nums) >= 1:
             # np. 7 − 2: 7 kółek, ostatnie 2 przekreślone („zabrane”)
             n_total = min(nums[0], max_circles)
             n_gone = min(nums[1], n_total - 1) if len(nums) >= 2 else 2
@@ -226,7 +266,7 @@ def generate_worksheet_images_for_tasks(
                     # Przekreślenie – „zabrane” (X przez kółko)
                     draw.line([x, cy - ss // 2, x + ss, cy + ss // 2], fill="#e57373", width=2)
                     draw.line([x + ss, cy - ss // 2, x, cy + ss // 2], fill="#e57373", width=2)
-        elif topic_lower == "dzielenie" and len(nums) >= 2:
+        elif style == "dzielenie" and len(nums) >= 2:
             # Dwie grupy obok — limit dla czytelności (v1.0)
             n_total = min(nums[0], 8)
             n_groups = max(1, min(nums[1], 2))
@@ -248,9 +288,10 @@ def generate_worksheet_images_for_tasks(
             for i in range(n2):
                 x = start2 + i * (ss + gap)
                 draw.ellipse([x, cy - ss // 2, x + ss, cy + ss // 2], fill=colors[1], outline="#9e9e9e", width=1)
-        elif topic_lower == "ułamki":
+        elif style == "ułamki":
             # Pierwszy ułamek z zadania — jedno czytelne koło (v1.0: mniej ambitnie)
-            fractions = _parse_all_fractions_from_task(task)
+            if fractions is None:
+                fractions = _parse_all_fractions_from_task(task)
             if not fractions:
                 fractions = [(1, 2)]
             n_fracs = min(len(fractions), 2)  # max 2 koła
@@ -268,7 +309,7 @@ def generate_worksheet_images_for_tasks(
                     end_angle = start_angle + step_angle
                     fill_color = colors[idx % len(colors)] if i < num else _PASTEL_BG
                     draw.pieslice(bbox, start=start_angle, end=end_angle, fill=fill_color, outline="#9e9e9e", width=2)
-        elif topic_lower == "równania":
+        elif style == "równania":
             # Ilustracja ogólna: lewa strona = prawa strona (bez konkretnych liczb – równania mają różne działania)
             cy = by + ah // 2
             ss = min(24, aw // 8, ah // 2 - 4)
@@ -321,6 +362,7 @@ def generate_worksheet_images_for_tasks(
 
         buf = BytesIO()
         img.save(buf, format="PNG")
+        IMAGE_BYTES.observe(buf.tell(), kind="task")
         result.append(buf.getvalue())
 
     return result
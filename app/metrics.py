@@ -0,0 +1,296 @@
+"""
+v2: Metryki procesu w formacie tekstowym Prometheusa (bez dodatkowych zależności).
+Liczniki i histogramy zasilane przez generatory, pipeline i budowę PDF: karty wg profilu i tematu,
+czasy etapów, zadania/layout zastępcze (fallback), czasy i tokeny API, rozmiary PDF i ilustracji,
+trafienia cache. Udostępniane przez GET /metrics usługi, osobny mały serwer HTTP
+(FRIENDLY_MATH_METRICS_PORT, np. dla Streamlit) albo plik tekstowy (write_textfile, np. po trybie wsadowym).
+"""
+from __future__ import annotations
+
+import bisect
+import os
+import threading
+import weakref
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+from typing import Callable, Iterable, Optional
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+# Przedziały histogramów: czasy (s) od milisekund do limitu zapytania API, rozmiary (B) od 1 kB do 16 MB
+TIME_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 25.0, 60.0)
+BYTE_BUCKETS = tuple(1024 * 4 ** i for i in range(8))
+
+
+class _Metric:
+    kind = ""
+
+    def __init__(self, name: str, help_text: str, labelnames: tuple[str, ...] = ()) -> None:
+        self.name = name
+        self.help = help_text
+        self.labelnames = tuple(labelnames)
+        self._lock = threading.Lock()
+
+    def _key(self, labels: dict) -> tuple[str, ...]:
+        if set(labels) != set(self.labelnames):
+            raise ValueError(f"Metryka {self.name} wymaga etykiet {self.labelnames}, podano {tuple(labels)}.")
+        return tuple(str(labels[n]) for n in self.labelnames)
+
+    def _labels(self, key: tuple[str, ...], extra: str = "") -> str:
+        pairs = [f'{n}="{_escape(v)}"' for n, v in zip(self.labelnames, key)]
+        if extra:
+            pairs.append(extra)
+        return "{" + ",".join(pairs) + "}" if pairs else ""
+
+    def samples(self) -> list[str]:
+        raise NotImplementedError
+
+
+class Counter(_Metric):
+    """Licznik rosnący, osobno dla każdej kombinacji etykiet."""
+
+    kind = "counter"
+
+    def __init__(self, name: str, help_text: str, labelnames: tuple[str, ...] = ()) -> None:
+        super().__init__(name, help_text, labelnames)
+        self._values: dict[tuple[str, ...], float] = {}
+
+    def inc(self, amount: float = 1.0, **labels) -> None:
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0.0) + amount
+
+    def value(self, **labels) -> float:
+        with self._lock:
+            return self._values.get(self._key(labels), 0.0)
+
+    def samples(self) -> list[str]:
+        with self._lock:
+            items = sorted(self._values.items())
+        return [f"{self.name}{self._labels(k)} {_number(v)}" for k, v in items]
+
+
+class Histogram(_Metric):
+    """Histogram z przedziałami narastającymi (le), sumą i liczbą obserwacji."""
+
+    kind = "histogram"
+
+    def __init__(
+        self, name: str, help_text: str, labelnames: tuple[str, ...] = (), buckets: Iterable[float] = TIME_BUCKETS
+    ) -> None:
+        super().__init__(name, help_text, labelnames)
+        self.buckets = tuple(sorted(buckets))
+        self._values: dict[tuple[str, ...], list] = {}  # [liczniki przedziałów (+Inf na końcu), suma]
+
+    def observe(self, value: float, **labels) -> None:
+        key = self._key(labels)
+        i = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            entry = self._values.get(key)
+            if entry is None:
+                entry = self._values[key] = [[0] * (len(self.buckets) + 1), 0.0]
+            entry[0][i] += 1
+            entry[1] += value
+
+    def count(self, **labels) -> int:
+        with self._lock:
+            entry = self._values.get(self._key(labels))
+            return sum(entry[0]) if entry else 0
+
+    def samples(self) -> list[str]:
+        with self._lock:
+            items = sorted((k, (list(v[0]), v[1])) for k, v in self._values.items())
+        out = []
+        for key, (counts, total) in items:
+            cumulative = 0
+            for bound, n in zip((*self.buckets, float("inf")), counts):
+                cumulative += n
+                le = "+Inf" if bound == float("inf") else _number(bound)
+                labels = self._labels(key, 'le="%s"' % le)
+                out.append(f"{self.name}_bucket{labels} {cumulative}")
+            out.append(f"{self.name}_sum{self._labels(key)} {_number(total)}")
+            out.append(f"{self.name}_count{self._labels(key)} {cumulative}")
+        return out
+
+
+class Registry:
+    """Zbiór metryk procesu i funkcji dopisujących wartości chwilowe (np. statystyki cache)."""
+
+    def __init__(self) -> None:
+        self._metrics: dict[str, _Metric] = {}
+        self._collectors: list[Callable[[], list[str]]] = []
+        self._lock = threading.Lock()
+
+    def counter(self, name: str, help_text: str, labelnames: tuple[str, ...] = ()) -> Counter:
+        return self._add(Counter(name, help_text, labelnames))
+
+    def histogram(
+        self, name: str, help_text: str, labelnames: tuple[str, ...] = (), buckets: Iterable[float] = TIME_BUCKETS
+    ) -> Histogram:
+        return self._add(Histogram(name, help_text, labelnames, buckets))
+
+    def add_collector(self, collect: Callable[[], list[str]]) -> None:
+        """collect() zwraca gotowe linie formatu tekstowego (z # HELP / # TYPE) — wywoływane przy każdym odczycie."""
+        with self._lock:
+            self._collectors.append(collect)
+
+    def render(self) -> str:
+        """Wszystkie metryki w formacie tekstowym Prometheusa."""
+        with self._lock:
+            metrics = list(self._metrics.values())
+            collectors = list(self._collectors)
+        lines = []
+        for metric in metrics:
+            lines.append(f"# HELP {metric.name} {metric.help}")
+            lines.append(f"# TYPE {metric.name} {metric.kind}")
+            lines.extend(metric.samples())
+        for collect in collectors:
+            try:
+                lines.extend(collect())
+            except Exception as e:  # metryki nie mogą psuć odczytu pozostałych
+                lines.append(f"# collector error: {type(e).__name__}: {e}")
+        return "\n".join(lines) + "\n"
+
+    def _add(self, metric):
+        with self._lock:
+            if metric.name in self._metrics:
+                raise ValueError(f"Metryka {metric.name} już istnieje.")
+            self._metrics[metric.name] = metric
+        return metric
+
+
+REGISTRY = Registry()
+
+WORKSHEETS = REGISTRY.counter(
+    "friendly_math_worksheets_total", "Wygenerowane karty pracy.", ("profile", "topic")
+)
+WORKSHEET_SECONDS = REGISTRY.histogram(
+    "friendly_math_worksheet_seconds", "Czas generowania całej karty.", ("profile",)
+)
+STAGE_SECONDS = REGISTRY.histogram(
+    "friendly_math_stage_seconds", "Czas etapu pipeline (łącznie z oczekiwaniem na API).", ("stage",)
+)
+STAGE_CACHE = REGISTRY.counter(
+    "friendly_math_stage_cache_total", "Wyniki etapów z cache (hit) i liczone od nowa (miss).", ("stage", "result")
+)
+FALLBACKS = REGISTRY.counter(
+    "friendly_math_fallbacks_total",
+    "Wyniki zastępcze: zadania/layout bez API (błąd, timeout, brak budżetu), karty bez ilustracji.",
+    ("stage",),
+)
+API_SECONDS = REGISTRY.histogram(
+    "friendly_math_api_request_seconds", "Czas zapytania chat completion (bez kolejki harmonogramu).", ("model",)
+)
+API_ERRORS = REGISTRY.counter(
+    "friendly_math_api_errors_total", "Nieudane zapytania API (status HTTP albo typ wyjątku).", ("model", "status")
+)
+API_TOKENS = REGISTRY.counter(
+    "friendly_math_api_tokens_total", "Tokeny zużyte w zapytaniach API.", ("model", "type")
+)
+PDF_BYTES = REGISTRY.histogram(
+    "friendly_math_pdf_bytes", "Rozmiar zbudowanego PDF.", (), buckets=BYTE_BUCKETS
+)
+IMAGE_BYTES = REGISTRY.histogram(
+    "friendly_math_image_bytes", "Rozmiar ilustracji PNG.", ("kind",), buckets=BYTE_BUCKETS
+)
+
+
+_caches: list[list] = []  # [nazwa, słaba referencja, ostatnie liczniki {hits, misses}]
+_retired: dict[str, dict[str, float]] = {}  # liczniki usuniętych cache (licznik Prometheusa nie może maleć)
+_caches_lock = threading.Lock()
+_COUNTER_FIELDS = ("hits", "misses")
+
+
+def register_cache(name: str, cache) -> None:
+    """
+    Dopisuje do metryk statystyki cache (obiekt z metodą stats() jak LRUCache: hits, misses, entries, bytes).
+    Cache trzymany przez słabą referencję — po usunięciu obiektu znika z metryk. Kilka cache o tej samej
+    nazwie (np. cache etapów każdej sesji Streamlit) jest sumowanych; trafienia i chybienia usuniętego cache
+    (ostatni odczyt) zostają w sumie, więc liczniki *_total nie maleją.
+    """
+    with _caches_lock:
+        _caches.append([name, weakref.ref(cache), {}])
+
+
+def _collect_caches() -> list[str]:
+    totals: dict[str, dict[str, float]] = {}
+    with _caches_lock:
+        alive = []
+        for entry in _caches:
+            name, ref, last = entry
+            cache = ref()
+            if cache is None:
+                retired = _retired.setdefault(name, {})
+                for field, value in last.items():
+                    retired[field] = retired.get(field, 0) + value
+                continue
+            alive.append(entry)
+            stats = cache.stats()
+            entry[2] = {field: stats[field] for field in _COUNTER_FIELDS if field in stats}
+            summed = totals.setdefault(name, {})
+            for field, value in stats.items():
+                summed[field] = summed.get(field, 0) + value
+        _caches[:] = alive
+        for name, retired in _retired.items():
+            summed = totals.setdefault(name, {})
+            for field, value in retired.items():
+                summed[field] = summed.get(field, 0) + value
+    out = []
+    for field, kind in (("hits", "counter"), ("misses", "counter"), ("entries", "gauge"), ("bytes", "gauge")):
+        metric = f"friendly_math_cache_{field}" + ("_total" if kind == "counter" else "")
+        values = [(name, summed[field]) for name, summed in sorted(totals.items()) if field in summed]
+        if values:
+            out.append(f"# HELP {metric} Cache {field} (LRUCache.stats()).")
+            out.append(f"# TYPE {metric} {kind}")
+            out.extend(f'{metric}{{cache="{_escape(name)}"}} {_number(v)}' for name, v in values)
+    return out
+
+
+REGISTRY.add_collector(_collect_caches)
+
+
+def write_textfile(path: Path) -> None:
+    """Zapisuje metryki do pliku (atomowo) — np. dla kolektora textfile node_exportera."""
+    from app.pdf.store import write_atomic
+
+    write_atomic(Path(path), REGISTRY.render().encode("utf-8"))
+
+
+class _MetricsHandler(BaseHTTPRequestHandler):
+    def do_GET(self) -> None:
+        if self.path.split("?")[0].rstrip("/") not in ("", "/metrics"):
+            self.send_error(404)
+            return
+        body = REGISTRY.render().encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", CONTENT_TYPE)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format: str, *args) -> None:  # noqa: A002 — sygnatura z BaseHTTPRequestHandler
+        pass
+
+
+def start_http_server(port: int, host: str = "127.0.0.1") -> ThreadingHTTPServer:
+    """Mały serwer GET /metrics w wątku w tle (np. obok Streamlit)."""
+    httpd = ThreadingHTTPServer((host, port), _MetricsHandler)
+    httpd.daemon_threads = True
+    threading.Thread(target=httpd.serve_forever, name="fm-metrics", daemon=True).start()
+    return httpd
+
+
+def port_from_env() -> Optional[int]:
+    """FRIENDLY_MATH_METRICS_PORT — port serwera metryk (brak lub 0 — wyłączony)."""
+    try:
+        return int(os.getenv("FRIENDLY_MATH_METRICS_PORT", "") or 0) or None
+    except ValueError:
+        return None
+
+
+def _escape(value: str) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _number(value: float) -> str:
+    return str(int(value)) if float(value).is_integer() else repr(float(value))
@@ -0,0 +1,319 @@
+"""
+v2: Szybka ścieżka PDF dla kart bez grafik — strumienie treści pisane wprost, bez reportlab.pdfgen.
+FastCanvas ma te metody canvas reportlab, których używa build_worksheet_pdf_bytes (setFont, drawString,
+drawRightString, stringWidth, kolory, line, rect, showPage, save), więc układ strony liczy ten sam kod,
+a szerokości tekstu pochodzą z tych samych metryk DejaVuSans.
+Czcionka osadzana jako jeden podzbiór przygotowany raz na proces (ASCII, polskie litery, znaki matematyczne;
+bez tabeli name i hintingu), obiekty czcionki i katalogu serializowane raz jako gotowe bajty.
+Znak spoza podzbioru, grafika lub inna czcionka → FastPathUnsupported; wywołujący buduje PDF przez reportlab.
+"""
+from __future__ import annotations
+
+import os
+import struct
+import threading
+import zlib
+from dataclasses import dataclass
+from pathlib import Path
+from typing import BinaryIO, Optional
+
+from app.tracing import span
+
+# A4 jak reportlab.lib.pagesizes.A4 (pt)
+PAGE_WIDTH = 595.2755905511812
+PAGE_HEIGHT = 841.8897637795277
+
+# Znaki podzbioru poza ASCII 32–126 (te mają własne kody); kody 1–31 i 127–255 w tej kolejności
+_EXTRA_CHARS = (
+    "ąćęłńóśźżĄĆĘŁŃÓŚŹŻ"
+    "−×÷·–—„”“‚‘’…°¹²³½¼¾⅓⅔⅛⁄•≈≠≤≥±√π∞€‰′″«»§"
+    "✓✔→←↑↓■□●○★☆♥"
+    "äöüÄÖÜßéèêëÉáàâÁíìîÍúùûÚçÇñÑýÝőű"
+    "\u00a0"  # twarda spacja
+)
+_SUBSET_TAG = "FMFAST"  # prefiks nazwy podzbioru (6 wielkich liter, PDF 9.6.4)
+# Tabele zbędne w osadzonym podzbiorze: nazwy czcionki (~15 KB) i programy hintingu (instrukcje glifów usuwane)
+_DROP_TABLES = (b"name", b"fpgm", b"prep", b"cvt ")
+_FIXED_OBJECTS = 6  # 1 katalog, 2 strony (zmienne), 3 czcionka, 4 deskryptor, 5 FontFile2, 6 ToUnicode
+_COMPRESS_MIN = 256  # krótszych strumieni treści nie kompresujemy
+
+
+class FastPathUnsupported(Exception):
+    """Treść, której szybka ścieżka nie obsługuje (wywołujący buduje PDF przez reportlab)."""
+
+
+def fast_pdf_enabled() -> bool:
+    """FRIENDLY_MATH_FAST_PDF=0 wyłącza szybką ścieżkę (domyślnie włączona)."""
+    return os.getenv("FRIENDLY_MATH_FAST_PDF", "1").strip().lower() not in ("0", "false", "no", "nie")
+
+
+@dataclass(frozen=True)
+class _Font:
+    """Podzbiór czcionki przygotowany raz na proces: kody znaków, szerokości i gotowe obiekty 3–6."""
+    font_name: str
+    escapes: dict  # znak → fragment łańcucha PDF (ASCII lub \\ooo)
+    widths: dict  # znak → szerokość na 1000 jednostek (jak TTFont.stringWidth)
+    objects: bytes  # obiekty 3–6 (czcionka, deskryptor, FontFile2, ToUnicode)
+    offsets: tuple  # przesunięcia obiektów 3–6 względem początku `objects`
+
+
+_font: Optional[_Font] = None
+_font_lock = threading.Lock()
+
+
+def load_font(font_name: str, font_path: Path) -> _Font:
+    """Podzbiór czcionki dla szybkiej ścieżki (raz na proces; FastPathUnsupported, gdy brak pliku)."""
+    global _font
+    if _font is not None and _font.font_name == font_name:
+        return _font
+    with _font_lock:
+        if _font is None or _font.font_name != font_name:
+            if not Path(font_path).exists():
+                raise FastPathUnsupported(f"Brak pliku czcionki: {font_path}")
+            with span("pdf.fast_font"):
+                _font = _build_font(font_name, Path(font_path))
+    return _font
+
+
+def _build_font(font_name: str, font_path: Path) -> _Font:
+    from reportlab.pdfbase.ttfonts import TTFontFile, makeToUnicodeCMap  # pyright: ignore[reportMissingModuleSource]
+
+    face = TTFontFile(str(font_path))
+    subset = [0] * 256
+    for code in range(32, 127):
+        subset[code] = code
+    free = [c for c in range(1, 256) if not 32 <= c < 127]
+    extras = [ch for ch in dict.fromkeys(_EXTRA_CHARS) if ord(ch) > 126 and ord(ch) in face.charToGlyph]
+    for code, ch in zip(free, extras):
+        subset[code] = ord(ch)
+    last = max(c for c, u in enumerate(subset) if u)
+    subset = subset[: last + 1]
+
+    escapes, widths = {}, {}
+    for code, uni in enumerate(subset):
+        if not uni:
+            continue
+        ch = chr(uni)
+        if ch in "()\\":
+            escapes[ch] = "\\" + ch
+        elif 32 <= code < 127:
+            escapes[ch] = ch
+        else:
+            escapes[ch] = f"\\{code:03o}"
+        widths[ch] = face.charWidths.get(uni, face.defaultWidth)
+
+    base_name = f"{_SUBSET_TAG}+{face.name.decode('latin-1')}"
+    font_file = _strip_tables(face.makeSubset(subset), _DROP_TABLES)
+    flags = (face.flags & ~(1 << 5)) | (1 << 2)  # symboliczna (własne kody), jak podzbiory reportlab
+    pdf_widths = " ".join(_num(face.charWidths.get(u, face.defaultWidth) if u else face.defaultWidth) for u in subset)
+    objects = [
+        f"<< /Type /Font /Subtype /TrueType /Name /F1 /BaseFont /{base_name} /FirstChar 0 /LastChar {len(subset) - 1} "
+        f"/Widths [{pdf_widths}] /FontDescriptor 4 0 R /ToUnicode 6 0 R >>".encode("latin-1"),
+        (
+            f"<< /Type /FontDescriptor /FontName /{base_name} /Flags {flags} "
+            f"/FontBBox [{' '.join(_num(v) for v in face.bbox)}] /ItalicAngle {_num(face.italicAngle)} "
+            f"/Ascent {_num(face.ascent)} /Descent {_num(face.descent)} /CapHeight {_num(face.capHeight)} "
+            f"/StemV {_num(face.stemV)} /MissingWidth {_num(face.defaultWidth)} /FontFile2 5 0 R >>"
+        ).encode("latin-1"),
+        _stream(font_file, compress=True, extra=f"/Length1 {len(font_file)}"),
+        _stream(makeToUnicodeCMap(base_name, subset).encode("latin-1"), compress=True),
+    ]
+    out, offsets = bytearray(), []
+    for number, body in enumerate(objects, start=3):
+        offsets.append(len(out))
+        out += b"%d 0 obj\n" % number + body + b"\nendobj\n"
+    return _Font(font_name, escapes, widths, bytes(out), tuple(offsets))
+
+
+def _strip_tables(ttf: bytes, drop: tuple) -> bytes:
+    """
+    Plik TrueType bez wskazanych tabel i bez instrukcji hintingu w glifach (przy osadzaniu w PDF przeglądarki
+    rasteryzują bez nich; instrukcje to ~połowa tabeli glyf). Katalog tabel, loca i sumy kontrolne przeliczone.
+    """
+    num_tables = struct.unpack(">H", ttf[4:6])[0]
+    tables = {}
+    for i in range(num_tables):
+        tag, _, offset, length = struct.unpack(">4sIII", ttf[12 + 16 * i: 28 + 16 * i])
+        if tag not in drop:
+            tables[tag] = ttf[offset: offset + length]
+    if b"glyf" in tables and b"loca" in tables:
+        long_loca = struct.unpack(">h", tables[b"head"][50:52])[0] == 1
+        tables[b"glyf"], tables[b"loca"] = _strip_instructions(tables[b"glyf"], tables[b"loca"], long_loca)
+    count = len(tables)
+    entry_selector = max(count.bit_length() - 1, 0)
+    search_range = (1 << entry_selector) * 16
+    header = ttf[:4] + struct.pack(">HHHH", count, search_range, entry_selector, count * 16 - search_range)
+    offset = 12 + 16 * count
+    directory, data = bytearray(), bytearray()
+    for tag, body in tables.items():
+        padded = body + b"\0" * (-len(body) % 4)
+        checksum = sum(struct.unpack(f">{len(padded) // 4}I", padded)) & 0xFFFFFFFF
+        directory += struct.pack(">4sIII", tag, checksum, offset + len(data), len(body))
+        data += padded
+    return bytes(header + directory + data)
+
+
+def _strip_instructions(glyf: bytes, loca: bytes, long_loca: bool) -> tuple[bytes, bytes]:
+    """Tabele glyf i loca z zerową długością instrukcji w każdym glifie (kontury bez zmian)."""
+    if long_loca:
+        starts = struct.unpack(f">{len(loca) // 4}I", loca)
+    else:
+        starts = [v * 2 for v in struct.unpack(f">{len(loca) // 2}H", loca)]
+    out, new_starts = bytearray(), [0]
+    for start, end in zip(starts, starts[1:]):
+        glyph = glyf[start:end]
+        if glyph:
+            contours = struct.unpack(">h", glyph[:2])[0]
+            if contours >= 0:
+                at = 10 + 2 * contours
+                skip = struct.unpack(">H", glyph[at: at + 2])[0]
+                glyph = glyph[:at] + b"\0\0" + glyph[at + 2 + skip:]
+            else:
+                glyph = _strip_composite(glyph)
+            glyph += b"\0" * (-len(glyph) % 4)
+        out += glyph
+        new_starts.append(len(out))
+    if long_loca:
+        new_loca = struct.pack(f">{len(new_starts)}I", *new_starts)
+    else:
+        new_loca = struct.pack(f">{len(new_starts)}H", *(v // 2 for v in new_starts))
+    return bytes(out), new_loca
+
+
+def _strip_composite(glyph: bytes) -> bytes:
+    """Glif złożony bez instrukcji po komponentach (flaga WE_HAVE_INSTRUCTIONS zdjęta)."""
+    glyph = bytearray(glyph)
+    at = 10
+    while True:
+        flags = struct.unpack(">H", glyph[at: at + 2])[0]
+        struct.pack_into(">H", glyph, at, flags & ~0x0100)
+        at += 4 + (4 if flags & 0x0001 else 2)
+        at += 2 if flags & 0x0008 else (4 if flags & 0x0040 else (8 if flags & 0x0080 else 0))
+        if not flags & 0x0020:
+            return bytes(glyph[:at])
+
+
+class FastCanvas:
+    """
+    Zamiennik reportlab.pdfgen.canvas.Canvas dla tekstu, linii i prostokątów (jedna czcionka TTF).
+    Stan graficzny (kolory, grubość linii, czcionka) jak w reportlab: zerowany na każdej nowej stronie.
+    """
+
+    def __init__(self, buffer: BinaryIO, font: _Font, pagesize: tuple = (PAGE_WIDTH, PAGE_HEIGHT)) -> None:
+        self._buffer = buffer
+        self._font = font
+        self._width, self._height = pagesize
+        self._pages: list[bytes] = []
+        self._ops: list[str] = []
+        self._size: Optional[float] = None
+        self._title = ""
+
+    def setTitle(self, title: str) -> None:
+        self._title = title
+
+    def setFont(self, font_name: str, size: float) -> None:
+        if font_name != self._font.font_name:
+            raise FastPathUnsupported(f"Czcionka {font_name} poza szybką ścieżką.")
+        self._size = size
+
+    def stringWidth(self, text: str, font_name: Optional[str] = None, size: Optional[float] = None) -> float:
+        widths = self._font.widths
+        try:
+            return sum(widths[ch] for ch in text) * 0.001 * (size if size is not None else self._size)
+        except KeyError as e:
+            raise FastPathUnsupported(f"Znak {e.args[0]!r} poza podzbiorem czcionki.") from None
+
+    def drawString(self, x: float, y: float, text: str) -> None:
+        if self._size is None:
+            raise FastPathUnsupported("Tekst bez wybranej czcionki.")
+        escapes = self._font.escapes
+        try:
+            encoded = "".join([escapes[ch] for ch in text])
+        except KeyError as e:
+            raise FastPathUnsupported(f"Znak {e.args[0]!r} poza podzbiorem czcionki.") from None
+        self._ops.append(f"BT /F1 {_num(self._size)} Tf {_num(x)} {_num(y)} Td ({encoded}) Tj ET")
+
+    def drawRightString(self, x: float, y: float, text: str) -> None:
+        self.drawString(x - self.stringWidth(text), y, text)
+
+    def setFillColor(self, color) -> None:
+        self._ops.append(f"{_num(color.red)} {_num(color.green)} {_num(color.blue)} rg")
+
+    def setStrokeColor(self, color) -> None:
+        self._ops.append(f"{_num(color.red)} {_num(color.green)} {_num(color.blue)} RG")
+
+    def setLineWidth(self, width: float) -> None:
+        self._ops.append(f"{_num(width)} w")
+
+    def line(self, x1: float, y1: float, x2: float, y2: float) -> None:
+        self._ops.append(f"{_num(x1)} {_num(y1)} m {_num(x2)} {_num(y2)} l S")
+
+    def rect(self, x: float, y: float, width: float, height: float, stroke: int = 1, fill: int = 0) -> None:
+        op = "B" if stroke and fill else ("f" if fill else ("S" if stroke else "n"))
+        self._ops.append(f"{_num(x)} {_num(y)} {_num(width)} {_num(height)} re {op}")
+
+    def drawImage(self, *args, **kwargs) -> None:
+        raise FastPathUnsupported("Grafiki poza szybką ścieżką.")
+
+    def showPage(self) -> None:
+        self._pages.append("\n".join(self._ops).encode("latin-1"))
+        self._ops = []
+        self._size = None
+
+    def save(self) -> None:
+        if self._ops:
+            self.showPage()
+        self._buffer.write(self._document())
+
+    def _document(self) -> bytes:
+        font = self._font
+        out = bytearray(b"%PDF-1.4\n%\xe2\xe3\xcf\xd3\n")
+        n_pages = len(self._pages)
+        first_page = _FIXED_OBJECTS + 1
+        info = first_page + 2 * n_pages
+        offsets = [0] * (info + 1)
+
+        offsets[1] = len(out)
+        out += b"1 0 obj\n<< /Type /Catalog /Pages 2 0 R >>\nendobj\n"
+        offsets[2] = len(out)
+        kids = " ".join(f"{first_page + 2 * i} 0 R" for i in range(n_pages))
+        out += f"2 0 obj\n<< /Type /Pages /Kids [{kids}] /Count {n_pages} >>\nendobj\n".encode("latin-1")
+        base = len(out)
+        for i, offset in enumerate(font.offsets):
+            offsets[3 + i] = base + offset
+        out += font.objects
+
+        media_box = f"[0 0 {_num(self._width)} {_num(self._height)}]"
+        for i, content in enumerate(self._pages):
+            page, stream = first_page + 2 * i, first_page + 2 * i + 1
+            offsets[page] = len(out)
+            out += (
+                f"{page} 0 obj\n<< /Type /Page /Parent 2 0 R /MediaBox {media_box} "
+                f"/Resources << /Font << /F1 3 0 R >> >> /Contents {stream} 0 R >>\nendobj\n"
+            ).encode("latin-1")
+            offsets[stream] = len(out)
+            out += b"%d 0 obj\n" % stream + _stream(content, compress=len(content) >= _COMPRESS_MIN) + b"\nendobj\n"
+
+        offsets[info] = len(out)
+        title = (b"\xfe\xff" + self._title.encode("utf-16-be")).hex().upper()
+        out += f"{info} 0 obj\n<< /Title <{title}> /Producer (Friendly Math) >>\nendobj\n".encode("latin-1")
+
+        xref = len(out)
+        out += f"xref\n0 {info + 1}\n0000000000 65535 f \n".encode("latin-1")
+        out += "".join(f"{offset:010d} 00000 n \n" for offset in offsets[1:]).encode("latin-1")
+        out += f"trailer\n<< /Size {info + 1} /Root 1 0 R /Info {info} 0 R >>\nstartxref\n{xref}\n%%EOF\n".encode("latin-1")
+        return bytes(out)
+
+
+def _stream(data: bytes, compress: bool, extra: str = "") -> bytes:
+    if compress:
+        data = zlib.compress(data, 6)
+    filters = " /Filter /FlateDecode" if compress else ""
+    head = f"<< /Length {len(data)}{filters}{' ' + extra if extra else ''} >>\nstream\n".encode("latin-1")
+    return head + data + b"\nendstream"
+
+
+def _num(value: float) -> str:
+    """Liczba w PDF: do 3 miejsc po przecinku, bez zbędnych zer (jak fp_str w reportlab)."""
+    text = f"{value:.3f}".rstrip("0").rstrip(".")
+    return "0" if text in ("", "-0") else text
@@ -7,12 +7,11 @@ from typing import Iterable, Optional
 
 import re
 
-from reportlab.lib.pagesizes import A4  # pyright: ignore[reportMissingModuleSource]
-from reportlab.lib.colors import HexColor  # pyright: ignore[reportMissingModuleSource]
-from reportlab.lib.utils import ImageReader  # pyright: ignore[reportMissingModuleSource]
-from reportlab.pdfbase import pdfmetrics  # pyright: ignore[reportMissingModuleSource]
-from reportlab.pdfbase.ttfonts import TTFont  # pyright: ignore[reportMissingModuleSource]
-from reportlab.pdfgen import canvas  # pyright: ignore[reportMissingModuleSource]
+# v2: reportlab (import ~0,1 s) ładowany w funkcjach przy pierwszej budowie PDF, nie przy starcie aplikacji
+
+from app.metrics import PDF_BYTES
+from app.pdf.fastpdf import PAGE_HEIGHT, PAGE_WIDTH, FastCanvas, FastPathUnsupported, fast_pdf_enabled, load_font
+from app.tracing import traced
 
 
 @dataclass(frozen=True)
@@ -26,14 +25,24 @@ class WorksheetMeta:
 # Używamy jednej czcionki z polskimi znakami
 _FONT_NAME = "DejaVuSans"
 _FONT_PATH = Path("assets/fonts/DejaVuSans.ttf")
+# v2: czcionka rejestrowana raz na proces (parsowanie TTF ~0,1 s przy każdej karcie)
+_registered_fonts: Optional[tuple[str, str]] = None
 
 
+@traced("pdf.register_font")
 def _register_font() -> tuple[str, str]:
     """
     Rejestruje czcionkę TTF z polskimi znakami.
     Zwraca tuple (font_name, font_bold_name) do użycia w setFont().
     Fallback do Helvetica jeśli plik nie istnieje.
+    v2: wynik zapamiętany — kolejne karty nie rejestrują czcionki ponownie.
     """
+    global _registered_fonts
+    if _registered_fonts is not None:
+        return _registered_fonts
+    from reportlab.pdfbase import pdfmetrics  # pyright: ignore[reportMissingModuleSource]
+    from reportlab.pdfbase.ttfonts import TTFont  # pyright: ignore[reportMissingModuleSource]
+
     base_font = "Helvetica"
     bold_font = "Helvetica-Bold"
 
@@ -52,7 +61,8 @@ def _register_font() -> tuple[str, str]:
     except Exception as e:
         print(f"⚠️ Error registering font: {e}. Using Helvetica fallback.")
 
-    return base_font, bold_font
+    _registered_fonts = (base_font, bold_font)
+    return _registered_fonts
 
 
 def _default_layout() -> dict:
@@ -102,6 +112,8 @@ _TASK_IMAGE_ASPECT = 100 / 480  # height/width
 def _draw_page_background(canvas_obj, width: float, height: float, bg_color: str) -> None:
     """Rysuje tło strony jeśli nie jest białe (Day 9)."""
     if bg_color.upper() not in ("#FFFFFF", "WHITE", "#FFF"):
+        from reportlab.lib.colors import HexColor  # pyright: ignore[reportMissingModuleSource]
+
         try:
             canvas_obj.setFillColor(HexColor(bg_color))
             canvas_obj.rect(0, 0, width, height, fill=1, stroke=0)
@@ -111,6 +123,8 @@ def _draw_page_background(canvas_obj, width: float, height: float, bg_color: str
 
 def _draw_footer(canvas_obj, width: float, margin: float, page_num: int, font_name: str, text_color: str) -> None:
     """Rysuje stopkę z numerem strony na dole (Day 9)."""
+    from reportlab.lib.colors import HexColor  # pyright: ignore[reportMissingModuleSource]
+
     try:
         canvas_obj.setFillColor(HexColor(text_color))
         canvas_obj.setFont(font_name, 8)
@@ -120,6 +134,7 @@ def _draw_footer(canvas_obj, width: float, margin: float, page_num: int, font_na
         pass
 
 
+@traced("pdf.build")
 def build_worksheet_pdf_bytes(
     meta: WorksheetMeta,
     tasks: Iterable[str],
@@ -134,7 +149,48 @@ def build_worksheet_pdf_bytes(
     - image_bytes: jedna ilustracja pod metadanymi (gdy task_images nie jest podane).
     - answers: lista odpowiedzi (ta sama długość co tasks); jeśli podana, dodawana jest strona "Odpowiedzi".
     Zwraca bytes (łatwe do zapisu i do Streamlit download).
+    v2: karty bez grafik budowane szybką ścieżką (app/pdf/fastpdf.py: strumienie treści wprost, czcionka
+    przygotowana raz na proces) — ten sam układ strony; gdy treści nie da się tak zapisać (znak spoza
+    podzbioru czcionki, brak pliku czcionki) albo FRIENDLY_MATH_FAST_PDF=0 — reportlab jak dotąd.
     """
+    tasks_list = list(tasks)
+    pdf_bytes = None
+    if not image_bytes and not any(task_images or ()) and fast_pdf_enabled():
+        try:
+            font = load_font(_FONT_NAME, _FONT_PATH)
+            buffer = BytesIO()
+            c = FastCanvas(buffer, font)
+            _draw_worksheet(c, (PAGE_WIDTH, PAGE_HEIGHT), meta, tasks_list, layout, None, None, answers,
+                            (_FONT_NAME, _FONT_NAME))
+            pdf_bytes = buffer.getvalue()
+        except FastPathUnsupported:
+            pdf_bytes = None
+    if pdf_bytes is None:
+        from reportlab.lib.pagesizes import A4  # pyright: ignore[reportMissingModuleSource]
+        from reportlab.pdfgen import canvas  # pyright: ignore[reportMissingModuleSource]
+
+        buffer = BytesIO()
+        c = canvas.Canvas(buffer, pagesize=A4)
+        _draw_worksheet(c, A4, meta, tasks_list, layout, image_bytes, task_images, answers, _register_font())
+        pdf_bytes = buffer.getvalue()
+    PDF_BYTES.observe(len(pdf_bytes))
+    return pdf_bytes
+
+
+def _draw_worksheet(
+    c,
+    pagesize: tuple[float, float],
+    meta: WorksheetMeta,
+    tasks_list: list[str],
+    layout: Optional[dict],
+    image_bytes: Optional[bytes],
+    task_images: Optional[list],
+    answers: Optional[list[str]],
+    fonts: tuple[str, str],
+) -> None:
+    """v2: Układ i rysowanie karty na canvas reportlab albo FastCanvas (ten sam kod dla obu ścieżek)."""
+    from reportlab.lib.colors import HexColor  # pyright: ignore[reportMissingModuleSource]
+
     L = _default_layout()
     if layout:
         for k, v in layout.items():
@@ -144,11 +200,8 @@ def build_worksheet_pdf_bytes(
     if meta.student_profile in ["dyskalkulia", "ADHD", "trudności w nauce"]:
         L.update(_profile_layout(meta.student_profile))
 
-    buffer = BytesIO()
-    c = canvas.Canvas(buffer, pagesize=A4)
-    width, height = A4
-
-    base_font, bold_font = _register_font()
+    width, height = pagesize
+    base_font, bold_font = fonts
     bg_color = L.get("background_color", "#FFFFFF")
 
     # Tło strony (Day 9) – pierwsza strona
@@ -180,9 +233,10 @@ def build_worksheet_pdf_bytes(
     y -= L["metadata_spacing"]
 
     # Ilustracja (Day 8/11): jedna u góry tylko gdy NIE ma ilustracji per zadanie
-    tasks_list = list(tasks)
     if (not task_images or len(task_images) != len(tasks_list)) and image_bytes:
         if image_bytes:
+            from reportlab.lib.utils import ImageReader  # pyright: ignore[reportMissingModuleSource]
+
             try:
                 img_reader = ImageReader(BytesIO(image_bytes))
                 c.drawImage(img_reader, margin, y - _IMAGE_HEIGHT_PT, width=_IMAGE_WIDTH_PT, height=_IMAGE_HEIGHT_PT)
@@ -223,6 +277,8 @@ def build_worksheet_pdf_bytes(
     for i, task in enumerate(tasks_list, start=1):
         # Day 11: ilustracja przy zadaniu (pełna szerokość, bez ucinania)
         if task_images and i <= len(task_images) and task_images[i - 1]:
+            from reportlab.lib.utils import ImageReader  # pyright: ignore[reportMissingModuleSource]
+
             try:
                 img_reader = ImageReader(BytesIO(task_images[i - 1]))
                 c.drawImage(
@@ -279,7 +335,6 @@ def build_worksheet_pdf_bytes(
         c.showPage()
 
     c.save()
-    return buffer.getvalue()
 
 
 def _wrap_text(text: str, max_chars: int) -> list[str]:
@@ -330,8 +385,8 @@ def _draw_fraction(
     """
     frac_size = max(6, font_size * 0.85)
     num_str, den_str = str(num), str(den)
-    w_num = pdfmetrics.stringWidth(num_str, font_name, frac_size)
-    w_den = pdfmetrics.stringWidth(den_str, font_name, frac_size)
+    w_num = c.stringWidth(num_str, font_name, frac_size)
+    w_den = c.stringWidth(den_str, font_name, frac_size)
     frac_width = max(w_num, w_den) + 6
     gap = 1.0  # mały odstęp między kreską a liczbami
     # Kreska na wysokości y (środek ułamka). Licznik tuż nad kreską, mianownik tuż pod.
@@ -362,7 +417,7 @@ def _draw_task_line_with_fractions(
     for seg in segments:
         if seg[0] == "text":
             c.drawString(curr_x, y, seg[1])
-            curr_x += pdfmetrics.stringWidth(seg[1], font_name, font_size)
+            curr_x += c.stringWidth(seg[1], font_name, font_size)
         else:
             curr_x += _draw_fraction(c, curr_x, y, seg[1], seg[2], font_name, font_size)
             c.setFont(font_name, font_size)
\ No newline at end of file
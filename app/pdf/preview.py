@@ -0,0 +1,157 @@
+"""
+v2: Podgląd stron PDF jako PNG — leniwie, z cache i w tle.
+Strona 1 renderowana od razu w niskiej rozdzielczości (miniatura), pozostałe strony
+w pełnej rozdzielczości na puli wątków i oddawane w miarę gotowości. Wyniki w cache LRU
+(klucz: skrót PDF, numer strony, DPI) z limitem bajtów; miniatury i pełne widoki to osobne poziomy DPI.
+"""
+from __future__ import annotations
+
+import contextvars
+import importlib.util
+import threading
+from concurrent.futures import Future, ThreadPoolExecutor, as_completed
+from typing import Iterator, Optional
+
+from app.cache import LRUCache, stable_hash
+from app.tracing import span
+
+THUMBNAIL_DPI = 60
+FULL_DPI = 120
+
+# PyMuPDF nie obsługuje wywołań z wielu wątków naraz — samo renderowanie jest szeregowane,
+# pula wątków zdejmuje je z wątku UI i pozwala oddawać strony po kolei
+_render_lock = threading.Lock()
+
+# v2: PyMuPDF (import ~0,1 s) ładowany przy pierwszym renderowaniu, nie przy starcie aplikacji
+_fitz = None
+_fitz_lock = threading.Lock()
+
+
+def _load_fitz():
+    """Moduł fitz (PyMuPDF) albo None — pip install PyMuPDF, bez niego podgląd jest niedostępny."""
+    global _fitz
+    if _fitz is None:
+        with _fitz_lock:
+            if _fitz is None:
+                try:
+                    import fitz  # type: ignore  # PyMuPDF
+                except ModuleNotFoundError:
+                    fitz = False
+                _fitz = fitz
+    return _fitz or None
+
+
+class PreviewService:
+    """
+    Renderowanie stron PDF do PNG z cache (LRU, max_bytes) i łączeniem równoczesnych próśb
+    o tę samą stronę. Bez PyMuPDF available() == False, a metody zwracają puste wyniki.
+    """
+
+    def __init__(self, max_workers: int = 2, max_entries: int = 256, max_bytes: int = 48 * 1024 * 1024) -> None:
+        self.cache = LRUCache(max_entries=max_entries, max_bytes=max_bytes)
+        self._pool = ThreadPoolExecutor(max_workers=max(1, max_workers), thread_name_prefix="fm-preview")
+        self._inflight: dict[tuple, Future] = {}
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def available() -> bool:
+        return _fitz is not False and importlib.util.find_spec("fitz") is not None
+
+    def page_count(self, pdf_bytes: bytes, pdf_key: Optional[str] = None) -> int:
+        """Liczba stron (z cache); 0, gdy PDF nieczytelny lub brak PyMuPDF."""
+        if _load_fitz() is None:
+            return 0
+        pdf_key = pdf_key or stable_hash(pdf_bytes)
+        with span("preview.page_count"):
+            return self.cache.get_or_compute(("pages", pdf_key), lambda: _page_count(pdf_bytes))
+
+    def render(self, pdf_bytes: bytes, page: int, dpi: int = FULL_DPI, pdf_key: Optional[str] = None) -> Optional[bytes]:
+        """PNG jednej strony (page od 0) — synchronicznie, z cache."""
+        return self.submit(pdf_bytes, page, dpi, pdf_key).result()
+
+    def submit(self, pdf_bytes: bytes, page: int, dpi: int = FULL_DPI, pdf_key: Optional[str] = None) -> Future:
+        """Future z PNG strony; gotowy od razu przy trafieniu w cache, wspólny dla równoczesnych próśb."""
+        pdf_key = pdf_key or stable_hash(pdf_bytes)
+        key = ("page", pdf_key, page, dpi)
+        cached = self.cache.get(key)
+        if cached is not None:
+            done: Future = Future()
+            done.set_result(cached)
+            return done
+        with self._lock:
+            fut = self._inflight.get(key)
+            if fut is None:
+                # Kontekst wywołującego (span nadrzędny) przechodzi do wątku renderującego
+                ctx = contextvars.copy_context()
+                fut = self._pool.submit(ctx.run, self._render_and_store, key, pdf_bytes, page, dpi)
+                self._inflight[key] = fut
+        return fut
+
+    def progressive(
+        self,
+        pdf_bytes: bytes,
+        pdf_key: Optional[str] = None,
+        dpi: int = FULL_DPI,
+        first_dpi: int = THUMBNAIL_DPI,
+    ) -> Iterator[tuple[int, int, bytes]]:
+        """
+        Kolejne (strona, dpi, png) do wyświetlenia: najpierw miniatura strony 1 (chyba że pełna wersja
+        jest już w cache), potem pełne strony w kolejności ukończenia. Strony nieczytelne są pomijane.
+        """
+        pdf_key = pdf_key or stable_hash(pdf_bytes)
+        count = self.page_count(pdf_bytes, pdf_key)
+        if not count:
+            return
+        if first_dpi != dpi and self.cache.get(("page", pdf_key, 0, dpi)) is None:
+            first = self.render(pdf_bytes, 0, first_dpi, pdf_key)
+            if first:
+                yield 0, first_dpi, first
+        futures = {self.submit(pdf_bytes, page, dpi, pdf_key): page for page in range(count)}
+        for fut in as_completed(futures):
+            png = fut.result()
+            if png:
+                yield futures[fut], dpi, png
+
+    def stats(self) -> dict:
+        return self.cache.stats()
+
+    def _render_and_store(self, key: tuple, pdf_bytes: bytes, page: int, dpi: int) -> Optional[bytes]:
+        try:
+            with span("preview.render", page=page + 1, dpi=dpi) as s:
+                png = _render_page(pdf_bytes, page, dpi)
+                s.set(bytes=len(png) if png else 0)
+            if png is not None:
+                self.cache.put(key, png)
+            return png
+        finally:
+            with self._lock:
+                self._inflight.pop(key, None)
+
+
+def _page_count(pdf_bytes: bytes) -> int:
+    fitz = _load_fitz()
+    try:
+        with _render_lock:
+            doc = fitz.open(stream=pdf_bytes, filetype="pdf")
+            try:
+                return doc.page_count
+            finally:
+                doc.close()
+    except Exception:
+        return 0
+
+
+def _render_page(pdf_bytes: bytes, page: int, dpi: int) -> Optional[bytes]:
+    fitz = _load_fitz()
+    if fitz is None:
+        return None
+    try:
+        with _render_lock:
+            doc = fitz.open(stream=pdf_bytes, filetype="pdf")
+            try:
+                return doc[page].get_pixmap(dpi=dpi).tobytes("png")
+            finally:
+                doc.close()
+    except Exception as e:
+        print(f"⚠️ Error rendering PDF preview (page {page + 1}): {e}")
+        return None
@@ -0,0 +1,168 @@
+"""
+v2: Magazyn gotowych PDF adresowany treścią (zamiast jednego pliku data/out/worksheet.pdf).
+Klucz = skrót pełnej specyfikacji karty (metadane, zadania, layout, grafiki, odpowiedzi, seed),
+więc identyczna karta jest podawana prosto z dysku. Zapisy atomowe, indeks metadanych
+w index.sqlite (wspólny dla procesów), najdawniej używane pliki usuwane po przekroczeniu limitu rozmiaru.
+"""
+from __future__ import annotations
+
+import json
+import os
+import sqlite3
+import threading
+import time
+from pathlib import Path
+from typing import Any, Optional
+
+from app.cache import stable_hash
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS entries (
+    key TEXT PRIMARY KEY,
+    size INTEGER NOT NULL,
+    created_at REAL NOT NULL,
+    last_access REAL NOT NULL,
+    info TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS entries_last_access ON entries (last_access);
+"""
+
+
+def write_atomic(path: Path, data: bytes) -> None:
+    """Zapis przez plik tymczasowy + os.replace — czytelnik nigdy nie zobaczy połowy pliku."""
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp = path.with_name(f".{path.name}.{os.getpid()}.{threading.get_ident()}.tmp")
+    with open(tmp, "wb") as f:
+        f.write(data)
+    os.replace(tmp, path)
+
+
+def worksheet_key(
+    meta: Any,
+    tasks: list[str],
+    layout: Optional[dict],
+    image_bytes: Optional[bytes],
+    task_images: Optional[list],
+    answers: Optional[list[str]],
+    seed: int = 0,
+) -> str:
+    """Skrót wszystkiego, co wpływa na wygląd PDF (bajty grafik zastępowane ich skrótem)."""
+    return stable_hash("worksheet-pdf/v1", meta, tasks, layout, image_bytes, task_images, answers is not None, answers, seed)
+
+
+class WorksheetStore:
+    """
+    Katalog root/<2 znaki klucza>/<klucz>.pdf + root/index.sqlite (klucz, rozmiar, utworzenie, ostatni dostęp, info).
+    v2: indeks w SQLite (tryb WAL, jak dziennik wsadu) zamiast index.json w pamięci procesu — kilka procesów
+    (UI, usługa, wsad) dzieli jeden magazyn: każdy zapis i usuwanie najstarszych plików to jedna transakcja
+    na wspólnym indeksie, więc żaden proces nie nadpisuje indeksu innego ani nie usuwa według nieaktualnego widoku.
+    Bezpieczny wątkowo (blokada wokół zapytań) i między procesami (blokady SQLite).
+    """
+
+    def __init__(self, root: Path, max_bytes: int = 512 * 1024 * 1024) -> None:
+        self.root = Path(root)
+        self.root.mkdir(parents=True, exist_ok=True)
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(self.root / "index.sqlite", check_same_thread=False, timeout=30.0)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute("PRAGMA synchronous=NORMAL")
+        self._db.executescript(_SCHEMA)
+        self._import_json_index()
+        self.hits = 0
+        self.misses = 0
+
+    def close(self) -> None:
+        with self._lock:
+            self._db.close()
+
+    def path_for(self, key: str) -> Path:
+        return self.root / key[:2] / f"{key}.pdf"
+
+    def get(self, key: str) -> Optional[bytes]:
+        """Bajty PDF dla klucza albo None (brak lub plik usunięty poza magazynem)."""
+        path = self.path_for(key)
+        try:
+            data = path.read_bytes()
+        except OSError:
+            with self._lock, self._db:
+                self.misses += 1
+                self._db.execute("DELETE FROM entries WHERE key = ?", (key,))
+            return None
+        now = time.time()
+        with self._lock, self._db:
+            self.hits += 1
+            self._db.execute(
+                "INSERT INTO entries (key, size, created_at, last_access, info) VALUES (?, ?, ?, ?, '{}') "
+                "ON CONFLICT(key) DO UPDATE SET last_access = excluded.last_access",
+                (key, len(data), now, now),
+            )
+        return data
+
+    def put(self, key: str, pdf_bytes: bytes, info: Optional[dict] = None) -> Path:
+        """Zapisuje PDF atomowo, aktualizuje indeks i w razie potrzeby usuwa najstarsze pliki (jedna transakcja)."""
+        path = self.path_for(key)
+        write_atomic(path, pdf_bytes)
+        now = time.time()
+        payload = json.dumps(info or {}, ensure_ascii=False, sort_keys=True)
+        with self._lock, self._db:
+            self._db.execute(
+                "INSERT OR REPLACE INTO entries (key, size, created_at, last_access, info) VALUES (?, ?, ?, ?, ?)",
+                (key, len(pdf_bytes), now, now, payload),
+            )
+            self._evict(keep=key)
+        return path
+
+    def total_bytes(self) -> int:
+        with self._lock:
+            return int(self._db.execute("SELECT COALESCE(SUM(size), 0) FROM entries").fetchone()[0])
+
+    def stats(self) -> dict:
+        with self._lock:
+            entries, size = self._db.execute("SELECT COUNT(*), COALESCE(SUM(size), 0) FROM entries").fetchone()
+            total = self.hits + self.misses
+            return {
+                "entries": entries,
+                "bytes": size,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_ratio": (self.hits / total) if total else 0.0,
+            }
+
+    def _evict(self, keep: str) -> None:
+        # Wywoływane w transakcji put(): suma i kolejność z indeksu wspólnego dla wszystkich procesów
+        total = self._db.execute("SELECT COALESCE(SUM(size), 0) FROM entries").fetchone()[0]
+        if total <= self.max_bytes:
+            return
+        rows = self._db.execute("SELECT key, size FROM entries WHERE key != ? ORDER BY last_access", (keep,))
+        evicted = []
+        for key, size in rows:
+            if total <= self.max_bytes:
+                break
+            evicted.append(key)
+            total -= size
+        self._db.executemany("DELETE FROM entries WHERE key = ?", [(key,) for key in evicted])
+        for key in evicted:
+            try:
+                self.path_for(key).unlink()
+            except OSError:
+                pass
+
+    def _import_json_index(self) -> None:
+        """Jednorazowe przeniesienie indeksu index.json (wcześniejszy format magazynu) do SQLite."""
+        legacy = self.root / "index.json"
+        try:
+            data = json.loads(legacy.read_text(encoding="utf-8"))
+        except (OSError, ValueError):
+            return
+        if isinstance(data, dict):
+            rows = [
+                (key, int(e.get("size", 0)), float(e.get("created_at", 0)), float(e.get("last_access", 0)),
+                 json.dumps(e.get("info") or {}, ensure_ascii=False, sort_keys=True))
+                for key, e in data.items() if isinstance(e, dict) and self.path_for(key).exists()
+            ]
+            with self._lock, self._db:
+                self._db.executemany(
+                    "INSERT OR IGNORE INTO entries (key, size, created_at, last_access, info) VALUES (?, ?, ?, ?, ?)", rows
+                )
+        legacy.unlink(missing_ok=True)
@@ -0,0 +1,72 @@
+"""
+v2: Wykonywanie etapów karty pracy współbieżnie (pula wątków).
+Etap startuje, gdy gotowe są wszystkie jego zależności — niezależne etapy (np. zadania i layout)
+biegną równolegle, więc czas całości to ścieżka krytyczna, a nie suma etapów.
+"""
+from __future__ import annotations
+
+import contextvars
+from concurrent.futures import FIRST_COMPLETED, Future, ThreadPoolExecutor, wait
+from dataclasses import dataclass
+from typing import Any, Callable, Iterable
+
+
+@dataclass(frozen=True)
+class Stage:
+    """
+    Jeden etap: func(**wyniki_zależności) -> wynik.
+    Wyniki zależności przekazywane są jako argumenty nazwane (nazwa etapu = nazwa argumentu).
+    """
+    name: str
+    func: Callable[..., Any]
+    deps: tuple[str, ...] = ()
+
+
+class StageError(RuntimeError):
+    """Błąd w jednym z etapów (oryginalny wyjątek w __cause__)."""
+
+    def __init__(self, stage: str, error: BaseException) -> None:
+        super().__init__(f"Etap '{stage}' nie powiódł się: {error}")
+        self.stage = stage
+
+
+def run_stages(stages: Iterable[Stage], max_workers: int = 4) -> dict[str, Any]:
+    """
+    Uruchamia etapy zgodnie z zależnościami i zwraca {nazwa_etapu: wynik}.
+    Wyjątek w etapie przerywa planowanie kolejnych i jest zgłaszany jako StageError.
+    Etapy dziedziczą kontekst wywołującego (contextvars, np. klasę priorytetu API).
+    """
+    stages = list(stages)
+    by_name = {s.name: s for s in stages}
+    if len(by_name) != len(stages):
+        raise ValueError("Nazwy etapów muszą być unikalne.")
+    for s in stages:
+        missing = [d for d in s.deps if d not in by_name]
+        if missing:
+            raise ValueError(f"Etap '{s.name}' zależy od nieznanych etapów: {missing}")
+
+    results: dict[str, Any] = {}
+    pending = [s.name for s in stages]  # kolejność deklaracji = kolejność startu gotowych etapów
+    running: dict[Future, str] = {}
+
+    with ThreadPoolExecutor(max_workers=max(1, max_workers), thread_name_prefix="fm-stage") as pool:
+        while pending or running:
+            for name in [n for n in pending if all(d in results for d in by_name[n].deps)]:
+                pending.remove(name)
+                stage = by_name[name]
+                ctx = contextvars.copy_context()
+                running[pool.submit(ctx.run, stage.func, **{d: results[d] for d in stage.deps})] = name
+            if not running:
+                raise ValueError(f"Cykl zależności między etapami: {pending}")
+
+            done, _ = wait(running, return_when=FIRST_COMPLETED)
+            for fut in done:
+                name = running.pop(fut)
+                try:
+                    results[name] = fut.result()
+                except Exception as e:
+                    for other in running:
+                        other.cancel()
+                    raise StageError(name, e) from e
+
+    return results
@@ -0,0 +1,141 @@
+"""
+v2: Generowanie spekulatywne (opcjonalne) — zadania i layout liczone w tle, zanim nauczyciel kliknie „Generuj kartę”.
+Gdy klasa, temat i profil przestają się zmieniać (settle_s), w tle startuje generowanie zadań (od razu
+dla największej dozwolonej liczby zadań, bo tę nauczyciel zwykle jeszcze zmienia) i layoutu.
+Przy wysłaniu formularza wynik jest użyty, jeśli parametry się zgadzają, a w przeciwnym razie odrzucony.
+Wywołania API w tle mają priorytet „batch” — nie opóźniają zapytań interaktywnych.
+"""
+from __future__ import annotations
+
+import threading
+from concurrent.futures import Executor, Future
+from dataclasses import dataclass, field
+from typing import Optional
+
+from app.ai.layout_generator import generate_layout
+from app.ai.scheduler import api_priority
+from app.ai.text_generator import generate_tasks
+from app.pipeline.executor import Stage, run_stages
+from app.pipeline.worksheet import WorksheetPipeline, WorksheetSpec
+
+# Ile sekund bez zmiany klasy/tematu/profilu, zanim ruszy zapytanie API
+_SETTLE_S = 1.5
+# Czekanie na niedokończoną spekulację przy wysłaniu formularza: najwyżej ta część budżetu karty i nie dłużej niż
+# _CLAIM_WAIT_MAX_S — spekulacja biegnie bez terminu, z priorytetem „batch” i dla max_tasks zadań, więc bywa wolna,
+# a reszta budżetu musi wystarczyć pipeline na własne zapytania (inaczej zadania i layout zastępcze)
+_CLAIM_WAIT_SHARE = 0.2
+_CLAIM_WAIT_MAX_S = 4.0
+
+
+def claim_timeout(deadline) -> float:
+    """Ile sekund claim() może czekać na spekulację w trakcie (Deadline karty albo None — bez budżetu)."""
+    if deadline is None:
+        return _CLAIM_WAIT_MAX_S
+    return max(0.0, min(_CLAIM_WAIT_MAX_S, deadline.remaining() * _CLAIM_WAIT_SHARE))
+
+
+def max_tasks(grade: str) -> int:
+    """Największa liczba zadań dopuszczana przez walidację dla klasy (klasy 1–3: 15)."""
+    return 15 if int(grade) <= 3 else 30
+
+
+@dataclass
+class _Speculation:
+    key: tuple
+    spec: WorksheetSpec
+    future: Optional[Future] = None
+    cancelled: threading.Event = field(default_factory=threading.Event)
+    calling_api: threading.Event = field(default_factory=threading.Event)
+
+
+class Speculator:
+    """
+    Jedna spekulacja na sesję: update(spec) przy każdym rerunie, claim(spec, pipeline) przy wysłaniu formularza.
+    with_tasks=False — tylko layout (np. gdy zadania pochodzą z banku lub szablonów i nie kosztują zapytania).
+    """
+
+    def __init__(self, executor: Executor, settle_s: float = _SETTLE_S) -> None:
+        self._executor = executor
+        self.settle_s = settle_s
+        self._current: Optional[_Speculation] = None
+        self._lock = threading.Lock()
+        self.started = 0
+        self.used = 0
+        self.discarded = 0
+
+    @staticmethod
+    def key(spec: WorksheetSpec) -> tuple:
+        """Parametry, od których zależą zadania (liczba zadań i checkboxy — nie)."""
+        return (spec.student_profile, spec.grade, spec.topic, spec.seed)
+
+    def update(self, spec: WorksheetSpec, with_tasks: bool = True) -> None:
+        """Startuje spekulację dla spec, jeśli kluczowe parametry się zmieniły (poprzednia jest anulowana)."""
+        key = self.key(spec)
+        with self._lock:
+            if self._current is not None and self._current.key == key:
+                return
+            self._discard()
+            speculation = _Speculation(key=key, spec=spec)
+            speculation.future = self._executor.submit(self._run, speculation, with_tasks)
+            self._current = speculation
+            self.started += 1
+
+    def claim(self, spec: WorksheetSpec, pipeline: WorksheetPipeline, timeout: Optional[float] = None) -> bool:
+        """
+        Przy wysłaniu formularza: gdy spekulacja pasuje do spec, wstawia jej wyniki do cache pipeline
+        (run(spec) nie pyta już API) i zwraca True. Spekulacja, która nie zdążyła wysłać zapytania
+        albo dotyczy innych parametrów, jest odrzucana — także taka, która nie skończy się w timeout
+        (claim_timeout(deadline): krótki ułamek budżetu karty).
+        """
+        with self._lock:
+            speculation = self._current
+            if speculation is None:
+                return False
+            if speculation.key != self.key(spec) or not speculation.calling_api.is_set():
+                self._discard()
+                return False
+            self._current = None
+        try:
+            result = speculation.future.result(timeout=timeout)
+        except Exception:
+            result = None  # nie zdążyła w budżecie — pipeline zapyta API sam
+        if not result:
+            with self._lock:
+                self.discarded += 1
+            return False
+        tasks, layout = result.get("tasks"), result.get("layout")
+        if tasks and not tasks.get("_error") and len(tasks["tasks"]) >= spec.number_of_tasks:
+            pipeline.prime(spec, tasks={**tasks, "tasks": tasks["tasks"][: spec.number_of_tasks]})
+        if layout is not None and not layout.get("_error") and speculation.spec.number_of_tasks == spec.number_of_tasks:
+            pipeline.prime(spec, layout=layout)
+        with self._lock:
+            self.used += 1
+        return True
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {"started": self.started, "used": self.used, "discarded": self.discarded}
+
+    def _discard(self) -> None:
+        if self._current is not None:
+            self._current.cancelled.set()
+            self.discarded += 1
+            self._current = None
+
+    def _run(self, speculation: _Speculation, with_tasks: bool) -> Optional[dict]:
+        if speculation.cancelled.wait(self.settle_s):
+            return None  # parametry zmieniły się w czasie oczekiwania — nic nie wysłano
+        speculation.calling_api.set()
+        spec = speculation.spec
+        stages = [
+            Stage("layout", lambda: generate_layout(
+                profile=spec.student_profile, grade=spec.grade, number_of_tasks=spec.number_of_tasks
+            )),
+        ]
+        if with_tasks:
+            stages.append(Stage("tasks", lambda: generate_tasks(
+                profile=spec.student_profile, grade=spec.grade, topic=spec.topic, n=max_tasks(spec.grade),
+                seed=spec.seed,
+            )))
+        with api_priority("batch"):
+            return run_stages(stages, max_workers=2)
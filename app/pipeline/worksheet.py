@@ -0,0 +1,549 @@
+"""
+v2: Pipeline karty pracy bez UI: zadania → layout → grafiki → odpowiedzi → PDF.
+Używany przez Streamlit (app/ui/app.py), a także przez wejścia wsadowe i usługowe.
+Dla każdego etapu zwraca raport: czas, czas oczekiwania na API, liczba bajtów wyniku.
+"""
+from __future__ import annotations
+
+import threading
+import time
+from dataclasses import asdict, dataclass, field
+from typing import Any, Callable, Optional
+
+from app.ai.client import track_api_usage
+from app.ai.layout_generator import generate_layout
+from app.ai.templates import expand_tasks
+from app.ai.text_generator import generate_single_task, generate_tasks
+from app.cache import LRUCache, approx_size, stable_hash
+from app.deadline import Deadline
+from app.generators.answers import answers_from_details, compute_answers
+from app.generators.bank import ExerciseBank
+from app.generators.images import generate_worksheet_image, generate_worksheet_images_for_tasks
+from app.pdf.generator import WorksheetMeta, build_worksheet_pdf_bytes
+from app.pdf.store import WorksheetStore, worksheet_key
+from app.metrics import FALLBACKS, STAGE_CACHE, STAGE_SECONDS, WORKSHEET_SECONDS, WORKSHEETS
+from app.pipeline.executor import Stage, run_stages
+from app.tracing import span
+
+GRADES = ("1", "2", "3", "4", "5", "6", "7", "8")
+TOPICS = ("dodawanie", "odejmowanie", "mnożenie", "dzielenie", "ułamki", "równania")
+PROFILES = ("standardowy", "dyskalkulia", "zdolny", "trudności w nauce", "ADHD")
+
+# Profile, dla których ilustracja jest przy każdym zadaniu (zawsze włączona)
+LOW_STIMULI_PROFILES = ("dyskalkulia", "ADHD", "trudności w nauce")
+
+# v2: budżet czasu (deadline) — zapytania API zostawiają tyle sekund na grafiki i PDF,
+# a grafiki są pomijane, gdy zostało mniej niż _MIN_IMAGES_TIME_S
+_RENDER_RESERVE_S = 1.5
+_MIN_IMAGES_TIME_S = 0.75
+
+
+@dataclass(frozen=True)
+class WorksheetSpec:
+    """Parametry karty pracy (te same co w formularzu UI). seed = numer wariantu zestawu zadań."""
+    grade: str
+    topic: str
+    number_of_tasks: int = 5
+    student_profile: str = "standardowy"
+    include_illustration: bool = True
+    include_answers: bool = False
+    seed: int = 0
+
+    @classmethod
+    def from_dict(cls, data: dict) -> "WorksheetSpec":
+        """Tworzy spec ze słownika (np. linia JSONL); nieznane klucze są pomijane."""
+        missing = [k for k in ("grade", "topic") if k not in data]
+        if missing:
+            raise ValueError(f"Brak wymaganych pól: {', '.join(missing)}.")
+        known = {k: data[k] for k in cls.__dataclass_fields__ if k in data}
+        if "grade" in known:
+            known["grade"] = str(known["grade"])
+        if "number_of_tasks" in known:
+            known["number_of_tasks"] = int(known["number_of_tasks"])
+        if "seed" in known:
+            known["seed"] = int(known["seed"])
+        spec = cls(**known)
+        spec.validate()
+        return spec
+
+    def validate(self) -> None:
+        """Walidacja biznesowa jak w UI; ValueError z czytelnym komunikatem."""
+        if self.grade not in GRADES:
+            raise ValueError(f"Nieznana klasa: {self.grade!r} (dozwolone 1–8).")
+        if self.topic not in TOPICS:
+            raise ValueError(f"Nieznany zakres materiału: {self.topic!r}.")
+        if self.student_profile not in PROFILES:
+            raise ValueError(f"Nieznany profil ucznia: {self.student_profile!r}.")
+        if not 1 <= self.number_of_tasks <= 30:
+            raise ValueError("Liczba zadań musi być z zakresu 1–30.")
+        if int(self.grade) <= 3 and self.number_of_tasks > 15:
+            raise ValueError("Dla klas 1–3 maksymalna liczba zadań to 15.")
+
+    def to_dict(self) -> dict:
+        return asdict(self)
+
+    def meta(self) -> WorksheetMeta:
+        return WorksheetMeta(
+            title=f"Karta pracy – klasa {self.grade}",
+            grade=str(self.grade),
+            topic_range=self.topic,
+            student_profile=self.student_profile,
+        )
+
+
+@dataclass
+class StageReport:
+    """Raport jednego etapu: czas ścienny, czas wywołań API, liczba wywołań, bajty wyniku, trafienie w cache."""
+    name: str
+    wall_s: float = 0.0
+    api_latency_s: float = 0.0
+    api_calls: int = 0
+    bytes_out: int = 0
+    cached: bool = False
+
+
+@dataclass
+class WorksheetResult:
+    """Artefakty karty pracy i raport etapów."""
+    spec: WorksheetSpec
+    meta: WorksheetMeta
+    tasks: list[str]
+    layout: Optional[dict]
+    image_bytes: Optional[bytes]
+    task_images: Optional[list[bytes]]
+    answers: Optional[list[str]]
+    pdf_bytes: bytes
+    pdf_key: Optional[str] = None
+    tasks_error: Optional[str] = None
+    task_details: Optional[list] = None  # v2: zadania jako dane (FRIENDLY_MATH_STRUCTURED), po jednym na zadanie
+    warnings: list[str] = field(default_factory=list)
+    stages: dict[str, StageReport] = field(default_factory=dict)
+    total_s: float = 0.0
+
+    def report(self) -> dict:
+        """Raport JSON-owalny (do logów, manifestu wsadowego i odpowiedzi usługi)."""
+        return {
+            "total_s": round(self.total_s, 4),
+            "pdf_bytes": len(self.pdf_bytes),
+            "pdf_key": self.pdf_key,
+            "tasks_error": self.tasks_error,
+            "warnings": list(self.warnings),
+            "stages": {name: asdict(r) for name, r in self.stages.items()},
+        }
+
+
+class WorksheetPipeline:
+    """
+    Uruchamia etapy karty pracy współbieżnie (run_stages) z opcjonalnym cache etapów w pamięci
+    i opcjonalnym magazynem PDF na dysku (store) — identyczna karta nie jest budowana ponownie.
+    Jeden obiekt można używać wielokrotnie i z wielu wątków (LRUCache i WorksheetStore są bezpieczne wątkowo).
+    bank: opcjonalny bank gotowych zadań (app/generators/bank.py) — gdy ma pasującą grupę, zadania
+    są losowane z banku (seed = spec.seed) bez zapytania do API.
+    templates: zadania z szablonów (app/ai/templates.py) — jedno zapytanie API na (profil, klasa, temat),
+    kolejne karty i warianty (seed) bez wywołań API.
+    """
+
+    def __init__(
+        self,
+        cache: Optional[LRUCache] = None,
+        max_workers: int = 4,
+        store: Optional[WorksheetStore] = None,
+        bank: Optional[ExerciseBank] = None,
+        templates: bool = False,
+    ) -> None:
+        self.cache = cache
+        self.max_workers = max_workers
+        self.store = store
+        self.bank = bank
+        self.templates = templates
+
+    def run(self, spec: WorksheetSpec, deadline: Optional[Deadline] = None, checkpoint=None) -> WorksheetResult:
+        """
+        deadline: budżet czasu całej karty — zapytania API dostają timeout z budżetu pomniejszonego
+        o rezerwę na render, a przy wyczerpanym budżecie etapy przechodzą na fallback (PDF powstaje zawsze).
+        v2: checkpoint — trwałe wyniki etapów tej karty (get(etap, brak) / put(etap, wynik), np.
+        BatchJournal.checkpoint(id) w trybie wsadowym): zapisane etapy nie są liczone ponownie, nowe są zapisywane.
+        """
+        spec.validate()
+        started = time.perf_counter()
+        api_deadline = deadline.reserve(_RENDER_RESERVE_S) if deadline is not None else None
+        meta = spec.meta()
+        reports: dict[str, StageReport] = {}
+        warnings: list[str] = []
+        lock = threading.Lock()
+
+        def _timed(name: str, func: Callable[..., Any]) -> Callable[..., Any]:
+            return _timed_stage(name, func, reports, lock)
+
+        def _tasks_stage():
+            # Zadań zastępczych (błąd API) nie zapamiętujemy — następne wywołanie spróbuje ponownie
+            return self._checkpointed(
+                checkpoint, "tasks",
+                lambda: self._cached("tasks", _tasks_inputs(spec), _generate, keep=lambda r: not r.get("_error")),
+                keep=lambda r: not r.get("_error"),
+            )
+
+        def _generate():
+            if self.bank is not None:
+                banked = self.bank.tasks_for(
+                    spec.grade, spec.topic, spec.student_profile, spec.number_of_tasks, seed=spec.seed
+                )
+                if banked is not None:
+                    # v2: z "details" (wynik z wiersza banku) — klucz odpowiedzi bez parsowania treści
+                    return {
+                        **banked,
+                        "profile": spec.student_profile,
+                        "grade": spec.grade,
+                        "topic": spec.topic,
+                    }
+            if self.templates:
+                return expand_tasks(
+                    profile=spec.student_profile,
+                    grade=spec.grade,
+                    topic=spec.topic,
+                    n=spec.number_of_tasks,
+                    seed=spec.seed,
+                    deadline=api_deadline,
+                )
+            return generate_tasks(
+                profile=spec.student_profile,
+                grade=spec.grade,
+                topic=spec.topic,
+                n=spec.number_of_tasks,
+                deadline=api_deadline,
+                seed=spec.seed,
+            )
+
+        def _layout_stage():
+            # Layout zależy tylko od profilu, klasy i liczby zadań — biegnie równolegle z zadaniami.
+            # Domyślnego layoutu po błędzie API (jak zadań zastępczych) nie zapamiętujemy
+            try:
+                layout, hit = self._checkpointed(checkpoint, "layout", lambda: self._cached(
+                    "layout",
+                    _layout_inputs(spec),
+                    lambda: generate_layout(
+                        profile=spec.student_profile,
+                        grade=spec.grade,
+                        number_of_tasks=spec.number_of_tasks,
+                        deadline=api_deadline,
+                    ),
+                    keep=lambda r: not r.get("_error"),
+                ), keep=lambda r: not r.get("_error"))
+            except Exception as e:
+                FALLBACKS.inc(stage="layout")
+                warnings.append(f"Layout AI niedostępny ({e}), używam domyślnego layoutu.")
+                return None, False
+            if layout and layout.get("_error"):
+                warnings.append(f"Layout AI niedostępny ({layout['_error']}), używam domyślnego layoutu.")
+                layout = {k: v for k, v in layout.items() if k != "_error"}
+            return layout, hit
+
+        def _images_stage(tasks):
+            # Zwraca (image_bytes, task_images): per zadanie dla low-stimuli, jedna u góry dla pozostałych
+            task_list, details = tasks["tasks"], tasks.get("details")
+            wants_images = spec.student_profile in LOW_STIMULI_PROFILES or spec.include_illustration
+            if wants_images and deadline is not None and deadline.nearly_spent(_MIN_IMAGES_TIME_S):
+                FALLBACKS.inc(stage="images")
+                warnings.append("Brak czasu na ilustracje (budżet karty wyczerpany), PDF bez ilustracji.")
+                return (None, None), False
+            if spec.student_profile in LOW_STIMULI_PROFILES:
+                try:
+                    task_images, hit = self._cached(
+                        "task_images",
+                        _task_images_inputs(task_list, spec, details),
+                        lambda: generate_worksheet_images_for_tasks(
+                            tasks=task_list, topic=spec.topic, profile=spec.student_profile, details=details
+                        ),
+                    )
+                    return (None, task_images), hit
+                except Exception as e:
+                    FALLBACKS.inc(stage="images")
+                    warnings.append(f"Grafiki per zadanie niedostępne ({e}), PDF bez ilustracji przy zadaniach.")
+            elif spec.include_illustration:
+                try:
+                    image_bytes, hit = self._cached(
+                        "image",
+                        (spec.topic, spec.student_profile),
+                        lambda: generate_worksheet_image(topic=spec.topic, profile=spec.student_profile),
+                    )
+                    return (image_bytes, None), hit
+                except Exception as e:
+                    FALLBACKS.inc(stage="images")
+                    warnings.append(f"Grafika niedostępna ({e}), PDF bez ilustracji.")
+            return (None, None), False
+
+        def _answers_stage(tasks):
+            if not spec.include_answers:
+                return None, False
+            if tasks.get("details"):
+                return answers_from_details(tasks["tasks"], tasks["details"]), False
+            return compute_answers(tasks["tasks"]), False
+
+        def _pdf_stage(tasks, layout, images, answers):
+            image_bytes, task_images = images
+            return self._pdf(spec, meta, tasks["tasks"], layout, image_bytes, task_images, answers)
+
+        with span(
+            "worksheet",
+            profile=spec.student_profile,
+            grade=spec.grade,
+            topic=spec.topic,
+            tasks=spec.number_of_tasks,
+        ) as root:
+            results = run_stages(
+                [
+                    Stage("tasks", _timed("tasks", _tasks_stage)),
+                    Stage("layout", _timed("layout", _layout_stage)),
+                    Stage("images", _timed("images", _images_stage), deps=("tasks",)),
+                    Stage("answers", _timed("answers", _answers_stage), deps=("tasks",)),
+                    Stage("pdf", _timed("pdf", _pdf_stage), deps=("tasks", "layout", "images", "answers")),
+                ],
+                max_workers=self.max_workers,
+            )
+            root.set(warnings=len(warnings), tasks_error=bool(results["tasks"].get("_error")))
+
+        WORKSHEETS.inc(profile=spec.student_profile, topic=spec.topic)
+        WORKSHEET_SECONDS.observe(time.perf_counter() - started, profile=spec.student_profile)
+        tasks_result = results["tasks"]
+        image_bytes, task_images = results["images"]
+        pdf_bytes, pdf_key = results["pdf"]
+        return WorksheetResult(
+            spec=spec,
+            meta=meta,
+            tasks=list(tasks_result["tasks"]),
+            layout=results["layout"],
+            image_bytes=image_bytes,
+            task_images=task_images,
+            answers=results["answers"],
+            pdf_bytes=pdf_bytes,
+            pdf_key=pdf_key,
+            tasks_error=tasks_result.get("_error"),
+            task_details=tasks_result.get("details"),
+            warnings=warnings,
+            stages={name: reports[name] for name in ("tasks", "layout", "images", "answers", "pdf")},
+            total_s=time.perf_counter() - started,
+        )
+
+    def regenerate_task(
+        self, result: WorksheetResult, index: int, deadline: Optional[Deadline] = None
+    ) -> WorksheetResult:
+        """
+        Podmienia jedno zadanie (index od 0) w gotowej karcie: jedno małe zapytanie API,
+        ponowny render tylko ilustracji tego zadania i jego odpowiedzi; pozostałe artefakty bez zmian.
+        Nowe zadania i ilustracje trafiają do cache, więc kolejne run(spec) zwraca już podmienioną kartę.
+        """
+        if not 0 <= index < len(result.tasks):
+            raise IndexError(f"Nie ma zadania o numerze {index + 1}.")
+        spec = result.spec
+        started = time.perf_counter()
+        reports: dict[str, StageReport] = {}
+        warnings: list[str] = []
+        lock = threading.Lock()
+        api_deadline = deadline.reserve(_RENDER_RESERVE_S) if deadline is not None else None
+
+        def _task_stage():
+            return generate_single_task(
+                profile=spec.student_profile,
+                grade=spec.grade,
+                topic=spec.topic,
+                existing_tasks=result.tasks,
+                deadline=api_deadline,
+            ), False
+
+        def _images_stage():
+            if result.task_images is None:
+                return None, False
+            task_images = list(result.task_images)
+            try:
+                task_images[index] = generate_worksheet_images_for_tasks(
+                    tasks=[tasks[index]],
+                    topic=spec.topic,
+                    profile=spec.student_profile,
+                    details=[details[index]] if details else None,
+                )[0]
+            except Exception as e:
+                warnings.append(f"Grafika dla nowego zadania niedostępna ({e}).")
+                task_images[index] = b""  # PDF pomija puste ilustracje
+            return task_images, False
+
+        def _answers_stage():
+            if result.answers is None:
+                return None, False
+            answers = list(result.answers)
+            if details:
+                answers[index] = answers_from_details([tasks[index]], [details[index]])[0]
+            else:
+                answers[index] = compute_answers([tasks[index]])[0]
+            return answers, False
+
+        with span("worksheet.regenerate_task", index=index + 1):
+            single = _timed_stage("tasks", _task_stage, reports, lock)()
+            if single.get("_error"):
+                warnings.append(f"Nowe zadanie z API niedostępne ({single['_error']}), wstawiono zadanie zastępcze.")
+            tasks = list(result.tasks)
+            tasks[index] = single["task"]
+            # v2: zadanie zastępcze / tryb tekstowy bez danych — None, etapy wracają do parsowania treści
+            details = list(result.task_details) if result.task_details else None
+            if details is not None:
+                details[index] = single.get("detail")
+            task_images = _timed_stage("images", _images_stage, reports, lock)()
+            answers = _timed_stage("answers", _answers_stage, reports, lock)()
+            pdf_bytes, pdf_key = _timed_stage(
+                "pdf",
+                lambda: self._pdf(spec, result.meta, tasks, result.layout, result.image_bytes, task_images, answers),
+                reports,
+                lock,
+            )()
+
+        # Cache: kolejne run(spec) (np. rerun Streamlit) ma zwrócić kartę z podmienionym zadaniem
+        remembered = {
+            "tasks": tasks,
+            "profile": spec.student_profile,
+            "grade": spec.grade,
+            "topic": spec.topic,
+        }
+        if details is not None:
+            remembered["details"] = details
+        self._remember("tasks", _tasks_inputs(spec), remembered)
+        if task_images is not None:
+            self._remember("task_images", _task_images_inputs(tasks, spec, details), task_images)
+
+        return WorksheetResult(
+            spec=spec,
+            meta=result.meta,
+            tasks=tasks,
+            layout=result.layout,
+            image_bytes=result.image_bytes,
+            task_images=task_images,
+            answers=answers,
+            pdf_bytes=pdf_bytes,
+            pdf_key=pdf_key,
+            tasks_error=result.tasks_error,
+            task_details=details,
+            warnings=warnings,
+            stages=reports,
+            total_s=time.perf_counter() - started,
+        )
+
+    def prime(self, spec: WorksheetSpec, tasks: Optional[dict] = None, layout: Optional[dict] = None) -> None:
+        """
+        Wstawia gotowe wyniki etapów do cache (np. z generowania w tle) — run(spec) użyje ich zamiast API.
+        tasks w formacie generate_tasks ({"tasks": [...], ...}). Bez cache nie robi nic.
+        """
+        if tasks is not None:
+            self._remember("tasks", _tasks_inputs(spec), tasks)
+        if layout is not None:
+            self._remember("layout", _layout_inputs(spec), layout)
+
+    def _pdf(self, spec, meta, tasks, layout, image_bytes, task_images, answers) -> tuple[tuple[bytes, str], bool]:
+        """((pdf_bytes, klucz), czy_z_cache): najpierw cache w pamięci, potem magazyn na dysku, na końcu budowa."""
+        key = worksheet_key(meta, tasks, layout, image_bytes, task_images, answers, spec.seed)
+        from_store = []
+
+        def _load_or_build() -> bytes:
+            if self.store is not None:
+                stored = self.store.get(key)
+                if stored is not None:
+                    from_store.append(True)
+                    return stored
+            pdf = build_worksheet_pdf_bytes(
+                meta=meta,
+                tasks=tasks,
+                layout=layout,
+                image_bytes=image_bytes,
+                task_images=task_images,
+                answers=answers,
+            )
+            if self.store is not None:
+                self.store.put(key, pdf, info={"spec": spec.to_dict(), "tasks": len(tasks)})
+            return pdf
+
+        pdf_bytes, hit = self._cached("pdf", (key,), _load_or_build)
+        return (pdf_bytes, key), hit or bool(from_store)
+
+    @staticmethod
+    def _checkpointed(checkpoint, stage: str, compute: Callable[[], tuple[Any, bool]], keep=None) -> tuple[Any, bool]:
+        """Jak _cached, ale z trwałym zapisem jednej karty (checkpoint); zapisany wynik liczy się jako trafienie."""
+        if checkpoint is None:
+            return compute()
+        missing = object()
+        value = checkpoint.get(stage, missing)
+        if value is not missing:
+            return value, True
+        value, hit = compute()
+        if value is not None and (keep is None or keep(value)):
+            checkpoint.put(stage, value)
+        return value, hit
+
+    def _remember(self, stage: str, inputs: tuple, value: Any) -> None:
+        if self.cache is not None:
+            self.cache.put((stage, stable_hash(*inputs)), value)
+
+    def _cached(self, stage: str, inputs: tuple, compute: Callable[[], Any], keep=None) -> tuple[Any, bool]:
+        """
+        Zwraca (wynik, czy_z_cache). Bez cache zawsze liczy.
+        keep(wynik) -> False: wynik nie trafia do cache.
+        """
+        if self.cache is None:
+            return compute(), False
+        key = (stage, stable_hash(*inputs))
+        missing = object()
+        value = self.cache.get(key, missing)
+        if value is not missing:
+            return value, True
+        value = compute()
+        if keep is None or keep(value):
+            self.cache.put(key, value)
+        return value, False
+
+
+def _tasks_inputs(spec: WorksheetSpec) -> tuple:
+    """Wejścia etapu zadań (klucz cache)."""
+    return (spec.student_profile, spec.grade, spec.topic, spec.number_of_tasks, spec.seed)
+
+
+def _layout_inputs(spec: WorksheetSpec) -> tuple:
+    """Wejścia etapu layoutu (klucz cache)."""
+    return (spec.student_profile, spec.grade, spec.number_of_tasks)
+
+
+def _task_images_inputs(tasks: list[str], spec: WorksheetSpec, details: Optional[list] = None) -> tuple:
+    """Wejścia ilustracji per zadanie (klucz cache); zadania jako dane tylko, gdy są (klucze trybu tekstowego bez zmian)."""
+    inputs = (tasks, spec.topic, spec.student_profile)
+    return inputs + (details,) if details else inputs
+
+
+def _timed_stage(
+    name: str, func: Callable[..., Any], reports: dict[str, StageReport], lock: threading.Lock
+) -> Callable[..., Any]:
+    """Opakowuje func(**deps) -> (wynik, czy_z_cache) pomiarem czasu, API i bajtów; raport trafia do reports."""
+    def _wrapper(**deps):
+        report = StageReport(name=name)
+        t0 = time.perf_counter()
+        with span(f"stage.{name}") as s:
+            with track_api_usage() as usage:
+                value, report.cached = func(**deps)
+            s.set(cached=report.cached, api_calls=usage.calls)
+        report.wall_s = time.perf_counter() - t0
+        STAGE_SECONDS.observe(report.wall_s, stage=name)
+        STAGE_CACHE.inc(stage=name, result="hit" if report.cached else "miss")
+        report.api_latency_s = usage.latency_s
+        report.api_calls = usage.calls
+        report.bytes_out = approx_size(value)
+        with lock:
+            reports[name] = report
+        return value
+    return _wrapper
+
+
+def format_report(result: WorksheetResult) -> str:
+    """Czytelna tabela czasów etapów (do konsoli / logów)."""
+    lines = [f"{'etap':<8} {'czas [s]':>9} {'API [s]':>8} {'wyw.':>5} {'bajty':>9}  cache"]
+    for r in result.stages.values():
+        lines.append(
+            f"{r.name:<8} {r.wall_s:>9.3f} {r.api_latency_s:>8.3f} {r.api_calls:>5} {r.bytes_out:>9}  "
+            f"{'tak' if r.cached else '-'}"
+        )
+    lines.append(f"{'razem':<8} {result.total_s:>9.3f}")
+    return "\n".join(lines)
+
@@ -0,0 +1,33 @@
+"""
+v2: Lokalna usługa generowania kart pracy.
+Uruchom: python -m app.service --port 8765 --workers 4 --api-concurrency 8
+Test obciążeniowy bez sieci: python -m app.service --fake-llm lognormal:1.2,0.5 (atrapa LLM zamiast OpenAI).
+"""
+from __future__ import annotations
+
+import argparse
+from pathlib import Path
+
+from app.ai.client import set_client, set_max_in_flight
+from app.service.server import serve
+
+
+def main(argv: list[str] | None = None) -> None:
+    parser = argparse.ArgumentParser(prog="python -m app.service", description="Friendly Math — usługa HTTP generowania kart pracy.")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--workers", type=int, default=4, help="Liczba kart generowanych równolegle.")
+    parser.add_argument("--api-concurrency", type=int, default=8, help="Maks. liczba równoczesnych wywołań API (0 = bez limitu).")
+    parser.add_argument("--store", type=Path, default=Path("data/out/store"), help="Katalog magazynu gotowych PDF.")
+    parser.add_argument("--fake-llm", default=None, metavar="LATENCY", help="Atrapa LLM z opóźnieniem (np. lognormal:1.2,0.5) — do testów obciążeniowych.")
+    args = parser.parse_args(argv)
+    set_max_in_flight(args.api_concurrency)
+    if args.fake_llm:
+        from app.bench.fake_llm import FakeLLM, parse_latency
+
+        set_client(FakeLLM(latency=parse_latency(args.fake_llm)))
+    serve(host=args.host, port=args.port, workers=args.workers, store_dir=args.store)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,63 @@
+"""
+v2: Klient usługi HTTP (app/service/server.py) — dla Streamlit i skryptów.
+ServiceClient.run(spec) zwraca WorksheetResult tak jak lokalny WorksheetPipeline.run(spec)
+(bez bajtów ilustracji, które zostają po stronie usługi).
+"""
+from __future__ import annotations
+
+import json
+import time
+from typing import Optional
+from urllib.request import Request, urlopen
+
+from app.pipeline.worksheet import StageReport, WorksheetResult, WorksheetSpec
+
+
+class ServiceClient:
+    def __init__(self, base_url: str, timeout: float = 120.0) -> None:
+        self.base_url = base_url.rstrip("/")
+        self.timeout = timeout
+
+    def submit(self, spec: WorksheetSpec, priority: str = "interactive") -> str:
+        """Zgłasza kartę i zwraca identyfikator zadania."""
+        body = json.dumps({**spec.to_dict(), "priority": priority}).encode("utf-8")
+        req = Request(f"{self.base_url}/jobs", data=body, headers={"Content-Type": "application/json"})
+        with urlopen(req, timeout=10.0) as resp:
+            return json.loads(resp.read())["id"]
+
+    def status(self, job_id: str, wait: float = 0.0) -> dict:
+        with urlopen(f"{self.base_url}/jobs/{job_id}?wait={wait}", timeout=wait + 10.0) as resp:
+            return json.loads(resp.read())
+
+    def pdf(self, job_id: str) -> bytes:
+        with urlopen(f"{self.base_url}/jobs/{job_id}/pdf", timeout=30.0) as resp:
+            return resp.read()
+
+    def run(self, spec: WorksheetSpec, priority: str = "interactive") -> WorksheetResult:
+        """Zgłasza kartę, czeka (long-polling) i zwraca wynik; RuntimeError przy błędzie lub przekroczeniu czasu."""
+        job_id = self.submit(spec, priority=priority)
+        deadline = time.monotonic() + self.timeout
+        status: Optional[dict] = None
+        while time.monotonic() < deadline:
+            status = self.status(job_id, wait=min(20.0, max(0.0, deadline - time.monotonic())))
+            if status["status"] in ("done", "error"):
+                break
+        if not status or status["status"] != "done":
+            reason = (status or {}).get("error") or "przekroczono czas oczekiwania"
+            raise RuntimeError(f"Usługa nie wygenerowała karty: {reason}")
+        report = status["report"]
+        return WorksheetResult(
+            spec=spec,
+            meta=spec.meta(),
+            tasks=status["tasks"],
+            layout=status.get("layout"),
+            image_bytes=None,
+            task_images=None,
+            answers=status.get("answers"),
+            pdf_bytes=self.pdf(job_id),
+            tasks_error=report.get("tasks_error"),
+            task_details=status.get("task_details"),
+            warnings=report.get("warnings", []),
+            stages={name: StageReport(**r) for name, r in report.get("stages", {}).items()},
+            total_s=report.get("total_s", 0.0),
+        )
@@ -0,0 +1,171 @@
+"""
+v2: Kolejka zadań generowania kart z priorytetami i pulą wątków roboczych.
+Zadania „interactive” (nauczyciel czeka na stronie) wyprzedzają „batch”; w obrębie
+jednego priorytetu obowiązuje kolejność zgłoszeń (FIFO).
+"""
+from __future__ import annotations
+
+import itertools
+import queue
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from contextlib import nullcontext
+from dataclasses import dataclass, field
+from typing import Optional
+
+from app.ai.scheduler import api_priority
+from app.cache import LRUCache
+from app.deadline import Deadline
+from app.pipeline.worksheet import WorksheetPipeline, WorksheetResult, WorksheetSpec
+from app.tracing import CAPTURE_MODES, capture
+
+# Mniejsza liczba = wyższy priorytet
+PRIORITIES = {"interactive": 0, "batch": 10}
+
+
+class QueueFullError(RuntimeError):
+    """Kolejka osiągnęła limit oczekujących zadań."""
+
+
+@dataclass
+class Job:
+    """Jedno zgłoszenie karty pracy i jego stan: queued → running → done | error."""
+    id: str
+    spec: WorksheetSpec
+    priority: str = "interactive"
+    status: str = "queued"
+    created_at: float = field(default_factory=time.time)
+    started_at: Optional[float] = None
+    finished_at: Optional[float] = None
+    error: Optional[str] = None
+    result: Optional[WorksheetResult] = None
+    capture: Optional[str] = None  # v2: profilowanie tego zadania ("cpu" | "memory" | "all")
+    capture_files: list[str] = field(default_factory=list)
+    done: threading.Event = field(default_factory=threading.Event, repr=False)
+
+    def to_dict(self) -> dict:
+        """Stan zadania jako JSON (bez bajtów PDF — te pod osobnym adresem)."""
+        out = {
+            "id": self.id,
+            "status": self.status,
+            "priority": self.priority,
+            "spec": self.spec.to_dict(),
+            "created_at": self.created_at,
+            "started_at": self.started_at,
+            "finished_at": self.finished_at,
+            "queue_wait_s": round((self.started_at or time.time()) - self.created_at, 4),
+            "error": self.error,
+        }
+        if self.capture:
+            out.update(capture=self.capture, capture_files=self.capture_files)
+        if self.result is not None:
+            out.update(
+                tasks=self.result.tasks,
+                answers=self.result.answers,
+                layout=self.result.layout,
+                report=self.result.report(),
+            )
+            if self.result.task_details:
+                out["task_details"] = self.result.task_details
+        return out
+
+
+class JobQueue:
+    """
+    Kolejka priorytetowa + workers wątków wywołujących WorksheetPipeline.run().
+    Zakończone zadania trzymane są do limitu keep_finished (najstarsze usuwane).
+    """
+
+    def __init__(
+        self,
+        workers: int = 4,
+        max_queued: int = 1000,
+        keep_finished: int = 500,
+        pipeline: Optional[WorksheetPipeline] = None,
+        slo_s: Optional[float] = None,
+    ) -> None:
+        self.pipeline = pipeline or WorksheetPipeline(cache=LRUCache(max_entries=256, max_bytes=256 * 1024 * 1024))
+        self.workers = max(1, workers)
+        self.max_queued = max_queued
+        self.keep_finished = keep_finished
+        # Budżet czasu zadań interactive liczony od przyjęcia zgłoszenia (czas w kolejce też się liczy)
+        self.slo_s = slo_s if slo_s is not None else Deadline.from_env().budget_s
+        self._queue: "queue.PriorityQueue[tuple[int, int, str]]" = queue.PriorityQueue()
+        self._seq = itertools.count()
+        self._jobs: "OrderedDict[str, Job]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._threads: list[threading.Thread] = []
+        self._stopping = threading.Event()
+
+    def start(self) -> None:
+        for i in range(self.workers):
+            t = threading.Thread(target=self._worker, name=f"fm-job-{i}", daemon=True)
+            t.start()
+            self._threads.append(t)
+
+    def stop(self, timeout: float = 5.0) -> None:
+        self._stopping.set()
+        for _ in self._threads:
+            self._queue.put((-1, -1, ""))  # budzik dla każdego wątku
+        for t in self._threads:
+            t.join(timeout)
+        self._threads.clear()
+
+    def submit(self, spec: WorksheetSpec, priority: str = "interactive", capture: Optional[str] = None) -> Job:
+        if priority not in PRIORITIES:
+            raise ValueError(f"Nieznany priorytet: {priority!r} (dozwolone: {', '.join(PRIORITIES)}).")
+        if capture is not None and capture not in CAPTURE_MODES:
+            raise ValueError(f"Nieznany tryb profilowania: {capture!r} (dozwolone: {', '.join(CAPTURE_MODES)}).")
+        spec.validate()
+        job = Job(id=uuid.uuid4().hex, spec=spec, priority=priority, capture=capture)
+        with self._lock:
+            if self.queued() >= self.max_queued:
+                raise QueueFullError("Kolejka jest pełna — spróbuj ponownie za chwilę.")
+            self._jobs[job.id] = job
+            self._trim_finished()
+        self._queue.put((PRIORITIES[priority], next(self._seq), job.id))
+        return job
+
+    def get(self, job_id: str) -> Optional[Job]:
+        with self._lock:
+            return self._jobs.get(job_id)
+
+    def queued(self) -> int:
+        return sum(1 for j in self._jobs.values() if j.status == "queued")
+
+    def stats(self) -> dict:
+        with self._lock:
+            counts: dict[str, int] = {}
+            for job in self._jobs.values():
+                counts[job.status] = counts.get(job.status, 0) + 1
+        return {"workers": self.workers, "jobs": counts}
+
+    def _worker(self) -> None:
+        while not self._stopping.is_set():
+            _, _, job_id = self._queue.get()
+            job = self.get(job_id) if job_id else None
+            if job is None:
+                continue
+            job.status = "running"
+            job.started_at = time.time()
+            deadline = None
+            if job.priority == "interactive":
+                deadline = Deadline(self.slo_s - (job.started_at - job.created_at))
+            try:
+                with api_priority(job.priority), capture(job.capture) if job.capture else nullcontext() as profile:
+                    job.result = self.pipeline.run(job.spec, deadline=deadline)
+                if profile is not None:
+                    job.capture_files = [str(p) for p in profile.paths]
+                job.status = "done"
+            except Exception as e:
+                job.error = f"{type(e).__name__}: {e}"
+                job.status = "error"
+            job.finished_at = time.time()
+            job.done.set()
+
+    def _trim_finished(self) -> None:
+        finished = [jid for jid, j in self._jobs.items() if j.status in ("done", "error")]
+        for jid in finished[: max(0, len(finished) - self.keep_finished)]:
+            del self._jobs[jid]
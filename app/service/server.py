@@ -0,0 +1,158 @@
+"""
+v2: Lokalna usługa HTTP generowania kart pracy (biblioteka standardowa, bez dodatkowych zależności).
+
+Endpointy:
+- POST /jobs              — zgłoszenie karty (JSON: pola WorksheetSpec + "priority": "interactive" | "batch",
+                            opcjonalnie "capture": "cpu" | "memory" | "all" — profil tego zadania w data/out/traces)
+- GET  /jobs/<id>         — stan zadania; ?wait=SEKUNDY czeka na zakończenie (long-polling)
+- GET  /jobs/<id>/pdf     — gotowy PDF
+- GET  /health            — stan kolejki
+- GET  /metrics           — metryki w formacie tekstowym Prometheusa (app/metrics.py)
+"""
+from __future__ import annotations
+
+import json
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+from typing import Optional
+from urllib.parse import parse_qs, urlparse
+
+from app.ai.scheduler import get_scheduler
+from app.ai.singleflight import coalescing_stats
+from app.ai.templates import templates_enabled
+from app.cache import LRUCache
+from app.generators.bank import default_bank
+from app.metrics import CONTENT_TYPE, REGISTRY, register_cache
+from app.pdf.store import WorksheetStore
+from app.pipeline.worksheet import WorksheetPipeline, WorksheetSpec
+from app.service.jobs import JobQueue, QueueFullError
+
+_MAX_BODY_BYTES = 64 * 1024
+_MAX_WAIT_S = 60.0
+
+
+class WorksheetService(ThreadingHTTPServer):
+    """Serwer HTTP z dołączoną kolejką zadań (JobQueue)."""
+
+    daemon_threads = True
+
+    def __init__(self, address: tuple[str, int], jobs: JobQueue) -> None:
+        super().__init__(address, _Handler)
+        self.jobs = jobs
+
+
+class _Handler(BaseHTTPRequestHandler):
+    server: WorksheetService
+    server_version = "FriendlyMath/2"
+
+    def do_GET(self) -> None:
+        url = urlparse(self.path)
+        parts = [p for p in url.path.split("/") if p]
+        if parts == ["health"]:
+            self._send_json(200, {
+                "status": "ok",
+                **self.server.jobs.stats(),
+                "coalescing": coalescing_stats(),
+                "scheduler": get_scheduler().stats(),
+            })
+            return
+        if parts == ["metrics"]:
+            self._send_bytes(200, REGISTRY.render().encode("utf-8"), CONTENT_TYPE)
+            return
+        if len(parts) in (2, 3) and parts[0] == "jobs":
+            job = self.server.jobs.get(parts[1])
+            if job is None:
+                self._send_json(404, {"error": "Nie ma takiego zadania."})
+                return
+            if len(parts) == 2:
+                wait = _parse_wait(parse_qs(url.query).get("wait", [None])[0])
+                if wait:
+                    job.done.wait(wait)
+                self._send_json(200, job.to_dict())
+                return
+            if parts[2] == "pdf":
+                if job.status != "done" or job.result is None:
+                    self._send_json(409, {"error": "PDF jeszcze niegotowy.", "status": job.status})
+                    return
+                self._send_bytes(200, job.result.pdf_bytes, "application/pdf")
+                return
+        self._send_json(404, {"error": "Nieznany adres."})
+
+    def do_POST(self) -> None:
+        if urlparse(self.path).path.rstrip("/") != "/jobs":
+            self._send_json(404, {"error": "Nieznany adres."})
+            return
+        length = int(self.headers.get("Content-Length") or 0)
+        if length <= 0 or length > _MAX_BODY_BYTES:
+            self._send_json(400, {"error": "Brak treści lub treść za duża."})
+            return
+        try:
+            data = json.loads(self.rfile.read(length).decode("utf-8"))
+            if not isinstance(data, dict):
+                raise ValueError("Treść musi być obiektem JSON.")
+            spec = WorksheetSpec.from_dict(data)
+            job = self.server.jobs.submit(
+                spec,
+                priority=str(data.get("priority", "interactive")),
+                capture=str(data["capture"]) if data.get("capture") else None,
+            )
+        except QueueFullError as e:
+            self._send_json(503, {"error": str(e)})
+            return
+        except (ValueError, TypeError) as e:
+            self._send_json(400, {"error": str(e)})
+            return
+        self._send_json(
+            202,
+            {
+                "id": job.id,
+                "status": job.status,
+                "status_url": f"/jobs/{job.id}",
+                "pdf_url": f"/jobs/{job.id}/pdf",
+            },
+        )
+
+    def log_message(self, format: str, *args) -> None:  # noqa: A002 — sygnatura z BaseHTTPRequestHandler
+        pass  # bez logu każdego żądania na stderr
+
+    def _send_json(self, status: int, payload: dict) -> None:
+        body = json.dumps(payload, ensure_ascii=False).encode("utf-8")
+        self._send_bytes(status, body, "application/json; charset=utf-8")
+
+    def _send_bytes(self, status: int, body: bytes, content_type: str) -> None:
+        self.send_response(status)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+
+def _parse_wait(value: Optional[str]) -> float:
+    try:
+        return max(0.0, min(float(value), _MAX_WAIT_S)) if value else 0.0
+    except ValueError:
+        return 0.0
+
+
+def serve(host: str = "127.0.0.1", port: int = 8765, workers: int = 4, store_dir: Optional[Path] = None) -> None:
+    """Uruchamia usługę i blokuje do Ctrl+C. store_dir: magazyn gotowych PDF (identyczne karty z dysku)."""
+    pipeline = WorksheetPipeline(
+        cache=LRUCache(max_entries=256, max_bytes=256 * 1024 * 1024),
+        store=WorksheetStore(store_dir) if store_dir else None,
+        bank=default_bank(),
+        templates=templates_enabled(),
+    )
+    register_cache("stages", pipeline.cache)
+    if pipeline.store is not None:
+        register_cache("pdf_store", pipeline.store)
+    jobs = JobQueue(workers=workers, pipeline=pipeline)
+    jobs.start()
+    httpd = WorksheetService((host, port), jobs)
+    print(f"Friendly Math service: http://{host}:{port} (workers: {workers})")
+    try:
+        httpd.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        httpd.server_close()
+        jobs.stop()
@@ -0,0 +1,260 @@
+"""
+v2: Śledzenie etapów (opcjonalne) — spany w pliku JSONL i profilowanie pojedynczego żądania na życzenie.
+FRIENDLY_MATH_TRACE=ścieżka.jsonl (albo 1 → data/out/traces/trace.jsonl) włącza zapis spanów: jeden wiersz
+JSON na zakończony span (nazwa, trace/span/parent id, początek, czas w ms, wątek, atrybuty, błąd).
+Spany zagnieżdżone dziedziczą trace id i rodzica przez contextvars — także w etapach run_stages.
+capture("cpu" | "memory" | "all") profiluje jedno żądanie (cProfile w spanach, tracemalloc) i zapisuje
+pliki .prof / .txt obok pliku śladów. Wyłączone śledzenie kosztuje jedno sprawdzenie zmiennej na span.
+"""
+from __future__ import annotations
+
+import cProfile
+import functools
+import itertools
+import json
+import os
+import pstats
+import threading
+import time
+import tracemalloc
+import uuid
+from contextlib import contextmanager
+from contextvars import ContextVar
+from pathlib import Path
+from typing import Any, Callable, Iterator, Optional
+
+from app.env import load_env
+
+TRACE_DIR = Path("data/out/traces")
+CAPTURE_MODES = ("cpu", "memory", "all")
+_TOP_ALLOCATIONS = 30
+
+
+class _Sink:
+    """Plik JSONL ze spanami (dopisywanie, jeden wiersz na span; bezpieczny wątkowo)."""
+
+    def __init__(self, path: Path) -> None:
+        self.path = Path(path)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self._file = open(self.path, "a", encoding="utf-8")
+        self._lock = threading.Lock()
+
+    def write(self, record: dict) -> None:
+        line = json.dumps(record, ensure_ascii=False, default=str)
+        with self._lock:
+            self._file.write(line + "\n")
+            self._file.flush()
+
+    def close(self) -> None:
+        with self._lock:
+            self._file.close()
+
+
+class Capture:
+    """Profil jednego żądania: cProfile z każdego wątku etapów i (opcjonalnie) migawka tracemalloc."""
+
+    def __init__(self, mode: str, out_dir: Path) -> None:
+        if mode not in CAPTURE_MODES:
+            raise ValueError(f"Nieznany tryb profilowania: {mode!r} (dozwolone: {', '.join(CAPTURE_MODES)}).")
+        self.mode = mode
+        self.out_dir = Path(out_dir)
+        self.id = uuid.uuid4().hex[:16]
+        self.paths: list[Path] = []
+        self.skipped = 0  # spany bez profilu (np. inny profiler aktywny w wątku)
+        self._profiles: list[cProfile.Profile] = []
+        self._lock = threading.Lock()
+
+    @property
+    def cpu(self) -> bool:
+        return self.mode in ("cpu", "all")
+
+    @property
+    def memory(self) -> bool:
+        return self.mode in ("memory", "all")
+
+    def add(self, profile: cProfile.Profile) -> None:
+        with self._lock:
+            self._profiles.append(profile)
+
+
+class Span:
+    """Otwarty span; set() dopisuje atrybuty (np. liczbę tokenów, bajty wyniku)."""
+
+    __slots__ = ("name", "trace_id", "span_id", "parent_id", "attrs", "start", "_t0")
+
+    def __init__(self, name: str, trace_id: str, parent_id: Optional[str], attrs: dict) -> None:
+        self.name = name
+        self.trace_id = trace_id
+        self.span_id = f"{next(_span_ids):x}"
+        self.parent_id = parent_id
+        self.attrs = attrs
+        self.start = time.time()
+        self._t0 = time.perf_counter()
+
+    def set(self, **attrs: Any) -> None:
+        self.attrs.update(attrs)
+
+
+class _NoopSpan:
+    __slots__ = ()
+
+    def set(self, **attrs: Any) -> None:
+        pass
+
+    def __enter__(self) -> "_NoopSpan":
+        return self
+
+    def __exit__(self, *exc) -> None:
+        return None
+
+
+_NOOP = _NoopSpan()
+_span_ids = itertools.count(1)
+_sink: Optional[_Sink] = None
+_current: ContextVar[Optional[Span]] = ContextVar("friendly_math_span", default=None)
+_capture: ContextVar[Optional[Capture]] = ContextVar("friendly_math_capture", default=None)
+_profiling = threading.local()  # wątek, w którym cProfile już działa (spany zagnieżdżone nie dublują profilu)
+
+
+def configure(path: Optional[Path]) -> None:
+    """Włącza zapis spanów do pliku JSONL (None — wyłącza)."""
+    global _sink
+    old, _sink = _sink, (_Sink(path) if path else None)
+    if old is not None:
+        old.close()
+
+
+def configure_from_env() -> None:
+    """FRIENDLY_MATH_TRACE: ścieżka pliku śladów; 1/true — data/out/traces/trace.jsonl; puste — wyłączone."""
+    value = os.getenv("FRIENDLY_MATH_TRACE", "").strip()
+    if value.lower() in ("", "0", "false", "no", "nie"):
+        configure(None)
+    elif value.lower() in ("1", "true", "yes", "tak"):
+        configure(TRACE_DIR / "trace.jsonl")
+    else:
+        configure(Path(value))
+
+
+def enabled() -> bool:
+    return _sink is not None
+
+
+def trace_path() -> Optional[Path]:
+    return _sink.path if _sink is not None else None
+
+
+def span(name: str, **attrs: Any):
+    """
+    Kontekst with mierzący blok kodu: with span("pdf.build", tasks=n) as s: ...; s.set(bytes=len(pdf)).
+    Bez włączonego śledzenia i profilowania zwraca wspólny obiekt bez działania.
+    """
+    if _sink is None and _capture.get() is None:
+        return _NOOP
+    return _span(name, attrs)
+
+
+def traced(name: Optional[str] = None) -> Callable[[Callable[..., Any]], Callable[..., Any]]:
+    """Dekorator: całe wywołanie funkcji jako span (domyślna nazwa: moduł.funkcja)."""
+    def decorator(func: Callable[..., Any]) -> Callable[..., Any]:
+        span_name = name or f"{func.__module__.rsplit('.', 1)[-1]}.{func.__name__}"
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            if _sink is None and _capture.get() is None:
+                return func(*args, **kwargs)
+            with _span(span_name, {}):
+                return func(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+@contextmanager
+def _span(name: str, attrs: dict) -> Iterator[Span]:
+    parent = _current.get()
+    current = Span(name, parent.trace_id if parent else uuid.uuid4().hex[:16], parent.span_id if parent else None, attrs)
+    token = _current.set(current)
+    profile = _start_profile()
+    error = None
+    try:
+        yield current
+    except BaseException as e:
+        error = f"{type(e).__name__}: {e}"
+        raise
+    finally:
+        duration_ms = (time.perf_counter() - current._t0) * 1000
+        if profile is not None:
+            profile.disable()
+            _profiling.active = False
+        _current.reset(token)
+        sink = _sink
+        if sink is not None:
+            record = {
+                "name": name,
+                "trace": current.trace_id,
+                "span": current.span_id,
+                "parent": current.parent_id,
+                "start": round(current.start, 6),
+                "ms": round(duration_ms, 3),
+                "thread": threading.current_thread().name,
+                "pid": os.getpid(),
+            }
+            if current.attrs:
+                record["attrs"] = current.attrs
+            if error:
+                record["error"] = error
+            sink.write(record)
+
+
+def _start_profile() -> Optional[cProfile.Profile]:
+    active = _capture.get()
+    if active is None or not active.cpu or getattr(_profiling, "active", False):
+        return None
+    profile = cProfile.Profile()
+    try:
+        profile.enable()
+    except ValueError:  # inny profiler w tym wątku (np. debugger)
+        active.skipped += 1
+        return None
+    _profiling.active = True
+    active.add(profile)
+    return profile
+
+
+@contextmanager
+def capture(mode: str = "cpu", out_dir: Optional[Path] = None) -> Iterator[Capture]:
+    """
+    Profiluje blok (jedno żądanie): cpu — cProfile wszystkich spanów bloku (także w wątkach etapów),
+    zapis <id>.prof (pstats, np. snakeviz); memory — tracemalloc, zapis <id>.memory.txt (największe alokacje).
+    Ścieżki zapisanych plików w Capture.paths po wyjściu z bloku.
+    """
+    out_dir = Path(out_dir) if out_dir else (trace_path().parent if enabled() else TRACE_DIR)
+    active = Capture(mode, out_dir)
+    started_tracemalloc = active.memory and not tracemalloc.is_tracing()
+    if started_tracemalloc:
+        tracemalloc.start()
+    token = _capture.set(active)
+    try:
+        with _span("capture", {"mode": mode, "capture": active.id}):
+            yield active
+    finally:
+        _capture.reset(token)
+        active.out_dir.mkdir(parents=True, exist_ok=True)
+        if active.memory:
+            snapshot = tracemalloc.take_snapshot()
+            if started_tracemalloc:
+                tracemalloc.stop()
+            path = active.out_dir / f"{active.id}.memory.txt"
+            lines = [str(stat) for stat in snapshot.statistics("lineno")[:_TOP_ALLOCATIONS]]
+            path.write_text("\n".join(lines) + "\n", encoding="utf-8")
+            active.paths.append(path)
+        if active.cpu and active._profiles:
+            path = active.out_dir / f"{active.id}.prof"
+            stats = pstats.Stats(active._profiles[0])
+            for profile in active._profiles[1:]:
+                stats.add(profile)
+            stats.dump_stats(str(path))
+            active.paths.append(path)
+
+
+load_env()  # FRIENDLY_MATH_TRACE może być w .env, a moduł bywa importowany przed app.ai.client
+configure_from_env()
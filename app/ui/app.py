@@ -16,44 +16,131 @@
 
 import os
 import sys
-from io import BytesIO
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import nullcontext
 from pathlib import Path
 
-try:
-    import fitz  # type: ignore  # PyMuPDF
-except ModuleNotFoundError:
-    fitz = None  # pip install PyMuPDF — wtedy podgląd PDF jako obrazy będzie działał
-
-from dotenv import load_dotenv
-
-load_dotenv()
-
 ROOT_DIR = Path(__file__).resolve().parents[2]
 if str(ROOT_DIR) not in sys.path:
     sys.path.insert(0, str(ROOT_DIR))
 
+# v2: .env wczytywany raz na proces (a nie przy każdym rerunie skryptu)
+from app.env import load_env
+
+load_env()
+
 import streamlit as st
-from app.ai.layout_generator import generate_layout
-from app.ai.text_generator import generate_tasks
-from app.generators.answers import compute_answers
-from app.generators.images import generate_worksheet_image, generate_worksheet_images_for_tasks
-from app.pdf.generator import WorksheetMeta, build_worksheet_pdf_bytes
-
-def _pdf_bytes_to_images(pdf_bytes: bytes, dpi: int = 120) -> list[BytesIO]:
-    """Konwertuje PDF (bytes) na listę obrazów stron (PNG w BytesIO). Wymaga: pip install PyMuPDF."""
-    out = []
-    if fitz is None:
-        return out
+from app.cache import LRUCache, stable_hash
+from app.deadline import Deadline
+from app import metrics
+from app.ai.templates import templates_enabled
+from app.generators.bank import default_bank
+from app.pdf.preview import PreviewService
+from app.pdf.store import WorksheetStore
+from app.pipeline.speculative import Speculator, claim_timeout
+from app.pipeline.worksheet import WorksheetPipeline, WorksheetSpec, format_report
+from app.service.client import ServiceClient
+from app import tracing
+
+# --------------------------------------------------
+# v2: Cache etapów w sesji — Streamlit wykonuje skrypt od nowa przy każdej interakcji,
+# więc wyniki etapów (zadania, layout, grafiki, PDF) trzymamy w st.session_state.
+# Etap liczy się ponownie tylko wtedy, gdy zmieniły się jego wejścia (klucz = skrót wejść).
+# --------------------------------------------------
+_STAGE_CACHE_MAX_ENTRIES = 48
+_STAGE_CACHE_MAX_BYTES = 64 * 1024 * 1024  # 64 MB na sesję
+
+
+def _stage_cache() -> LRUCache:
+    """Ograniczony cache LRU dla bieżącej sesji (tworzony przy pierwszym użyciu)."""
+    if "fm_stage_cache" not in st.session_state:
+        st.session_state["fm_stage_cache"] = LRUCache(
+            max_entries=_STAGE_CACHE_MAX_ENTRIES,
+            max_bytes=_STAGE_CACHE_MAX_BYTES,
+        )
+        metrics.register_cache("session_stages", st.session_state["fm_stage_cache"])
+    return st.session_state["fm_stage_cache"]
+
+
+@st.cache_resource
+def _worksheet_store() -> WorksheetStore:
+    """v2: Magazyn gotowych PDF (wspólny dla sesji) — zastępuje nadpisywany data/out/worksheet.pdf."""
+    store = WorksheetStore(ROOT_DIR / "data" / "out" / "store")
+    metrics.register_cache("pdf_store", store)
+    return store
+
+
+@st.cache_resource
+def _preview_service() -> PreviewService:
+    """v2: Podgląd stron PDF (wspólny cache PNG dla sesji, render w tle)."""
+    service = PreviewService()
+    metrics.register_cache("preview", service.cache)
+    return service
+
+
+@st.cache_resource
+def _metrics_server():
+    """v2: Serwer GET /metrics na FRIENDLY_MATH_METRICS_PORT (jeden na proces Streamlit); None, gdy wyłączony."""
+    port = metrics.port_from_env()
+    if not port:
+        return None
     try:
-        doc = fitz.open(stream=pdf_bytes, filetype="pdf")
-        for page in doc:
-            pix = page.get_pixmap(dpi=dpi)
-            png_bytes = pix.tobytes("png")
-            out.append(BytesIO(png_bytes))
-        doc.close()
-    except Exception:
-        pass
-    return out
+        return metrics.start_http_server(port)
+    except OSError as e:
+        print(f"⚠️ Error starting metrics server on port {port}: {e}")
+        return None
+
+
+@st.cache_resource
+def _warm_up() -> threading.Thread:
+    """
+    v2: Jednorazowe przygotowanie w tle (raz na proces): rejestracja czcionki PDF, ładowanie PyMuPDF, Pillow
+    i numpy, import klienta OpenAI — pierwsze wyświetlenie strony nie czeka, a pierwsza karta nie płaci za importy.
+    """
+    def warm() -> None:
+        try:
+            from app.pdf.generator import _register_font
+            from app.pdf.preview import _load_fitz
+
+            _register_font()
+            _load_fitz()
+            import numpy  # noqa: F401  # st.image importuje numpy przy pierwszym podglądzie strony
+            from PIL import Image, ImageDraw, ImageOps  # noqa: F401  # ilustracje i st.image
+
+            Image.init()  # wtyczki formatów, ładowane przy pierwszym zapisie PNG
+            import openai  # noqa: F401
+        except Exception as e:  # tylko optymalizacja — błąd wyjdzie przy właściwym użyciu
+            print(f"⚠️ Error warming up: {e}")
+
+    thread = threading.Thread(target=warm, name="fm-warm-up", daemon=True)
+    thread.start()
+    return thread
+
+
+@st.cache_resource
+def _speculation_executor() -> ThreadPoolExecutor:
+    """v2: Wątki generowania spekulatywnego (wspólne dla sesji)."""
+    return ThreadPoolExecutor(max_workers=4, thread_name_prefix="fm-speculative")
+
+
+def _speculator() -> Speculator:
+    """v2: Spekulacja bieżącej sesji (tworzona przy pierwszym użyciu)."""
+    if "fm_speculator" not in st.session_state:
+        st.session_state["fm_speculator"] = Speculator(_speculation_executor())
+    return st.session_state["fm_speculator"]
+
+
+def _pipeline() -> WorksheetPipeline:
+    """v2: Pipeline karty dla bieżącej sesji (cache etapów sesji, wspólny magazyn PDF)."""
+    return WorksheetPipeline(
+        cache=_stage_cache(), store=_worksheet_store(), bank=default_bank(), templates=templates_enabled()
+    )
+
+
+def _request_task_regeneration(index: int) -> None:
+    """v2: Callback przycisku „🔄” przy zadaniu — podmiana wykonywana w najbliższym rerunie."""
+    st.session_state["fm_regen_index"] = index
 
 
 # --------------------------------------------------
@@ -77,6 +164,10 @@ st.markdown(
     unsafe_allow_html=True,
 )
 
+# v2: metryki procesu (Prometheus) — start serwera przy pierwszym uruchomieniu skryptu
+_metrics_server()
+_warm_up()
+
 # --------------------------------------------------
 # Panel boczny (lewa strona) – formularz
 # --------------------------------------------------
@@ -87,7 +178,17 @@ st.sidebar.write(
     "Zadania zostaną wygenerowane przez AI, a PDF będzie gotowy do pobrania."
 )
 
-with st.sidebar.form("worksheet_form"):
+# v2: tryb spekulatywny (opcjonalny) — zadania i layout generowane w tle, gdy parametry przestają się zmieniać.
+# Wymaga reakcji na każdą zmianę pola, więc formularz zastępuje zwykły kontener.
+service_url = os.getenv("FRIENDLY_MATH_SERVICE_URL")
+speculative = not service_url and st.sidebar.toggle(
+    "⚡ Przygotowuj zadania w tle",
+    value=os.getenv("FRIENDLY_MATH_SPECULATIVE", "").strip().lower() in ("1", "true", "yes", "tak"),
+    help="Zadania są generowane już podczas wyboru parametrów — karta pojawia się niemal od razu po kliknięciu. "
+    "Zmiana klasy, tematu lub profilu po rozpoczęciu generowania zużywa dodatkowe zapytanie API.",
+)
+
+with st.sidebar.container() if speculative else st.sidebar.form("worksheet_form"):
     grade = st.selectbox(
         "Klasa",
         options=["1", "2", "3", "4", "5", "6", "7", "8"],
@@ -143,7 +244,45 @@ with st.sidebar.form("worksheet_form"):
         help="Dodaje na końcu PDF stronę „Odpowiedzi” z wynikami (dla prostych działań typu a op b).",
     )
 
-    submitted = st.form_submit_button("🧠 Generuj kartę")
+    submitted = st.button("🧠 Generuj kartę") if speculative else st.form_submit_button("🧠 Generuj kartę")
+
+# v2: „Nowe zadania” — wymusza ponowne wygenerowanie zadań (pozostałe etapy z cache, jeśli się nie zmieniły)
+if st.sidebar.button(
+    "🔄 Nowe zadania",
+    disabled=not st.session_state.get("fm_request"),
+    help="Losuje nowy zestaw zadań dla tych samych parametrów.",
+):
+    st.session_state["fm_tasks_nonce"] = st.session_state.get("fm_tasks_nonce", 0) + 1
+
+# v2: profilowanie na życzenie (tylko tryb lokalny, przy włączonym FRIENDLY_MATH_TRACE) — cProfile/tracemalloc
+# dla kolejnego kliknięcia „Generuj kartę”; pliki zapisywane obok pliku śladów
+capture_mode = None
+if tracing.enabled() and not service_url:
+    with st.sidebar.expander("🔬 Diagnostyka"):
+        st.caption(f"Ślady etapów: `{tracing.trace_path()}`")
+        capture_mode = {"brak": None, "CPU": "cpu", "pamięć": "memory", "CPU + pamięć": "all"}[
+            st.selectbox("Profiluj generowanie", ("brak", "CPU", "pamięć", "CPU + pamięć"))
+        ]
+
+# v2: spekulacja dla bieżących parametrów (o ile to nie karta, która już jest na ekranie)
+if speculative and os.getenv("OPENAI_API_KEY"):
+    try:
+        draft = WorksheetSpec.from_dict({
+            "grade": grade,
+            "topic": topic,
+            "number_of_tasks": int(number_of_tasks),
+            "student_profile": student_profile,
+            "seed": st.session_state.get("fm_tasks_nonce", 0),
+        })
+    except ValueError:
+        draft = None
+    shown = st.session_state.get("fm_request")
+    if draft is not None and not (
+        shown
+        and Speculator.key(draft)
+        == Speculator.key(WorksheetSpec.from_dict({**shown, "seed": st.session_state.get("fm_tasks_nonce", 0)}))
+    ):
+        _speculator().update(draft, with_tasks=default_bank() is None and not templates_enabled())
 
 # --------------------------------------------------
 # Sekcja główna – tylko wyniki (zadania + PDF)
@@ -166,121 +305,111 @@ if submitted:
     # Prosta walidacja biznesowa
     if int(grade) <= 3 and number_of_tasks > 15:
         st.error("Dla klas 1–3 maksymalna liczba zadań to 15.")
+        st.session_state["fm_request"] = None
     else:
-        # request_payload = {
-        #     "grade": int(grade),
-        #     "topic": topic,
-        #     "number_of_tasks": number_of_tasks,
-        #     "student_profile": student_profile
-        # }
-        # st.success("✅ JSON request wygenerowany")
-        # st.json(request_payload)
-        # st.info(
-        #     "Ten JSON będzie w kolejnym kroku wysyłany do API "
-        #     "generującego zadania."
-        # )
-
-        st.subheader("📘 Wygenerowane zadania")
-
-        result = generate_tasks(
-            profile=student_profile,
-            grade=grade,
-            topic=topic,
-            n=number_of_tasks
-        )
-
-        if result.get("_error"):
-            st.warning(
-                "Generowanie zadań przez API nie powiodło się (timeout lub błąd sieci). "
-                "Poniżej zadania zastępcze — możesz wygenerować PDF."
-            )
-
-        # Lista zadań jako zwykły tekst
-        tasks = result["tasks"]
-        for i, task in enumerate(tasks, start=1):
-            st.write(f"{i}. {task}")
-
-        # ----------------------------------------------
-        # PDF v0: generowanie, zapis do pliku + download
-        # ----------------------------------------------
-        st.divider()
-        st.subheader("📄 Karta pracy PDF - podgląd")
-
-        # Metadane karty pracy
-        meta = WorksheetMeta(
-            title=f"Karta pracy – klasa {grade}",
-            grade=str(grade),
-            topic_range=topic,
-            student_profile=student_profile,
+        # v2: parametry ostatniego wysłania — kolejne reruny (np. pobranie PDF) odtwarzają wynik z cache
+        st.session_state["fm_request"] = {
+            "grade": grade,
+            "topic": topic,
+            "number_of_tasks": int(number_of_tasks),
+            "student_profile": student_profile,
+            "include_illustration": include_illustration,
+            "include_answers": include_answers,
+        }
+
+request = st.session_state.get("fm_request")
+if request:
+    # v2: cała orkiestracja w WorksheetPipeline (etapy współbieżne, cache etapów w sesji, raport czasów)
+    spec = WorksheetSpec.from_dict({**request, "seed": st.session_state.get("fm_tasks_nonce", 0)})
+    # v2: rerun bez zmian (pobranie PDF, przełącznik, rozwinięcie sekcji) — karta z sesji, bez pipeline
+    shown = st.session_state.get("fm_worksheet")
+    if not submitted and "fm_regen_index" not in st.session_state and shown and shown[0] == (spec, service_url):
+        worksheet = shown[1]
+    else:
+        with st.spinner("Generuję kartę pracy…"):
+            if service_url:
+                # v2: wspólna usługa generowania (python -m app.service) zamiast liczenia w wątku Streamlit
+                try:
+                    worksheet = ServiceClient(service_url).run(spec)
+                except Exception as e:
+                    st.error(f"Usługa generowania niedostępna ({e}).")
+                    st.stop()
+            else:
+                # v2: budżet czasu od wysłania formularza — strona odpowiada w ciągu FRIENDLY_MATH_SLO_S
+                deadline = Deadline.from_env()
+                pipeline = _pipeline()
+                profiling = tracing.capture(capture_mode) if submitted and capture_mode else nullcontext()
+                with profiling as profile:
+                    if submitted and speculative:
+                        # v2: wynik z tła, jeśli pasuje do wysłanych parametrów (czekamy najwyżej krótki ułamek
+                        # budżetu — wolna spekulacja nie może zabrać pipeline czasu na własne zapytania)
+                        _speculator().claim(spec, pipeline, timeout=claim_timeout(deadline))
+                    worksheet = pipeline.run(spec, deadline=deadline)
+                    # v2: podmiana jednego zadania — tylko to zadanie, jego ilustracja i odpowiedź liczone od nowa
+                    regen_index = st.session_state.pop("fm_regen_index", None)
+                    if regen_index is not None and regen_index < len(worksheet.tasks):
+                        worksheet = pipeline.regenerate_task(worksheet, regen_index, deadline=deadline)
+                if profile is not None:
+                    st.session_state["fm_capture_files"] = [str(p) for p in profile.paths]
+        st.session_state["fm_worksheet"] = ((spec, service_url), worksheet)
+    pdf_bytes = worksheet.pdf_bytes
+
+    st.subheader("📘 Wygenerowane zadania")
+
+    if worksheet.tasks_error:
+        st.warning(
+            "Generowanie zadań przez API nie powiodło się (timeout lub błąd sieci). "
+            "Poniżej zadania zastępcze — możesz wygenerować PDF."
         )
 
-        # Layout sterowany AI (Day 7) – font size, spacing, kolory
-        layout = None
-        try:
-            layout = generate_layout(
-                profile=student_profile,
-                grade=str(grade),
-                number_of_tasks=number_of_tasks,
+    # Lista zadań jako zwykły tekst; v2: przy każdym zadaniu przycisk podmiany (tryb lokalny)
+    can_regenerate = not os.getenv("FRIENDLY_MATH_SERVICE_URL")
+    for i, task in enumerate(worksheet.tasks, start=1):
+        if can_regenerate:
+            col_task, col_button = st.columns([12, 1])
+            col_task.write(f"{i}. {task}")
+            col_button.button(
+                "🔄",
+                key=f"fm_regen_{i}",
+                help="Zamień tylko to zadanie na nowe.",
+                on_click=_request_task_regeneration,
+                args=(i - 1,),
             )
-        except Exception as e:
-            st.warning(f"Layout AI niedostępny ({e}), używam domyślnego layoutu.")
-
-        # Ilustracja (Day 8/11): per zadanie dla low-stimuli, opcjonalnie jedna u góry dla standardowy/zdolny
-        image_bytes = None
-        task_images = None
-        low_stimuli_profiles = ["dyskalkulia", "ADHD", "trudności w nauce"]
-        if student_profile in low_stimuli_profiles:
-            try:
-                task_images = generate_worksheet_images_for_tasks(
-                    tasks=tasks, topic=topic, profile=student_profile
-                )
-            except Exception as e:
-                st.warning(f"Grafiki per zadanie niedostępne ({e}), PDF bez ilustracji przy zadaniach.")
-        elif include_illustration:
-            try:
-                image_bytes = generate_worksheet_image(topic=topic, profile=student_profile)
-            except Exception as e:
-                st.warning(f"Grafika niedostępna ({e}), PDF bez ilustracji.")
-
-        # Odpowiedzi do klucza (v1.0) – tylko dla prostych zadań
-        answers = compute_answers(tasks) if include_answers else None
-
-        # 1) Generowanie PDF (z layoutem, opcjonalnie image_bytes, task_images, answers)
-        pdf_bytes = build_worksheet_pdf_bytes(
-            meta=meta,
-            tasks=tasks,
-            layout=layout,
-            image_bytes=image_bytes,
-            task_images=task_images,
-            answers=answers,
-        )
-
-        # 2) Zapis do pliku (wariant A)
-        output_dir = ROOT_DIR / "data" / "out"
-        output_dir.mkdir(parents=True, exist_ok=True)
-        output_path = output_dir / "worksheet.pdf"
-
-        with open(output_path, "wb") as f:
-            f.write(pdf_bytes)
-
-        # st.caption(f"Plik zapisany w: **{output_path.relative_to(ROOT_DIR)}**")
-
-        # Podgląd PDF jako obrazy stron (działa w Chrome/Edge)
-        page_images = _pdf_bytes_to_images(pdf_bytes)
-        if page_images:
-            for i, img_io in enumerate(page_images, start=1):
-                st.image(img_io, caption=f"Strona {i}", width="stretch")
         else:
-            st.caption("Podgląd niedostępny — pobierz PDF i otwórz plik na swoim komputerze.")
+            st.write(f"{i}. {task}")
 
-        st.caption("Po pobraniu otwórz plik (np. dwuklik), aby zobaczyć lub wydrukować PDF.")
+    # ----------------------------------------------
+    # PDF v0: generowanie, zapis do pliku + download
+    # ----------------------------------------------
+    st.divider()
+    st.subheader("📄 Karta pracy PDF - podgląd")
+
+    for message in worksheet.warnings:
+        st.warning(message)
+
+    # Podgląd PDF jako obrazy stron (działa w Chrome/Edge). v2: najpierw miniatura strony 1,
+    # pozostałe strony w pełnej rozdzielczości dopisywane w miarę renderowania (cache po skrócie PDF)
+    previews = _preview_service()
+    pdf_key = worksheet.pdf_key or stable_hash(pdf_bytes)
+    page_slots = [st.empty() for _ in range(previews.page_count(pdf_bytes, pdf_key))]
+    for index, _dpi, png in previews.progressive(pdf_bytes, pdf_key):
+        page_slots[index].image(png, caption=f"Strona {index + 1}", width="stretch")
+    if not page_slots:
+        st.caption("Podgląd niedostępny — pobierz PDF i otwórz plik na swoim komputerze.")
+
+    st.caption("Po pobraniu otwórz plik (np. dwuklik), aby zobaczyć lub wydrukować PDF.")
+
+    st.download_button(
+        label="⬇️ Pobierz PDF",
+        data=pdf_bytes,
+        file_name="worksheet.pdf",
+        mime="application/pdf",
+    )
 
-        st.download_button(
-            label="⬇️ Pobierz PDF",
-            data=pdf_bytes,
-            file_name="worksheet.pdf",
-            mime="application/pdf",
-        )
+    with st.expander("⏱️ Czasy etapów"):
+        st.code(format_report(worksheet), language=None)
+        for path in st.session_state.get("fm_capture_files", []):
+            st.caption(f"Profil: `{path}`")
 
 # --------------------------------------------------
 # Stopka
@@ -0,0 +1,152 @@
+"""
+v2: Testy wsadu — kolejka wielu maszyn (dzierżawy, limit prób) i dziennik wsadu (pomijanie, wznawianie, ponawianie).
+Bez sieci i bez klucza API (atrapa LLM z app/bench/fake_llm.py).
+Uruchom: python -m pytest test_batch.py
+"""
+import json
+import os
+import time
+from types import SimpleNamespace
+
+import pytest
+
+from app.ai.client import set_client
+from app.batch.journal import BatchJournal
+from app.batch.runner import BatchItem, run_batch
+from app.batch.workqueue import WorkQueue
+from app.bench.fake_llm import FakeLLM
+
+
+class _OutageClient:
+    """Klient API, który zawsze zgłasza błąd połączenia (awaria API)."""
+
+    def __init__(self) -> None:
+        self.chat = SimpleNamespace(completions=SimpleNamespace(create=self._create))
+
+    def with_options(self, **_options) -> "_OutageClient":
+        return self
+
+    def _create(self, **_kwargs):
+        raise ConnectionError("API niedostępne")
+
+
+@pytest.fixture(autouse=True)
+def _plain_generation(monkeypatch):
+    """Zwykłe zapytania o zadania (bez banku, szablonów i function calling); klient przywracany po teście."""
+    for name in ("FRIENDLY_MATH_BANK", "FRIENDLY_MATH_TEMPLATES", "FRIENDLY_MATH_STRUCTURED"):
+        monkeypatch.delenv(name, raising=False)
+    yield
+    set_client(None)
+
+
+def _expire(queue: WorkQueue, item_id: str) -> None:
+    """Dzierżawa bez odnowienia dłużej niż lease_s."""
+    old = time.time() - queue.lease_s - 10
+    os.utime(queue.root / "leases" / f"{item_id}.json", (old, old))
+
+
+def _specs(path, count: int):
+    path.write_text(
+        "\n".join(json.dumps({"id": f"karta-{i}", "grade": "2", "topic": "dodawanie", "seed": i}) for i in range(count)),
+        encoding="utf-8",
+    )
+    return path
+
+
+def test_expired_lease_owner_finish_keeps_new_lease(tmp_path):
+    first = WorkQueue(tmp_path, lease_s=60)
+    second = WorkQueue(tmp_path, lease_s=60)
+    first.submit([BatchItem(1, "a", {"grade": "2", "topic": "dodawanie"})])
+
+    assert first.claim("host-1").item_id == "a"
+    first.checkpoint("a").put("tasks", {"tasks": ["Policz: 1 + 1 = ____"]})
+    _expire(first, "a")
+    assert second.reclaim_expired() == 1
+    assert second.claim("host-2").item_id == "a"
+
+    # Pierwszy właściciel kończy po wygaśnięciu: wpis zapisany, ale dzierżawa i etapy nowego właściciela zostają
+    assert not first.renew("a")
+    first.finish("a", {"id": "a", "line": 1, "status": "ok"})
+    lease = json.loads((tmp_path / "leases" / "a.json").read_text(encoding="utf-8"))
+    assert lease["owner"] == "host-2"
+    assert (tmp_path / "stages" / "a" / "tasks.json").exists()
+    assert second.renew("a")
+
+    second.finish("a", {"id": "a", "line": 1, "status": "ok"})
+    assert not (tmp_path / "leases" / "a.json").exists()
+    assert not (tmp_path / "stages" / "a").exists()
+    assert second.idle()
+    assert second.counts()["ok"] == 1
+
+
+def test_owner_finish_removes_reclaimed_unclaimed_card(tmp_path):
+    queue = WorkQueue(tmp_path, lease_s=60)
+    queue.submit([BatchItem(1, "a", {"grade": "2", "topic": "dodawanie"})])
+    queue.claim("host-1")
+    _expire(queue, "a")
+    assert queue.reclaim_expired() == 1
+
+    # Karta wróciła do pending/, ale nikt jej jeszcze nie przejął — wynik właściciela ją zamyka
+    queue.finish("a", {"id": "a", "line": 1, "status": "ok"})
+    assert queue.idle()
+    assert queue.claim("host-2") is None
+
+
+def test_max_attempts_moves_card_to_done_with_error(tmp_path):
+    queue = WorkQueue(tmp_path, lease_s=60, max_attempts=2)
+    queue.submit([BatchItem(1, "a", {"grade": "2", "topic": "dodawanie"})])
+
+    for attempt in range(2):
+        assert queue.claim(f"host-{attempt}") is not None
+        _expire(queue, "a")
+        queue.reclaim_expired()
+
+    assert queue.claim("host-9") is None
+    assert queue.idle()
+    [entry] = queue.entries()
+    assert entry["status"] == "error"
+    assert "2 razy" in entry["error"] and "host-1" in entry["error"]
+    assert queue.counts() == {"pending": 0, "leased": 0, "expired": 0, "ok": 0, "error": 1}
+
+
+def test_journal_retries_fallback_cards_then_skips(tmp_path):
+    specs = _specs(tmp_path / "specs.jsonl", 3)
+    journal = tmp_path / "journal.sqlite"
+
+    set_client(_OutageClient())
+    summary = run_batch(specs, tmp_path / "out", journal_path=journal, workers=2)
+    assert (summary.ok, summary.fallback, summary.skipped) == (3, 3, 0)
+
+    # Karty z zadaniami zastępczymi (tasks_error) nie są gotowe — kolejne uruchomienie je ponawia
+    llm = FakeLLM()
+    set_client(llm)
+    summary = run_batch(specs, tmp_path / "out", journal_path=journal, workers=2)
+    assert (summary.ok, summary.fallback, summary.skipped) == (3, 0, 0)
+    calls = llm.calls
+    assert calls > 0
+
+    summary = run_batch(specs, tmp_path / "out", journal_path=journal, workers=2)
+    assert (summary.total, summary.skipped) == (0, 3)
+    assert llm.calls == calls
+    manifest = [json.loads(line) for line in (tmp_path / "out" / "manifest.jsonl").read_text(encoding="utf-8").splitlines()]
+    assert [e["id"] for e in manifest] == ["karta-0", "karta-1", "karta-2"]
+    assert all(e["status"] == "ok" and not e["tasks_error"] for e in manifest)
+
+
+def test_journal_resumes_from_saved_stages(tmp_path):
+    specs = _specs(tmp_path / "specs.jsonl", 1)
+    journal_path = tmp_path / "journal.sqlite"
+    saved = ["Policz: 4 + 5 = ____", "Policz: 6 + 2 = ____"]
+
+    # Przerwane uruchomienie: zadania z API zapisane, karta nieukończona
+    with BatchJournal(journal_path) as journal:
+        done, stages = journal.begin("karta-0", 1, json.loads(specs.read_text(encoding="utf-8")))
+        assert (done, stages) == (None, 0)
+        journal.checkpoint("karta-0").put("tasks", {"tasks": saved, "profile": "standardowy", "grade": "2", "topic": "dodawanie"})
+
+    set_client(_OutageClient())  # wznowienie nie pyta API o zadania
+    summary = run_batch(specs, tmp_path / "out", journal_path=journal_path, workers=1)
+    assert (summary.ok, summary.resumed, summary.fallback) == (1, 1, 0)
+    with BatchJournal(journal_path) as journal:
+        assert journal.tasks("karta-0") == saved
+        assert journal.counts() == {"ok": 1}
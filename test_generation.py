@@ -0,0 +1,84 @@
+"""
+v2: Testy łączenia identycznych zapytań (single-flight) i szybkiej ścieżki PDF (zgodność z reportlab).
+Bez sieci i bez klucza API (atrapa LLM z app/bench/fake_llm.py).
+Uruchom: python -m pytest test_generation.py
+"""
+import threading
+
+import pytest
+
+from app.ai.client import set_client
+from app.ai.text_generator import generate_tasks
+from app.bench.fake_llm import FakeLLM
+from app.pdf.generator import WorksheetMeta, build_worksheet_pdf_bytes
+
+
+@pytest.fixture
+def slow_llm(monkeypatch):
+    """Atrapa LLM z opóźnieniem — równoczesne wywołania nakładają się w czasie."""
+    monkeypatch.delenv("FRIENDLY_MATH_STRUCTURED", raising=False)
+    llm = FakeLLM(latency=0.3)
+    set_client(llm)
+    yield llm
+    set_client(None)
+
+
+def _concurrent(*seeds):
+    results = [None] * len(seeds)
+
+    def _run(i: int, seed) -> None:
+        results[i] = generate_tasks("standardowy", "3", "dodawanie", n=4, seed=seed)
+
+    threads = [threading.Thread(target=_run, args=(i, seed)) for i, seed in enumerate(seeds)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    return results
+
+
+def test_singleflight_shares_same_seed(slow_llm):
+    first, second = _concurrent(7, 7)
+    assert slow_llm.calls == 1
+    assert first["tasks"] == second["tasks"]
+    assert first is not second and first["tasks"] is not second["tasks"]  # każdy dostaje własną kopię
+
+
+def test_singleflight_separates_seeds(slow_llm):
+    _concurrent(1, 2)
+    assert slow_llm.calls == 2
+
+
+_META = WorksheetMeta(title="Karta pracy", grade="3", topic_range="dodawanie i ułamki", student_profile="standardowy")
+_TASKS = [
+    "Policz: 12 + 7 = ____",
+    "Oblicz: 1/2 + 1/4 = ____",
+    "Zosia ma 3 jabłka i dostaje jeszcze 4. Ile jabłek ma teraz? Zapisz działanie i odpowiedź.",
+    "Porównaj: 3/5 ____ 2/5 (wpisz >, < lub =)",
+] * 4
+_ANSWERS = ["19", "3/4", "7", ">"] * 4
+
+
+def _pdf(monkeypatch, fast: bool) -> bytes:
+    monkeypatch.setenv("FRIENDLY_MATH_FAST_PDF", "1" if fast else "0")
+    return build_worksheet_pdf_bytes(_META, _TASKS, answers=_ANSWERS)
+
+
+def test_fast_pdf_matches_reportlab(monkeypatch):
+    fitz = pytest.importorskip("fitz")
+    np = pytest.importorskip("numpy")
+    fast, slow = _pdf(monkeypatch, True), _pdf(monkeypatch, False)
+    assert b"ReportLab" not in fast and b"ReportLab" in slow  # naprawdę dwie różne ścieżki
+
+    with fitz.open(stream=fast, filetype="pdf") as a, fitz.open(stream=slow, filetype="pdf") as b:
+        assert a.page_count == b.page_count >= 2  # karta + strona odpowiedzi
+        for page_a, page_b in zip(a, b):
+            assert page_a.get_text() == page_b.get_text()
+            img_a, img_b = (
+                np.frombuffer(p.get_pixmap(dpi=100).samples, dtype=np.uint8).astype(np.int16) for p in (page_a, page_b)
+            )
+            assert img_a.shape == img_b.shape
+            diff = np.abs(img_a - img_b)
+            # różnice tylko w wygładzaniu krawędzi glifów (podzbiór czcionki bez hintingu)
+            assert diff.max() <= 16
+            assert (diff > 0).mean() < 0.01
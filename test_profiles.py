@@ -1,6 +1,8 @@
 """
 Day 12: Test różnicowania profili - porównanie zadań dla różnych profili.
 Uruchom: python test_profiles.py
+v2: ocena zgodności z regułami profili na tysiącach zadań (atrapa, OpenAI lub nagrane odpowiedzi):
+python -m app.bench.compliance
 """
 import sys
 from pathlib import Path